@@ -1,213 +1,605 @@
 from flask import Flask, request, jsonify, send_file
 from flask_cors import CORS
-from PIL import Image, ImageFilter
 import io
-import base64
 import os
-import cv2
+import threading
+import time
 import numpy as np
 import json
+from datetime import datetime
+
+try:
+    from flask_sock import Sock
+except ImportError:  # WebSocket streaming is optional; /detect-faces works without it
+    Sock = None
+
+import attendance
+import detectors
+import face_tracker
+import frame_decode
+import image_codecs
+import image_filters
+import image_pipeline
+import listing
+import metrics
+import profiling
+import recognition
+import result_cache
+import startup
+import upload_guard
+import work_pool
+from face_store import FaceStore
 
 app = Flask(__name__)
-CORS(app)  # Enable CORS for all routes
-
-# Simple in-memory storage for face data (in production, use a proper database)
-face_database = {
-    'faces': [],  # List of known face encodings
-    'names': [],  # Corresponding names
-    'attendance': []  # Attendance records
-}
+CORS(app, expose_headers=image_codecs.METADATA_HEADERS)  # Enable CORS for all routes
+sock = Sock(app) if Sock is not None else None
+
+# Request body, image file and pixel limits, checked before anything is decoded
+upload_guard.configure(app)
+
+# Per-route and per-stage timings, in-flight and queue gauges, served at /metrics
+metrics.instrument(app)
+
+# Requests sent with X-Profile: <PROFILE_TOKEN> are stack-sampled; the slowest are kept at /profiles
+profiling.instrument(app)
+
+# Processed images, keyed by upload hash plus filter and codec parameters
+processed_cache = result_cache.from_environment()
+metrics.watch_cache(processed_cache)
+
+def _warm_models():
+    """Load the face detection and embedding models and run each once"""
+    recognition.warm_up()
+    detectors.warm_up()
+
+def _load_thread_models():
+    """Give each pool thread its own detector and embedder before it takes work"""
+    detectors.get_detector()
+    recognition.get_embedder()
+
+# Decoding, filtering, detection and embedding run here, off the request threads
+cpu_pool = work_pool.from_environment(initializer=_load_thread_models)
+metrics.watch_pool('cpu', cpu_pool)
+
+# Models, pool threads and codecs warm up on a background thread (started at
+# the end of this module) so the worker answers /healthz at once; / and
+# /readyz answer 503 until every step has finished
+warmup = startup.Warmup()
+startup.instrument(app, warmup)
+
+# Registered faces persist in FACE_STORE_DIR, shared by every worker on the machine
+FACE_STORE_DIR = os.environ.get('FACE_STORE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'face_data'))
+# Name and size come from the embedder's class; the model itself loads in the warm-up
+embedder_name, embedder_dim = recognition.embedder_spec()
+face_store = FaceStore(
+    FACE_STORE_DIR,
+    dim=embedder_dim,
+    embedder_name=embedder_name,
+    keep_crops=os.environ.get('FACE_STORE_CROPS', '1') == '1',
+    crop_quality=int(os.environ.get('FACE_STORE_CROP_QUALITY', 85))
+)
+
+# Descriptors of every registered face, matched in one batch per frame
+face_gallery = recognition.FaceGallery(face_store)
+
+# Webcam clients that send a session_id get face tracking across their frames
+face_trackers = face_tracker.TrackerSessions()
+
+# Attendance is recorded here from recognition results, at most once per person per window
+attendance_log = attendance.AttendanceLog(os.path.join(FACE_STORE_DIR, 'attendance.sqlite3'))
+
+# 'auto' records attendance only when the embedder tells people apart (not the HOG
+# fallback, see recognition.HogEmbedder); '1' records with any embedder, '0' never
+ATTENDANCE_AUTO = os.environ.get('ATTENDANCE_AUTO', 'auto')
+
+# An open WebSocket holds one server thread (gunicorn --threads 16) for as long as it
+# lasts; past this many, new sockets are turned away to HTTP so /readyz and the other
+# routes always have threads left
+MAX_WEBSOCKETS = int(os.environ.get('MAX_WEBSOCKETS', 12))
+websocket_slots = threading.BoundedSemaphore(MAX_WEBSOCKETS)
+
+# Fields clients can pick with ?fields= on the listing endpoints
+FACE_FIELDS = ('id', 'name', 'location', 'created_at')
+ATTENDANCE_FIELDS = ('id', 'name', 'confidence', 'timestamp')
 
 @app.route('/', methods=['GET'])
 def health_check():
-    return jsonify({"status": "healthy", "message": "Face Recognition API is running"})
+    if not warmup.is_ready():
+        return jsonify({"status": "starting", "message": "Face detection models are loading"}), 503
+    return jsonify({"status": "healthy", "message": "Face Recognition API is running", "websocket": sock is not None})
 
 @app.route('/process-image', methods=['POST'])
 def process_image():
     try:
+        # Refuse an oversized body from its Content-Length, before the form is parsed
+        upload_guard.check_request_size(request)
+
         # Get the uploaded file
-        if 'image' not in request.files:
+        if 'image' not in metrics.parse_form():
             return jsonify({"error": "No image file provided"}), 400
         
         file = request.files['image']
         if file.filename == '':
             return jsonify({"error": "No image file selected"}), 400
         
-        # Get processing type from form data
-        process_type = request.form.get('type', 'grayscale')
-        
-        # Open and process the image
-        image = Image.open(file.stream)
-        
-        # Apply processing based on type
-        if process_type == 'grayscale':
-            processed_image = image.convert('L')
-        elif process_type == 'blur':
-            processed_image = image.filter(ImageFilter.BLUR)
-        elif process_type == 'sharpen':
-            processed_image = image.filter(ImageFilter.SHARPEN)
-        elif process_type == 'edge':
-            processed_image = image.filter(ImageFilter.FIND_EDGES)
-        else:
-            processed_image = image.convert('L')  # Default to grayscale
-        
-        # Convert processed image to base64
-        img_buffer = io.BytesIO()
-        processed_image.save(img_buffer, format='PNG')
-        img_buffer.seek(0)
-        
-        # Encode to base64
-        img_base64 = base64.b64encode(img_buffer.getvalue()).decode('utf-8')
-        
-        return jsonify({
-            "success": True,
-            "processed_image": f"data:image/png;base64,{img_base64}",
-            "process_type": process_type
-        })
+        # Filter chain, codec choice and result caching are shared with serve_app.py
+        return image_pipeline.process_request(request, processed_cache, cpu_pool)
         
+    except upload_guard.ERRORS as e:
+        return upload_guard.rejected_response(e)
+    except work_pool.PoolFull as e:
+        return work_pool.busy_response(e)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/process-batch', methods=['POST'])
+def process_batch():
+    try:
+        # Several 'images' files and/or one 'archive' zip, all run through the same 'type' chain
+        if 'images' not in metrics.parse_form() and 'archive' not in request.files:
+            return jsonify({"error": "No image files provided"}), 400
+
+        return image_pipeline.process_batch(request, processed_cache, cpu_pool)
+
+    except upload_guard.ERRORS as e:
+        return upload_guard.rejected_response(e)
+    except work_pool.PoolFull as e:
+        return work_pool.busy_response(e)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+@app.route('/cache-stats', methods=['GET'])
+def cache_stats():
+    return jsonify({"success": True, "cache": processed_cache.stats(), "work_pool": cpu_pool.stats()})
+
+@app.route('/filters', methods=['GET'])
+def list_filters():
+    return jsonify({
+        "success": True,
+        "filters": [spec.describe() for spec in image_filters.FILTERS.values()]
+    })
+
+def _elapsed_ms(start):
+    return round((time.perf_counter() - start) * 1000, 2)
+
+def _decode_frame(image_data, preset, timings, color=False):
+    """Decode an upload no larger than the preset's working resolution needs; None if undecodable"""
+    start = time.perf_counter()
+    frame = frame_decode.decode(image_data, detectors.DETECTION_PRESETS[preset]['max_side'], color)
+    timings['decode_ms'] = _elapsed_ms(start)
+    if frame is not None:
+        timings['decode_reduction'] = frame.reduction
+        profiling.annotate(width=frame.width, height=frame.height, preset=preset,
+                           upload_bytes=len(image_data), decode_reduction=frame.reduction)
+    return frame
+
+def _find_faces(image_data, preset, timings, color=False):
+    """Decode an upload and detect faces in it; returns (frame, faces in decoded coordinates)"""
+    frame = _decode_frame(image_data, preset, timings, color)
+    if frame is None:
+        return None, []
+
+    # Run this pool thread's preloaded face detection model at the preset's working resolution
+    return frame, detectors.detect(frame.gray, preset, timings=timings)
+
+def _match_boxes(gray, boxes):
+    """Embed every box and match them all against the gallery at once"""
+    embeddings = recognition.get_embedder().embed(gray, boxes)
+    return face_gallery.match(embeddings, recognition.get_match_threshold(), recognition.get_match_margin())
+
+def _recognize_faces(image_data, preset, timings):
+    """CPU-bound part of /detect-faces, run on the work pool; boxes come back in original coordinates"""
+    frame, faces = _find_faces(image_data, preset, timings)
+    if frame is None:
+        return None, [], []
+
+    matches = []
+    if len(faces) > 0:
+        start = time.perf_counter()
+        matches = _match_boxes(frame.gray, faces)
+        timings['embed_ms'] = _elapsed_ms(start)
+    return frame, frame.to_original(faces), matches
+
+def _track_faces(tracker, image_data, preset, timings):
+    """/detect-faces for a tracked session: returns (frame, ran_full_detection, tracks)
+
+    Track boxes stay in decoded coordinates; a camera's frames all decode at the same size.
+    """
+    frame = _decode_frame(image_data, preset, timings)
+    if frame is None:
+        return None, False, []
+
+    full_detection, tracks = tracker.update(frame.gray, _match_boxes, preset, timings)
+    return frame, full_detection, tracks
+
+def _recognize_frame(image_data, tracker=None, preset=detectors.DEFAULT_PRESET):
+    """Detection result body for one frame, tracked when a tracker is given; None if undecodable"""
+    timings = {}
+    start = time.perf_counter()
+    if tracker is None:
+        frame, faces, matches = cpu_pool.run(_recognize_faces, image_data, preset, timings)
+        if frame is None:
+            return None
+        result = _detection_result(frame.width, frame.height, faces, matches)
+    else:
+        frame, full_detection, tracks = cpu_pool.run(_track_faces, tracker, image_data, preset, timings)
+        if frame is None:
+            return None
+        result = _detection_result(frame.width, frame.height,
+                                   frame.to_original([track.box for track in tracks]),
+                                   [(track.name, track.similarity) for track in tracks],
+                                   ids=[track.id for track in tracks])
+        result['tracking'] = {"frame": tracker.frame, "full_detection": full_detection}
+
+    record = _records_attendance()
+    for face in result['faces']:
+        face['attendance_recorded'] = record and face['is_known'] and attendance_log.record(face['name'],
+                                                                                          face['confidence'])
+
+    # Stage times in ms; total includes waiting for a pool thread
+    timings['total_ms'] = _elapsed_ms(start)
+    metrics.observe_timings(timings)
+    profiling.annotate(faces=len(result['faces']), timings=timings)
+    result['preset'] = preset
+    result['timings'] = timings
+    return result
+
+def _records_attendance():
+    """Whether recognised faces are recorded as attendance with the configured embedder"""
+    if ATTENDANCE_AUTO == 'auto':
+        return recognition.get_embedder_class().discriminative
+    return ATTENDANCE_AUTO == '1'
+
+def _embed_faces(image_data, preset, group=False):
+    """CPU-bound part of /register-face, run on the work pool
+
+    Returns (frame, faces in original coordinates, embeddings, colour crops),
+    faces sorted left to right. Embeddings and crops are empty unless exactly
+    one face was found, or any number in group mode; all faces are embedded
+    in one batch.
+    """
+    timings = {}
+    frame, faces = _find_faces(image_data, preset, timings, color=face_store.keep_crops)
+    if frame is None:
+        return None, [], [], []
+
+    faces = faces[np.argsort(faces[:, 0], kind='stable')]
+    embeddings, crops = [], []
+    if len(faces) == 1 or (group and len(faces) > 0):
+        start = time.perf_counter()
+        embeddings = recognition.get_embedder().embed(frame.gray, faces)
+        timings['embed_ms'] = _elapsed_ms(start)
+        crops = [frame.color[y:y+h, x:x+w] if frame.color is not None else None
+                 for x, y, w, h in faces]
+    metrics.observe_timings(timings)
+    return frame, frame.to_original(faces), embeddings, crops
+
+def _location(box):
+    x, y, w, h = (int(v) for v in box)
+    return {'top': y, 'right': x + w, 'bottom': y + h, 'left': x}
+
+def _detection_result(width, height, faces, matches, ids=None):
+    """/detect-faces response body for one frame of the given original size; ids default to 1..n"""
+    if ids is None:
+        ids = range(1, len(faces) + 1)
+    faces_data = []
+    for face_id, (x, y, w, h), (name, similarity) in zip(ids, faces, matches):
+        faces_data.append({
+            'id': int(face_id),
+            'location': _location((x, y, w, h)),
+            'name': name if name is not None else "Unknown",
+            'confidence': round(min(max(similarity, 0.0), 1.0), 4),
+            'is_known': name is not None
+        })
+
+    return {
+        "success": True,
+        "faces_detected": len(faces_data),
+        "faces": faces_data,
+        "image_size": {
+            "width": width,
+            "height": height
+        }
+    }
+
 @app.route('/detect-faces', methods=['POST'])
 def detect_faces():
     try:
+        # Refuse an oversized body from its Content-Length, before the form is parsed
+        upload_guard.check_request_size(request)
+
         # Get the uploaded file
-        if 'image' not in request.files:
+        if 'image' not in metrics.parse_form():
             return jsonify({"error": "No image file provided"}), 400
 
         file = request.files['image']
         if file.filename == '':
             return jsonify({"error": "No image file selected"}), 400
 
-        # Read image data
-        image_data = file.read()
+        # Speed/accuracy trade-off for this request (see detectors.DETECTION_PRESETS)
+        preset = request.form.get('preset', detectors.DEFAULT_PRESET)
+        if preset not in detectors.DETECTION_PRESETS:
+            return jsonify({"error": f"Unknown detection preset: {preset}"}), 400
 
-        # Convert to numpy array
-        nparr = np.frombuffer(image_data, np.uint8)
-        image = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+        # Read image data, up to the upload byte limit
+        image_data = upload_guard.read_upload(file)
 
-        if image is None:
-            return jsonify({"error": "Invalid image format"}), 400
+        # Webcam clients name a session so face ids and identities carry across frames
+        session_id = request.form.get('session_id', '').strip()
+        tracker = face_trackers.get(session_id) if session_id else None
 
-        # Load OpenCV face detection model
-        face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
-
-        # Convert to grayscale for face detection
-        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-
-        # Detect faces
-        faces = face_cascade.detectMultiScale(gray, 1.1, 4)
-
-        # Prepare response data
-        faces_data = []
-        for i, (x, y, w, h) in enumerate(faces):
-            # For simplicity, all faces are "Unknown" since we don't have face recognition
-            # In a real implementation, you would extract features and compare with database
-
-            faces_data.append({
-                'id': i + 1,
-                'location': {
-                    'top': int(y),
-                    'right': int(x + w),
-                    'bottom': int(y + h),
-                    'left': int(x)
-                },
-                'name': "Unknown",
-                'confidence': 0.8,  # Dummy confidence for detection
-                'is_known': False
-            })
+        # Decode, detect, embed and match on the work pool
+        result = _recognize_frame(image_data, tracker, preset)
 
-        return jsonify({
-            "success": True,
-            "faces_detected": len(faces_data),
-            "faces": faces_data,
-            "image_size": {
-                "width": image.shape[1],
-                "height": image.shape[0]
-            }
-        })
+        if result is None:
+            return jsonify({"error": "Invalid image format"}), 400
+
+        with metrics.stage('serialize'):
+            return jsonify(result)
 
+    except upload_guard.ERRORS as e:
+        return upload_guard.rejected_response(e)
+    except work_pool.PoolFull as e:
+        return work_pool.busy_response(e)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+def detect_faces_stream(ws):
+    """WebSocket /ws/detect-faces: binary JPEG frames in, one JSON detection result out per processed frame
+
+    Frames that arrive while one is being processed queue up in the socket;
+    only the newest is processed and the rest are dropped (latest frame wins),
+    so a slow server lowers the frame rate instead of building up lag.
+    The detection preset comes from the ?preset= query parameter. Beyond
+    MAX_WEBSOCKETS open sockets, a new one gets a single error message with
+    reason 'too_many_connections' and is closed; the client then posts to
+    /detect-faces instead.
+    """
+    if not websocket_slots.acquire(blocking=False):
+        ws.send(json.dumps({"success": False, "reason": "too_many_connections",
+                            "error": f"Server has {MAX_WEBSOCKETS} live streams; use POST /detect-faces"}))
+        return
+    try:
+        _stream_frames(ws)
+    finally:
+        websocket_slots.release()
+
+def _stream_frames(ws):
+    received = 0
+    dropped = 0
+    tracker = face_tracker.FaceTracker()  # one tracking session per connection
+    preset = request.args.get('preset', detectors.DEFAULT_PRESET)
+    if preset not in detectors.DETECTION_PRESETS:
+        ws.send(json.dumps({"success": False, "error": f"Unknown detection preset: {preset}"}))
+        return
+    while True:
+        frame = ws.receive()
+        if frame is None:
+            break
+        received += 1
+
+        # Skip to the newest frame already waiting
+        while True:
+            newer = ws.receive(timeout=0)
+            if newer is None:
+                break
+            frame = newer
+            received += 1
+            dropped += 1
+
+        if isinstance(frame, str):
+            continue  # the protocol only defines binary frames
+
+        start = time.perf_counter()
+        try:
+            result = _recognize_frame(frame, tracker, preset)
+            if result is None:
+                result = {"success": False, "error": "Invalid image format"}
+        except upload_guard.UploadRejected as e:
+            result = {"success": False, "error": str(e), "reason": e.reason}
+        except work_pool.PoolFull as e:
+            result = {"success": False, "error": str(e), "retry_after": e.retry_after}
+        except Exception as e:
+            result = {"success": False, "error": str(e)}
+
+        result.update(frames_received=received, frames_dropped=dropped,
+                      processing_ms=round((time.perf_counter() - start) * 1000, 2))
+        ws.send(json.dumps(result))
+
+if sock is not None:
+    sock.route('/ws/detect-faces')(detect_faces_stream)
+
 @app.route('/register-face', methods=['POST'])
 def register_face():
     try:
+        # Refuse an oversized body from its Content-Length, before the form is parsed
+        upload_guard.check_request_size(request)
+
         # Get the uploaded file and name
-        if 'image' not in request.files:
+        if 'image' not in metrics.parse_form():
             return jsonify({"error": "No image file provided"}), 400
 
         file = request.files['image']
         name = request.form.get('name', '').strip()
 
+        # Group mode registers every face in one photo: 'names' lists them left to right
+        group = request.form.get('group', '').lower() in ('1', 'true')
+        names = [n.strip() for n in request.form.get('names', '').split(',')]
+
         if file.filename == '':
             return jsonify({"error": "No image file selected"}), 400
 
-        if not name:
-            return jsonify({"error": "Name is required"}), 400
-
-        # Read image data
-        image_data = file.read()
+        if group and not any(names):
+            return jsonify({"error": "Names are required in group mode"}), 400
 
-        # Convert to numpy array
-        nparr = np.frombuffer(image_data, np.uint8)
-        image = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+        if not group and not name:
+            return jsonify({"error": "Name is required"}), 400
 
-        if image is None:
-            return jsonify({"error": "Invalid image format"}), 400
+        preset = request.form.get('preset', detectors.DEFAULT_PRESET)
+        if preset not in detectors.DETECTION_PRESETS:
+            return jsonify({"error": f"Unknown detection preset: {preset}"}), 400
 
-        # Load OpenCV face detection model
-        face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
+        # Read image data, up to the upload byte limit
+        image_data = upload_guard.read_upload(file)
 
-        # Convert to grayscale for face detection
-        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        # Decode, detect and embed on the work pool
+        frame, faces, embeddings, crops = cpu_pool.run(_embed_faces, image_data, preset, group)
 
-        # Detect faces
-        faces = face_cascade.detectMultiScale(gray, 1.1, 4)
+        if frame is None:
+            return jsonify({"error": "Invalid image format"}), 400
 
         if len(faces) == 0:
             return jsonify({"error": "No face found in the image"}), 400
 
+        if group:
+            return _register_group(names, faces, embeddings, crops)
+
         if len(faces) > 1:
             return jsonify({"error": "Multiple faces found. Please use an image with only one face"}), 400
 
-        # For simplicity, just store the name (in real app, you'd store face features)
-        # Extract face region for future comparison (simplified approach)
+        # Store a fixed-length descriptor of the face for matching in /detect-faces
         x, y, w, h = faces[0]
-        face_region = image[y:y+h, x:x+w]
-
-        # Store face data (simplified - in production use proper face encoding)
-        face_database['faces'].append({
-            'region': face_region.tolist(),  # Convert to list for JSON serialization
-            'location': {'x': int(x), 'y': int(y), 'w': int(w), 'h': int(h)}
-        })
-        face_database['names'].append(name)
+        face_id = face_gallery.add(
+            name, embeddings[0],
+            location={'x': int(x), 'y': int(y), 'w': int(w), 'h': int(h)},
+            crop=crops[0]
+        )
 
         return jsonify({
             "success": True,
             "message": f"Face registered successfully for {name}",
-            "total_registered": len(face_database['faces'])
+            "face_id": face_id,
+            "total_registered": len(face_gallery)
         })
 
+    except upload_guard.ERRORS as e:
+        return upload_guard.rejected_response(e)
+    except work_pool.PoolFull as e:
+        return work_pool.busy_response(e)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+def _register_group(names, faces, embeddings, crops):
+    """Register each named face of a group photo in one store transaction; empty names skip a face"""
+    if len(names) != len(faces):
+        return jsonify({
+            "error": f"Found {len(faces)} faces but {len(names)} names; list one name per face, left to right",
+            "faces": [_location(box) for box in faces]
+        }), 400
+
+    entries = [(name, embedding, {'x': int(x), 'y': int(y), 'w': int(w), 'h': int(h)}, crop)
+               for name, embedding, (x, y, w, h), crop in zip(names, embeddings, faces, crops) if name]
+    face_ids = iter(face_gallery.add_many(entries))
+
+    registered = []
+    for name, box in zip(names, faces):
+        registered.append({
+            'name': name or None,
+            'face_id': next(face_ids) if name else None,
+            'location': _location(box)
+        })
+
+    return jsonify({
+        "success": True,
+        "message": f"Registered {len(entries)} of {len(faces)} faces",
+        "faces": registered,
+        "total_registered": len(face_gallery)
+    })
+
 @app.route('/attendance', methods=['GET'])
 def get_attendance():
+    # from/to are dates or ISO timestamps; a bare 'to' date includes that whole day
+    start = request.args.get('from', '').strip() or None
+    end = request.args.get('to', '').strip() or None
+    try:
+        for value in (start, end):
+            if value:
+                datetime.fromisoformat(value)
+    except ValueError:
+        return jsonify({"error": "from/to must be dates (YYYY-MM-DD) or ISO timestamps"}), 400
+    end = attendance.end_of_day(end)
+
+    name = request.args.get('name', '').strip() or None
+
+    # Newest first, paged by ?cursor= (from next_cursor); ?offset= is still accepted without one
+    try:
+        fields = listing.parse_fields(request.args.get('fields'), ATTENDANCE_FIELDS)
+        before = listing.decode_cursor(request.args['cursor'], (str, int)) if request.args.get('cursor') else None
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if listing.wants_ndjson(request):
+        return listing.stream(request, attendance_log.iter_records(start, end, name, before), fields)
+
+    limit = listing.page_size(request, default=50)
+    offset = request.args.get('offset', default=0, type=int)
+    if before is None and offset:
+        records, total = attendance_log.query(start, end, name, limit, offset)
+        next_cursor = listing.encode_cursor([records[-1]['timestamp'], records[-1]['id']]) \
+            if records and offset + len(records) < total else None
+    else:
+        records, next_cursor = listing.paginate(attendance_log.iter_records(start, end, name, before, chunk=limit + 1),
+                                                limit, lambda record: [record['timestamp'], record['id']])
+        total = attendance_log.count(start, end, name)
     return jsonify({
         "success": True,
-        "attendance": face_database['attendance'],
-        "total_records": len(face_database['attendance'])
+        "attendance": [listing.project(record, fields) for record in records],
+        "total_records": total,
+        "limit": limit,
+        "offset": offset,
+        "next_cursor": next_cursor
     })
 
 @app.route('/registered-faces', methods=['GET'])
 def get_registered_faces():
+    # In registration order, paged by ?cursor= (from next_cursor)
+    try:
+        fields = listing.parse_fields(request.args.get('fields'), FACE_FIELDS)
+        after_id = listing.decode_cursor(request.args['cursor'], int) if request.args.get('cursor') else -1
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if listing.wants_ndjson(request):
+        return listing.stream(request, face_store.iter_faces(after_id), fields)
+
+    limit = listing.page_size(request)
+    faces, next_cursor = listing.paginate(face_store.iter_faces(after_id, chunk=limit + 1),
+                                          limit, lambda face: face['id'])
     return jsonify({
         "success": True,
-        "registered_faces": face_database['names'],
-        "total_registered": len(face_database['faces'])
+        "registered_faces": [face['name'] for face in faces],
+        "faces": [listing.project(face, fields) for face in faces],
+        "total_registered": face_store.count(),
+        "next_cursor": next_cursor
     })
 
+@app.route('/registered-faces/<int:face_id>/crop', methods=['GET'])
+def get_registered_face_crop(face_id):
+    crop = face_store.get_crop(face_id)
+    if crop is None:
+        return jsonify({"error": "No stored crop for this face"}), 404
+    return send_file(io.BytesIO(crop), mimetype='image/jpeg')
+
+@app.route('/registered-faces/<name>', methods=['DELETE'])
+def delete_registered_face(name):
+    removed = face_gallery.remove_name(name)
+    if not removed:
+        return jsonify({"error": f"No registered face found for {name}"}), 404
+
+    return jsonify({
+        "success": True,
+        "message": f"Removed {len(removed)} registered face(s) for {name}",
+        "total_registered": len(face_gallery)
+    })
+
+def _warm_pipelines():
+    """One small image through every codec and through face detection, so no request pays first-use costs"""
+    image_pipeline.warm_up(cpu_pool)
+    cpu_pool.run(_find_faces, image_pipeline.sample_upload(), detectors.DEFAULT_PRESET, {})
+
+warmup.step('models', _warm_models)
+warmup.step('work_pool', cpu_pool.prestart)
+warmup.step('pipelines', _warm_pipelines)
+warmup.start()
+
 if __name__ == '__main__':
     # Production configuration
     port = int(os.environ.get('PORT', 5000))
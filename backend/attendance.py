@@ -0,0 +1,219 @@
+"""
+Server-side attendance log
+Recognition results are checked against a per-name last-seen window in
+memory (one dict lookup per face) and accepted records are appended to
+SQLite by a background thread in batches, so a webcam frame never waits on
+a disk write. Every worker shares the SQLite file, so a name that passes
+the in-memory check is also looked up there (one index probe per person per
+window), and the writer checks again inside its write transaction, which
+SQLite serialises across processes. Queries filter by time range and name
+through indexes, so they stay fast as the log grows into millions of rows.
+"""
+import atexit
+import os
+import queue
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS attendance (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    confidence REAL NOT NULL,
+    recorded_at TEXT NOT NULL        -- local ISO timestamp, sorts as text
+);
+CREATE INDEX IF NOT EXISTS attendance_recorded_at ON attendance(recorded_at);
+CREATE INDEX IF NOT EXISTS attendance_name_recorded_at ON attendance(name, recorded_at);
+"""
+
+# Seconds during which a second sighting of the same person is not recorded again
+WINDOW_SECONDS = float(os.environ.get('ATTENDANCE_WINDOW', 300))
+MIN_CONFIDENCE = float(os.environ.get('ATTENDANCE_MIN_CONFIDENCE', 0.7))
+FLUSH_SECONDS = float(os.environ.get('ATTENDANCE_FLUSH_SECONDS', 1.0))
+BATCH_SIZE = 500
+MAX_PAGE_SIZE = 1000
+
+
+class AttendanceLog:
+    """Deduplicated attendance records, written to SQLite in the background"""
+
+    def __init__(self, path, window_seconds=WINDOW_SECONDS, min_confidence=MIN_CONFIDENCE,
+                 flush_seconds=FLUSH_SECONDS):
+        self.path = path
+        self.window_seconds = window_seconds
+        self.min_confidence = min_confidence
+        self.flush_seconds = flush_seconds
+        self._lock = threading.Lock()
+        self._last_seen = {}  # name -> unix time of the last recorded sighting
+        self._pending = queue.Queue()
+        self._stopped = threading.Event()
+
+        # Readers use their own connection; the writer thread opens another
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.executescript(SCHEMA)
+        self._db_lock = threading.Lock()
+        self._seed_window()
+
+        self._writer = threading.Thread(target=self._write_loop, name='attendance-writer', daemon=True)
+        self._writer.start()
+        atexit.register(self.close)
+
+    def _seed_window(self):
+        """Reload last-seen times still inside the window, so a restart does not double-record"""
+        since = datetime.now() - timedelta(seconds=self.window_seconds)
+        rows = self._db.execute('SELECT name, MAX(recorded_at) FROM attendance '
+                                'WHERE recorded_at >= ? GROUP BY name', (since.isoformat(),))
+        for name, recorded_at in rows:
+            self._last_seen[name] = datetime.fromisoformat(recorded_at).timestamp()
+
+    def _last_recorded(self, db, name):
+        """Unix time of the newest record for name in the table, from any worker, or None"""
+        recorded_at = db.execute('SELECT MAX(recorded_at) FROM attendance WHERE name = ?', (name,)).fetchone()[0]
+        return datetime.fromisoformat(recorded_at).timestamp() if recorded_at else None
+
+    def _within_window(self, last, now):
+        return last is not None and now - last < self.window_seconds
+
+    def record(self, name, confidence, when=None):
+        """Queue a record unless the person was recorded within the window; returns True if queued"""
+        if name is None or confidence < self.min_confidence:
+            return False
+        now = time.time() if when is None else when
+        with self._lock:
+            if self._within_window(self._last_seen.get(name), now):
+                return False
+
+        # Another worker may have recorded this person since this one last did
+        with self._db_lock:
+            recorded = self._last_recorded(self._db, name)
+        with self._lock:
+            last = self._last_seen.get(name)
+            if recorded is not None and (last is None or recorded > last):
+                last = recorded
+            if self._within_window(last, now):
+                self._last_seen[name] = last
+                return False
+            self._last_seen[name] = now
+        self._pending.put((name, float(confidence), datetime.fromtimestamp(now).isoformat()))
+        return True
+
+    def _unrecorded(self, db, batch):
+        """Records of batch no worker has written within the window; caller holds the write transaction"""
+        if self.window_seconds <= 0:
+            return batch
+        last_seen, accepted = {}, []
+        for record in batch:
+            name, when = record[0], datetime.fromisoformat(record[2]).timestamp()
+            last = last_seen[name] if name in last_seen else self._last_recorded(db, name)
+            if not self._within_window(last, when):
+                accepted.append(record)
+                last = when
+            last_seen[name] = last
+        return accepted
+
+    def _write_loop(self):
+        db = sqlite3.connect(self.path, isolation_level=None)
+        while not self._stopped.is_set() or not self._pending.empty():
+            try:
+                batch = [self._pending.get(timeout=self.flush_seconds)]
+            except queue.Empty:
+                continue
+            # Give other sightings a moment to join this transaction
+            deadline = time.monotonic() + self.flush_seconds
+            while len(batch) < BATCH_SIZE:
+                try:
+                    batch.append(self._pending.get(timeout=max(0.0, deadline - time.monotonic())))
+                except queue.Empty:
+                    break
+            try:
+                db.execute('BEGIN IMMEDIATE')
+                # Two workers can both queue a person in the moment before either has written
+                db.executemany('INSERT INTO attendance (name, confidence, recorded_at) VALUES (?, ?, ?)',
+                               self._unrecorded(db, batch))
+                db.execute('COMMIT')
+            except sqlite3.Error as e:
+                if db.in_transaction:
+                    db.execute('ROLLBACK')
+                print(f"⚠️ Could not write {len(batch)} attendance records: {e}")
+            finally:
+                for _ in batch:
+                    self._pending.task_done()
+        db.close()
+
+    def flush(self):
+        """Block until every queued record is on disk"""
+        self._pending.join()
+
+    def close(self):
+        self._stopped.set()
+        self._writer.join(timeout=5)
+
+    @staticmethod
+    def _filters(start, end, name):
+        clauses, params = [], []
+        if start:
+            clauses.append('recorded_at >= ?')
+            params.append(start)
+        if end:
+            clauses.append('recorded_at < ?')
+            params.append(end)
+        if name:
+            clauses.append('name = ?')
+            params.append(name)
+        return (' WHERE ' + ' AND '.join(clauses)) if clauses else '', params
+
+    def query(self, start=None, end=None, name=None, limit=50, offset=0):
+        """Newest-first records in [start, end) for an optional name; returns (rows, total)
+
+        start and end are ISO timestamps or dates ('2025-07-03' covers from midnight).
+        """
+        where, params = self._filters(start, end, name)
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+        with self._db_lock:
+            total = self._db.execute('SELECT COUNT(*) FROM attendance' + where, params).fetchone()[0]
+            rows = self._db.execute(
+                'SELECT id, name, confidence, recorded_at FROM attendance' + where +
+                ' ORDER BY recorded_at DESC, id DESC LIMIT ? OFFSET ?', params + [limit, max(0, offset)]
+            ).fetchall()
+        return [_record(row) for row in rows], total
+
+    def count(self, start=None, end=None, name=None):
+        where, params = self._filters(start, end, name)
+        with self._db_lock:
+            return self._db.execute('SELECT COUNT(*) FROM attendance' + where, params).fetchone()[0]
+
+    def iter_records(self, start=None, end=None, name=None, before=None, chunk=1000):
+        """Newest-first records in [start, end), older than the (timestamp, id) key `before`
+
+        Reads chunk rows per query, continuing from the last row's key instead
+        of an offset, so every chunk is one index range scan however far in.
+        """
+        where, params = self._filters(start, end, name)
+        while True:
+            clause, args = where, list(params)
+            if before is not None:
+                clause += (' AND ' if clause else ' WHERE ') + '(recorded_at, id) < (?, ?)'
+                args += [before[0], before[1]]
+            with self._db_lock:
+                rows = self._db.execute(
+                    'SELECT id, name, confidence, recorded_at FROM attendance' + clause +
+                    ' ORDER BY recorded_at DESC, id DESC LIMIT ?', args + [chunk]).fetchall()
+            for row in rows:
+                yield _record(row)
+            if len(rows) < chunk:
+                return
+            before = (rows[-1][3], rows[-1][0])
+
+
+def _record(row):
+    return {'id': row[0], 'name': row[1], 'confidence': round(row[2], 4), 'timestamp': row[3]}
+
+
+def end_of_day(value):
+    """Exclusive upper bound for an 'until' filter: a bare date includes that whole day"""
+    if value and len(value) == 10:
+        return (datetime.fromisoformat(value) + timedelta(days=1)).date().isoformat()
+    return value
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Benchmark for the face gallery indexes
+Reports recall@1 (against exact search) and p50/p99 single-face query latency
+for the brute-force and IVF indexes at several gallery sizes, and how long a
+worker takes to open the persisted IVF lists over a memory-mapped file
+"""
+
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from gallery_index import IVF_NPROBE, BruteForceIndex, IVFIndex, MappedIVFIndex
+
+DIM = 128
+
+
+def make_gallery(size, rng):
+    """Random unit-length descriptors, one per registered face"""
+    vectors = rng.standard_normal((size, DIM)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def make_queries(gallery, count, noise, rng):
+    """Re-sightings of registered faces: gallery rows plus noise, re-normalized"""
+    picks = rng.choice(len(gallery), count, replace=False)
+    queries = gallery[picks] + noise * rng.standard_normal((count, DIM)).astype(np.float32) / np.sqrt(DIM)
+    return queries / np.linalg.norm(queries, axis=1, keepdims=True)
+
+
+def time_queries(index, queries):
+    """Search one query at a time, as /detect-faces does for a single face"""
+    ids = np.empty(len(queries), dtype=np.int64)
+    latencies = np.empty(len(queries))
+    for i in range(len(queries)):
+        start = time.perf_counter()
+        found, _ = index.search(queries[i:i + 1])
+        latencies[i] = time.perf_counter() - start
+        ids[i] = found[0]
+    return ids, latencies
+
+
+def report(label, latencies, recall=None):
+    p50, p99 = np.percentile(latencies * 1000, [50, 99])
+    recall_text = f"  recall@1 {recall:.3f}" if recall is not None else ""
+    print(f"  {label:<22} p50 {p50:7.3f} ms  p99 {p99:7.3f} ms{recall_text}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', default='1000,10000,100000', help='comma-separated gallery sizes')
+    parser.add_argument('--queries', type=int, default=500, help='queries per gallery size')
+    parser.add_argument('--nprobe', default='1,4,8,16', help='comma-separated IVF nprobe values')
+    parser.add_argument('--noise', type=float, default=0.5, help='query noise relative to a unit descriptor')
+    args = parser.parse_args()
+
+    rng = np.random.RandomState(0)
+    print("📊 Face gallery index benchmark")
+    print("=" * 60)
+
+    for size in [int(s) for s in args.sizes.split(',')]:
+        gallery = make_gallery(size, rng)
+        queries = make_queries(gallery, min(args.queries, size), args.noise, rng)
+        ids = np.arange(size)
+        print(f"\n🗂️ {size} registered faces")
+
+        exact = BruteForceIndex(DIM)
+        for face_id, vector in zip(ids, gallery):
+            exact.add(int(face_id), vector)
+        truth, latencies = time_queries(exact, queries)
+        report("exact", latencies)
+
+        start = time.perf_counter()
+        ivf = IVFIndex.train(ids, gallery)
+        print(f"  IVF trained with {len(ivf.centroids)} lists in {time.perf_counter() - start:.2f} s")
+        for nprobe in [int(n) for n in args.nprobe.split(',')]:
+            ivf.nprobe = min(nprobe, len(ivf.centroids))
+            found, latencies = time_queries(ivf, queries)
+            report(f"ivf nprobe={ivf.nprobe}", latencies, float(np.mean(found == truth)))
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'embeddings.f32')
+            gallery.tofile(path)
+            mapped = np.memmap(path, dtype=np.float32, mode='r', shape=gallery.shape)
+            opened = []
+            for _ in range(2):
+                start = time.perf_counter()
+                index = MappedIVFIndex(DIM, lambda: mapped, directory, ids, nprobe=IVF_NPROBE)
+                opened.append(time.perf_counter() - start)
+            print(f"  mapped IVF: first worker trains in {opened[0]:.2f} s, "
+                  f"later workers open it in {opened[1] * 1000:.0f} ms")
+            found, latencies = time_queries(index, queries)
+            report(f"mapped ivf nprobe={index.nprobe}", latencies, float(np.mean(found == truth)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Benchmark for group-photo recognition
+Reports faces/sec for embedding and matching every face of an image in one
+batch against doing it one face at a time, for growing faces per image
+"""
+
+import argparse
+import tempfile
+import time
+
+import numpy as np
+
+import detectors
+import frame_decode
+import recognition
+from face_store import FaceStore
+
+FACE_SIZE = 96
+
+
+def make_gallery(directory, size, embedder, rng):
+    """FaceGallery with size random registered descriptors"""
+    store = FaceStore(directory, embedder.dim, embedder.name, keep_crops=False)
+    vectors = rng.standard_normal((size, embedder.dim)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    location = {'x': 0, 'y': 0, 'w': FACE_SIZE, 'h': FACE_SIZE}
+    store.add_many([(f"person-{i}", vector, location, None) for i, vector in enumerate(vectors)])
+    return recognition.FaceGallery(store)
+
+
+def make_group_image(faces, rng):
+    """Grayscale image with `faces` face-sized boxes laid out on a grid"""
+    columns = int(np.ceil(np.sqrt(faces)))
+    rows = int(np.ceil(faces / columns))
+    image = rng.randint(0, 256, (rows * FACE_SIZE, columns * FACE_SIZE), dtype=np.uint8)
+    boxes = np.array([((i % columns) * FACE_SIZE, (i // columns) * FACE_SIZE, FACE_SIZE, FACE_SIZE)
+                      for i in range(faces)])
+    return image, boxes
+
+
+def per_face(embedder, gallery, threshold, gray, boxes):
+    """One embedding call and one gallery search per face"""
+    for box in boxes:
+        gallery.match(embedder.embed(gray, box[None]), threshold)
+
+
+def batched(embedder, gallery, threshold, gray, boxes):
+    """Every face aligned into one batch, embedded together and matched in one search"""
+    gallery.match(embedder.embed(gray, boxes), threshold)
+
+
+def faces_per_second(func, faces, repeat, *args):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args)
+        times.append(time.perf_counter() - start)
+    return faces / np.median(times)
+
+
+def bench_photo(path, embedder, gallery, threshold, preset, repeat):
+    """Whole /detect-faces path (decode, detect, embed, match) on a real group photo"""
+    with open(path, 'rb') as f:
+        data = f.read()
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        frame = frame_decode.decode(data, detectors.DETECTION_PRESETS[preset]['max_side'])
+        boxes = detectors.detect(frame.gray, preset)
+        if len(boxes):
+            gallery.match(embedder.embed(frame.gray, boxes), threshold)
+        times.append(time.perf_counter() - start)
+    seconds = np.median(times)
+    print(f"\n📷 {path} ({preset}): {len(boxes)} faces in {seconds * 1000:.1f} ms, "
+          f"{len(boxes) / seconds:.0f} faces/sec")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--faces', default='1,2,4,8,16,32', help='comma-separated faces per image')
+    parser.add_argument('--gallery', type=int, default=1000, help='registered faces to match against')
+    parser.add_argument('--repeat', type=int, default=20, help='runs per measurement')
+    parser.add_argument('--image', help='also time the full pipeline on this group photo')
+    parser.add_argument('--preset', default='balanced', help='detection preset for --image')
+    args = parser.parse_args()
+
+    rng = np.random.RandomState(0)
+    embedder = recognition.get_embedder()
+    threshold = recognition.get_match_threshold()
+    detectors.warm_up()
+
+    print(f"📊 Group recognition benchmark ({embedder.name}, {args.gallery} registered faces)")
+    print("=" * 60)
+    with tempfile.TemporaryDirectory() as directory:
+        gallery = make_gallery(directory, args.gallery, embedder, rng)
+        print(f"  {'faces/image':>11}  {'per-face f/s':>12}  {'batched f/s':>12}  speedup")
+        for faces in [int(n) for n in args.faces.split(',')]:
+            gray, boxes = make_group_image(faces, rng)
+            single = faces_per_second(per_face, faces, args.repeat, embedder, gallery, threshold, gray, boxes)
+            batch = faces_per_second(batched, faces, args.repeat, embedder, gallery, threshold, gray, boxes)
+            print(f"  {faces:>11}  {single:>12.0f}  {batch:>12.0f}  {batch / single:6.2f}x")
+
+        if args.image:
+            bench_photo(args.image, embedder, gallery, threshold, args.preset, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
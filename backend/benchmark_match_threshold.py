@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""
+Calibration of the face match threshold and margin
+Registers one face per person, probes with another face of every person and
+reports the genuine scores (probe against its own person) and the impostor
+scores (probe against the best-scoring other person). The threshold to use
+is the impostor score exceeded by only --far of probes; the embedder tells
+people apart if most genuine scores clear it. Faces come from --faces, a
+directory with one sub-directory of photos per person, or are drawn as
+synthetic face-like crops when it is not given
+"""
+
+import argparse
+import os
+import tempfile
+
+import cv2
+import numpy as np
+
+import detectors
+import recognition
+from face_store import FaceStore
+
+FACE_SIZE = 96
+
+
+def synthetic_person(rng):
+    """Random face geometry and shading shared by every crop of one synthetic person"""
+    return {
+        'face': (rng.uniform(0.30, 0.42), rng.uniform(0.38, 0.48)),
+        'skin': rng.uniform(90, 200),
+        'background': rng.uniform(20, 235),
+        'dark': rng.uniform(10, 70),
+        'hair': rng.uniform(0.0, 0.2),
+        'eye_y': rng.uniform(0.36, 0.46),
+        'eye_dx': rng.uniform(0.12, 0.2),
+        'eye': (rng.uniform(0.04, 0.08), rng.uniform(0.02, 0.04)),
+        'nose': rng.uniform(0.08, 0.16),
+        'mouth_y': rng.uniform(0.66, 0.76),
+        'mouth_w': rng.uniform(0.1, 0.2),
+    }
+
+
+def synthetic_crop(person, rng, size=FACE_SIZE):
+    """One grayscale crop of a synthetic person, shifted and lit a little differently each time"""
+    image = np.full((size, size), person['background'], dtype=np.float32)
+    cx, cy = size / 2 + rng.uniform(-3, 3), size / 2 + rng.uniform(-3, 3)
+    half_w, half_h = person['face'][0] * size, person['face'][1] * size
+    cv2.ellipse(image, (int(cx), int(cy)), (int(half_w), int(half_h)), 0, 0, 360, person['skin'], -1)
+    if person['hair'] > 0:
+        cv2.ellipse(image, (int(cx), int(cy - half_h * 0.6)), (int(half_w), int(person['hair'] * size)),
+                    0, 180, 360, person['dark'], -1)
+    eye_y = int(cy - size / 2 + person['eye_y'] * size)
+    for side in (-1, 1):
+        cv2.ellipse(image, (int(cx + side * person['eye_dx'] * size), eye_y),
+                    (int(person['eye'][0] * size), int(person['eye'][1] * size) + 1),
+                    0, 0, 360, person['dark'], -1)
+    nose_y = int(cy - size / 2 + (person['eye_y'] + 0.05) * size)
+    cv2.line(image, (int(cx), nose_y), (int(cx), int(nose_y + person['nose'] * size)), person['dark'] + 40, 2)
+    mouth_y = int(cy - size / 2 + person['mouth_y'] * size)
+    cv2.ellipse(image, (int(cx), mouth_y), (int(person['mouth_w'] * size), int(0.03 * size) + 1),
+                0, 0, 180, person['dark'], 2)
+    image = image * rng.uniform(0.8, 1.2) + rng.uniform(-20, 20) + rng.normal(0, 6, image.shape)
+    return np.clip(image, 0, 255).astype(np.uint8)
+
+
+def synthetic_faces(people, rng):
+    """(name, [grayscale crop, ...]) for synthetic people, two crops each"""
+    faces = []
+    for i in range(people):
+        person = synthetic_person(rng)
+        faces.append((f"person-{i}", [synthetic_crop(person, rng) for _ in range(2)]))
+    return faces
+
+
+def directory_faces(directory, preset):
+    """(name, [grayscale crop, ...]) for every sub-directory holding at least two photos with one face"""
+    faces = []
+    for name in sorted(os.listdir(directory)):
+        folder = os.path.join(directory, name)
+        if not os.path.isdir(folder):
+            continue
+        crops = []
+        for filename in sorted(os.listdir(folder)):
+            gray = cv2.imread(os.path.join(folder, filename), cv2.IMREAD_GRAYSCALE)
+            if gray is None:
+                continue
+            boxes = detectors.detect(gray, preset)
+            if len(boxes) == 1:
+                x, y, w, h = boxes[0]
+                crops.append(cv2.resize(gray[y:y + h, x:x + w], (FACE_SIZE, FACE_SIZE)))
+        if len(crops) >= 2:
+            faces.append((name, crops))
+    return faces
+
+
+def embed(embedder, crops):
+    return embedder.embed(np.hstack(crops), [(i * FACE_SIZE, 0, FACE_SIZE, FACE_SIZE) for i in range(len(crops))])
+
+
+def scores(embedder, faces):
+    """Genuine and best-impostor similarity of every probe, with the first crop of each person registered"""
+    gallery = embed(embedder, [crops[0] for _, crops in faces])
+    genuine, impostor = [], []
+    for person, (_, crops) in enumerate(faces):
+        similarities = embed(embedder, crops[1:]) @ gallery.T
+        genuine.extend(similarities[:, person])
+        similarities[:, person] = -np.inf
+        impostor.extend(similarities.max(axis=1))
+    return np.array(genuine), np.array(impostor)
+
+
+def margins(embedder, faces, threshold, margin):
+    """Share of probes FaceGallery.match names correctly, wrongly, or not at all"""
+    with tempfile.TemporaryDirectory() as directory:
+        store = FaceStore(directory, embedder.dim, embedder.name, keep_crops=False)
+        location = {'x': 0, 'y': 0, 'w': FACE_SIZE, 'h': FACE_SIZE}
+        gallery_rows = embed(embedder, [crops[0] for _, crops in faces])
+        store.add_many([(name, row, location, None) for (name, _), row in zip(faces, gallery_rows)])
+        gallery = recognition.FaceGallery(store)
+        right = wrong = probes = 0
+        for name, crops in faces:
+            for found, _ in gallery.match(embed(embedder, crops[1:]), threshold, margin):
+                probes += 1
+                right += found == name
+                wrong += found is not None and found != name
+    return right / probes, wrong / probes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--faces', help='directory with one sub-directory of photos per person')
+    parser.add_argument('--people', type=int, default=200, help='synthetic people when --faces is not given')
+    parser.add_argument('--far', type=float, default=0.01, help='share of impostor probes allowed above the threshold')
+    parser.add_argument('--preset', default='accurate', help='detection preset for --faces photos')
+    args = parser.parse_args()
+
+    embedder = recognition.get_embedder()
+    rng = np.random.RandomState(0)
+    faces = directory_faces(args.faces, args.preset) if args.faces else synthetic_faces(args.people, rng)
+    if len(faces) < 2:
+        print("❌ Need at least two people with two usable photos each")
+        return
+
+    genuine, impostor = scores(embedder, faces)
+    suggested = float(np.quantile(impostor, 1 - args.far))
+    accepted = float(np.mean(genuine >= suggested))
+
+    print(f"📊 Match calibration ({embedder.name}, {len(faces)} people, {len(genuine)} probes, "
+          f"{'synthetic' if not args.faces else args.faces})")
+    print("=" * 60)
+    for label, values in (('genuine', genuine), ('impostor', impostor)):
+        low, median, high = np.percentile(values, [1, 50, 99])
+        print(f"  {label:>8}: 1% {low:.3f}  median {median:.3f}  99% {high:.3f}  max {values.max():.3f}")
+    print(f"\n  Threshold at {args.far:.1%} false accepts: {suggested:.3f} "
+          f"(accepts {accepted:.1%} of genuine probes)")
+
+    threshold, margin = recognition.get_match_threshold(), recognition.get_match_margin()
+    right, wrong = margins(embedder, faces, threshold, margin)
+    print(f"  Current threshold {threshold} and margin {margin}: "
+          f"{right:.1%} named correctly, {wrong:.1%} named wrongly")
+
+    if accepted >= 0.5:
+        print(f"\n✅ {embedder.name} tells these people apart; FACE_MATCH_THRESHOLD={suggested:.2f} fits them")
+    else:
+        print(f"\n⚠️ {embedder.name} does not tell these people apart: leave ATTENDANCE_AUTO unset (auto) or 0 with it")
+
+
+if __name__ == "__main__":
+    main()
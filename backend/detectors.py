@@ -0,0 +1,111 @@
+"""
+Face detector registry for the Face Recognition API
+Loads each OpenCV model once per worker thread and keeps it for the worker's lifetime,
+and runs detection at a preset working resolution and face-size range
+"""
+import os
+import threading
+import time
+
+import cv2
+import numpy as np
+
+# Model files known to the registry, keyed by detector name
+DETECTOR_MODELS = {
+    'haar_frontalface': cv2.data.haarcascades + 'haarcascade_frontalface_default.xml',
+}
+
+DEFAULT_DETECTOR = 'haar_frontalface'
+
+# Speed/accuracy presets. The image is shrunk so its longer side is at most
+# max_side before detection (None keeps full resolution), and the scale search
+# is bounded to faces between min_face and max_face of the shorter side.
+# 'full' is the original behaviour: full resolution, every scale.
+DETECTION_PRESETS = {
+    'full': {'max_side': None, 'scale_factor': 1.1, 'min_neighbors': 4, 'min_face': 0.0, 'max_face': 1.0},
+    'accurate': {'max_side': 1280, 'scale_factor': 1.05, 'min_neighbors': 4, 'min_face': 0.05, 'max_face': 1.0},
+    'balanced': {'max_side': 640, 'scale_factor': 1.1, 'min_neighbors': 4, 'min_face': 0.08, 'max_face': 0.9},
+    'fast': {'max_side': 400, 'scale_factor': 1.2, 'min_neighbors': 3, 'min_face': 0.12, 'max_face': 0.9},
+}
+
+DEFAULT_PRESET = os.environ.get('DETECTION_PRESET', 'full')
+
+# The frontal face cascade cannot find anything smaller than its 24x24 window
+MIN_WINDOW = 24
+
+# CascadeClassifier is not safe to share between threads, so every thread
+# (gunicorn gthread worker, Flask dev server thread) gets its own instance
+_local = threading.local()
+
+
+def _load_detector(name):
+    """Parse the model file for a detector name"""
+    if name not in DETECTOR_MODELS:
+        raise KeyError(f"Unknown detector: {name}")
+
+    detector = cv2.CascadeClassifier(DETECTOR_MODELS[name])
+    if detector.empty():
+        raise RuntimeError(f"Failed to load detector model: {DETECTOR_MODELS[name]}")
+    return detector
+
+
+def get_detector(name=DEFAULT_DETECTOR):
+    """Return the calling thread's detector, loading it on first use"""
+    detectors = getattr(_local, 'detectors', None)
+    if detectors is None:
+        detectors = _local.detectors = {}
+
+    detector = detectors.get(name)
+    if detector is None:
+        detector = detectors[name] = _load_detector(name)
+    return detector
+
+
+def _elapsed_ms(start):
+    return round((time.perf_counter() - start) * 1000, 2)
+
+
+def detect(gray, preset=DEFAULT_PRESET, name=DEFAULT_DETECTOR, timings=None):
+    """Detect faces in a grayscale image with a speed/accuracy preset
+
+    Returns an (n, 4) int array of x, y, w, h boxes in the coordinates of the
+    image passed in, whatever resolution detection actually ran at. If a
+    timings dict is given, resize_ms and detect_ms are added to it.
+    """
+    settings = DETECTION_PRESETS[preset]
+    height, width = gray.shape[:2]
+
+    start = time.perf_counter()
+    scale = 1.0
+    working = gray
+    if settings['max_side'] and max(height, width) > settings['max_side']:
+        scale = settings['max_side'] / max(height, width)
+        working = cv2.resize(gray, (max(1, round(width * scale)), max(1, round(height * scale))),
+                             interpolation=cv2.INTER_AREA)
+    resize_ms = _elapsed_ms(start)
+
+    # Expected face size, in working-resolution pixels
+    short_side = min(working.shape[:2])
+    min_size = max(MIN_WINDOW, int(short_side * settings['min_face']))
+    max_size = max(min_size, int(short_side * settings['max_face']))
+
+    start = time.perf_counter()
+    faces = get_detector(name).detectMultiScale(
+        working, settings['scale_factor'], settings['min_neighbors'],
+        minSize=(min_size, min_size), maxSize=(max_size, max_size)
+    )
+    detect_ms = _elapsed_ms(start)
+
+    faces = np.asarray(faces, dtype=np.float64).reshape(-1, 4)
+    if scale != 1.0:
+        faces = faces / scale
+    if timings is not None:
+        timings.update(resize_ms=resize_ms, detect_ms=detect_ms)
+    return np.round(faces).astype(np.int32)
+
+
+def warm_up():
+    """Load every registered model and run one inference so the first request pays nothing"""
+    blank = np.zeros((64, 64), dtype=np.uint8)
+    for name in DETECTOR_MODELS:
+        get_detector(name).detectMultiScale(blank, 1.1, 4)
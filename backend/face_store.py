@@ -0,0 +1,200 @@
+"""
+Persistent storage for registered faces
+Descriptors live in a flat float32 file that every worker memory-maps; names,
+locations and optional JPEG crops live in SQLite next to it
+"""
+import os
+import sqlite3
+import threading
+from datetime import datetime
+
+import cv2
+import numpy as np
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS faces (
+    id INTEGER PRIMARY KEY,          -- row of the descriptor in embeddings.f32
+    name TEXT NOT NULL,
+    x INTEGER, y INTEGER, w INTEGER, h INTEGER,
+    created_at TEXT NOT NULL,
+    deleted INTEGER NOT NULL DEFAULT 0,
+    change_seq INTEGER NOT NULL,     -- bumped on insert and delete so workers can catch up
+    crop BLOB
+);
+CREATE INDEX IF NOT EXISTS faces_change_seq ON faces(change_seq);
+CREATE INDEX IF NOT EXISTS faces_name ON faces(name);
+"""
+
+
+class FaceStore:
+    """Registered faces shared by every worker through one directory on disk"""
+
+    def __init__(self, directory, dim, embedder_name, keep_crops=True, crop_quality=85):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.dim = dim
+        self.keep_crops = keep_crops
+        self.crop_quality = crop_quality
+        self._row_bytes = dim * np.dtype(np.float32).itemsize
+        self._embeddings_path = os.path.join(directory, 'embeddings.f32')
+        self._lock = threading.Lock()
+        self._mapped = np.zeros((0, dim), dtype=np.float32)
+
+        # One connection per process, shared by its threads under self._lock
+        self._db = sqlite3.connect(os.path.join(directory, 'faces.sqlite3'),
+                                   check_same_thread=False, isolation_level=None)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.executescript(SCHEMA)
+        open(self._embeddings_path, 'ab').close()
+
+        self._check_meta({'dim': str(dim), 'embedder': embedder_name})
+        self.refresh()
+
+    def _check_meta(self, expected):
+        """Refuse to mix descriptors from a different embedder into an existing store"""
+        with self._lock:
+            self._db.execute('BEGIN IMMEDIATE')
+            try:
+                stored = dict(self._db.execute('SELECT key, value FROM meta'))
+                for key, value in expected.items():
+                    if key not in stored:
+                        self._db.execute('INSERT INTO meta (key, value) VALUES (?, ?)', (key, value))
+                    elif stored[key] != value:
+                        raise RuntimeError(
+                            f"Face store was built with {key}={stored[key]}, current is {value}; "
+                            f"point FACE_STORE_DIR at a new directory or re-register faces")
+                self._db.execute('COMMIT')
+            except Exception:
+                self._db.execute('ROLLBACK')
+                raise
+
+    @property
+    def embeddings(self):
+        """Read-only (rows, dim) view of every descriptor on disk, including deleted rows"""
+        return self._mapped
+
+    def refresh(self):
+        """Re-map the descriptor file if another writer has appended to it"""
+        rows = os.path.getsize(self._embeddings_path) // self._row_bytes
+        if rows != len(self._mapped):
+            if rows == 0:
+                self._mapped = np.zeros((0, self.dim), dtype=np.float32)
+            else:
+                self._mapped = np.memmap(self._embeddings_path, dtype=np.float32,
+                                         mode='r', shape=(rows, self.dim))
+        return len(self._mapped)
+
+    def data_version(self):
+        """Changes whenever another connection (worker) commits to the database"""
+        with self._lock:
+            return self._db.execute('PRAGMA data_version').fetchone()[0]
+
+    def add(self, name, embedding, location, crop=None):
+        """Persist one face and return its id (which is also its descriptor row)"""
+        return self.add_many([(name, embedding, location, crop)])[0]
+
+    def add_many(self, faces):
+        """Persist (name, embedding, location, crop) faces in one transaction; returns their ids"""
+        rows = []
+        for name, embedding, location, crop in faces:
+            blob = None
+            if crop is not None and self.keep_crops:
+                ok, encoded = cv2.imencode('.jpg', crop, [cv2.IMWRITE_JPEG_QUALITY, self.crop_quality])
+                blob = encoded.tobytes() if ok else None
+            vector = np.ascontiguousarray(embedding, dtype=np.float32).reshape(self.dim)
+            rows.append((name, vector, location, blob))
+
+        with self._lock:
+            # The write lock also serialises appends to the descriptor file across workers
+            self._db.execute('BEGIN IMMEDIATE')
+            try:
+                first_id = os.path.getsize(self._embeddings_path) // self._row_bytes
+                seq = self._db.execute('SELECT COALESCE(MAX(change_seq), 0) FROM faces').fetchone()[0]
+                created_at = datetime.now().isoformat()
+                self._db.executemany(
+                    'INSERT INTO faces (id, name, x, y, w, h, created_at, change_seq, crop) '
+                    'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                    [(first_id + i, name, location['x'], location['y'], location['w'], location['h'],
+                      created_at, seq + i + 1, blob)
+                     for i, (name, _, location, blob) in enumerate(rows)])
+                with open(self._embeddings_path, 'r+b') as f:
+                    f.seek(first_id * self._row_bytes)
+                    f.write(b''.join(vector.tobytes() for _, vector, _, _ in rows))
+                self._db.execute('COMMIT')
+            except Exception:
+                self._db.execute('ROLLBACK')
+                raise
+        return list(range(first_id, first_id + len(rows)))
+
+    def delete_name(self, name):
+        """Mark every face registered under a name as deleted and return their ids"""
+        with self._lock:
+            self._db.execute('BEGIN IMMEDIATE')
+            try:
+                ids = [row[0] for row in self._db.execute(
+                    'SELECT id FROM faces WHERE name = ? AND deleted = 0 ORDER BY id', (name,))]
+                seq = self._db.execute('SELECT COALESCE(MAX(change_seq), 0) FROM faces').fetchone()[0]
+                for offset, face_id in enumerate(ids, start=1):
+                    self._db.execute('UPDATE faces SET deleted = 1, crop = NULL, change_seq = ? '
+                                     'WHERE id = ?', (seq + offset, face_id))
+                self._db.execute('COMMIT')
+            except Exception:
+                self._db.execute('ROLLBACK')
+                raise
+        return ids
+
+    def changes_since(self, seq):
+        """(id, deleted, change_seq) of every face inserted or deleted after seq"""
+        with self._lock:
+            return self._db.execute(
+                'SELECT id, deleted, change_seq FROM faces WHERE change_seq > ? ORDER BY change_seq',
+                (seq,)).fetchall()
+
+    def names_for(self, face_ids):
+        """Map live face ids to names"""
+        face_ids = [int(face_id) for face_id in face_ids]
+        if not face_ids:
+            return {}
+        placeholders = ','.join('?' * len(face_ids))
+        with self._lock:
+            return dict(self._db.execute(
+                f'SELECT id, name FROM faces WHERE deleted = 0 AND id IN ({placeholders})', face_ids))
+
+    def names(self):
+        """Names of every live face in registration order"""
+        with self._lock:
+            return [row[0] for row in self._db.execute(
+                'SELECT name FROM faces WHERE deleted = 0 ORDER BY id')]
+
+    def iter_faces(self, after_id=-1, chunk=1000):
+        """Live faces with id > after_id in id order, read chunk rows at a time
+
+        Each chunk is one range scan on the primary key; the lock is only held
+        while it is read, so a long listing does not block registrations.
+        """
+        while True:
+            with self._lock:
+                rows = self._db.execute(
+                    'SELECT id, name, x, y, w, h, created_at FROM faces '
+                    'WHERE deleted = 0 AND id > ? ORDER BY id LIMIT ?', (after_id, chunk)).fetchall()
+            for face_id, name, x, y, w, h, created_at in rows:
+                yield {'id': face_id, 'name': name,
+                       'location': {'x': x, 'y': y, 'w': w, 'h': h}, 'created_at': created_at}
+            if len(rows) < chunk:
+                return
+            after_id = rows[-1][0]
+
+    def count(self):
+        with self._lock:
+            return self._db.execute('SELECT COUNT(*) FROM faces WHERE deleted = 0').fetchone()[0]
+
+    def get_crop(self, face_id):
+        """JPEG bytes of the face crop saved at registration, or None"""
+        with self._lock:
+            row = self._db.execute('SELECT crop FROM faces WHERE id = ? AND deleted = 0',
+                                   (face_id,)).fetchone()
+        return row[0] if row else None
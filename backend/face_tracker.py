@@ -0,0 +1,187 @@
+"""
+Per-session face tracking for webcam streams
+Runs the full-frame detector only every few frames or when a face is lost;
+in between each known face is looked for only in a small region around its
+last box. Faces keep their id across frames and their recognition result is
+carried forward, so a face is embedded when it first appears and then only
+re-verified now and then.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+import detectors
+
+DETECT_EVERY = int(os.environ.get('TRACK_DETECT_EVERY', 10))        # frames between full detections
+REVERIFY_EVERY = int(os.environ.get('TRACK_REVERIFY_EVERY', 30))    # frames between re-embedding a track
+MAX_MISSES = int(os.environ.get('TRACK_MAX_MISSES', 2))             # missed frames before a track is dropped
+ROI_MARGIN = float(os.environ.get('TRACK_ROI_MARGIN', 0.5))         # search region padding, as a fraction of the box
+MIN_IOU = 0.3
+
+SESSION_LIMIT = int(os.environ.get('TRACK_SESSIONS', 256))
+SESSION_TTL = float(os.environ.get('TRACK_SESSION_TTL', 60))         # seconds idle before a session is forgotten
+
+
+def iou(a, b):
+    """Intersection over union of two (x, y, w, h) boxes"""
+    ix = max(0, min(a[0] + a[2], b[0] + b[2]) - max(a[0], b[0]))
+    iy = max(0, min(a[1] + a[3], b[1] + b[3]) - max(a[1], b[1]))
+    inter = ix * iy
+    union = a[2] * a[3] + b[2] * b[3] - inter
+    return inter / union if union else 0.0
+
+
+class Track:
+    """One face followed across frames"""
+
+    __slots__ = ('id', 'box', 'name', 'similarity', 'misses', 'recognized_at')
+
+    def __init__(self, track_id, box):
+        self.id = track_id
+        self.box = tuple(int(v) for v in box)
+        self.name = None
+        self.similarity = 0.0
+        self.misses = 0
+        self.recognized_at = None
+
+
+class FaceTracker:
+    """Tracks for one client's frame stream; safe to call from any pool thread"""
+
+    def __init__(self, detect_every=DETECT_EVERY, reverify_every=REVERIFY_EVERY,
+                 max_misses=MAX_MISSES, roi_margin=ROI_MARGIN):
+        self.detect_every = max(1, detect_every)
+        self.reverify_every = max(1, reverify_every)
+        self.max_misses = max_misses
+        self.roi_margin = roi_margin
+        self.tracks = []
+        self.frame = 0
+        self.last_used = time.monotonic()
+        self._next_id = 1
+        self._last_full = None
+        self._lost = False
+        self._lock = threading.Lock()
+
+    def update(self, gray, recognize, preset=detectors.DEFAULT_PRESET, timings=None):
+        """Advance one frame; returns (ran_full_detection, tracks)
+
+        recognize(gray, boxes) -> [(name or None, similarity)] is called once
+        per frame, batched, for new tracks and tracks due for re-verification.
+        Full detections use the given detection preset. If a timings dict is
+        given, the detect/track and embed stage times are added to it.
+        """
+        timings = {} if timings is None else timings
+        with self._lock:
+            self.frame += 1
+            self.last_used = time.monotonic()
+
+            full = (self._lost or not self.tracks or self._last_full is None
+                    or self.frame - self._last_full >= self.detect_every)
+            if full:
+                self._last_full = self.frame
+                self._lost = False
+                self._associate(detectors.detect(gray, preset, timings=timings))
+            else:
+                start = time.perf_counter()
+                self._follow(gray)
+                timings['track_ms'] = round((time.perf_counter() - start) * 1000, 2)
+
+            # Tracks missed this frame are kept for a while but not reported
+            visible = [track for track in self.tracks if track.misses == 0]
+            due = [track for track in visible
+                   if track.recognized_at is None or self.frame - track.recognized_at >= self.reverify_every]
+            if due:
+                start = time.perf_counter()
+                results = recognize(gray, np.array([track.box for track in due]))
+                timings['embed_ms'] = round((time.perf_counter() - start) * 1000, 2)
+                for track, (name, similarity) in zip(due, results):
+                    track.name, track.similarity = name, similarity
+                    track.recognized_at = self.frame
+
+            return full, visible
+
+    def _associate(self, boxes):
+        """Greedy IoU matching of full-frame detections to existing tracks"""
+        boxes = [tuple(int(v) for v in box) for box in boxes]
+        pairs = sorted(((iou(track.box, box), t, b)
+                        for t, track in enumerate(self.tracks)
+                        for b, box in enumerate(boxes)), reverse=True)
+
+        matched_tracks, matched_boxes = set(), set()
+        for overlap, t, b in pairs:
+            if overlap < MIN_IOU:
+                break
+            if t in matched_tracks or b in matched_boxes:
+                continue
+            matched_tracks.add(t)
+            matched_boxes.add(b)
+            self.tracks[t].box = boxes[b]
+            self.tracks[t].misses = 0
+
+        for t, track in enumerate(self.tracks):
+            if t not in matched_tracks:
+                track.misses += 1
+        self.tracks = [track for track in self.tracks if track.misses <= self.max_misses]
+
+        for b, box in enumerate(boxes):
+            if b not in matched_boxes:
+                self.tracks.append(Track(self._next_id, box))
+                self._next_id += 1
+
+    def _follow(self, gray):
+        """Look for each track only near its last box, at about its last size"""
+        detector = detectors.get_detector()
+        height, width = gray.shape[:2]
+        for track in self.tracks:
+            x, y, w, h = track.box
+            pad_x, pad_y = int(w * self.roi_margin), int(h * self.roi_margin)
+            x0, y0 = max(0, x - pad_x), max(0, y - pad_y)
+            x1, y1 = min(width, x + w + pad_x), min(height, y + h + pad_y)
+
+            size = min(w, h)
+            found = detector.detectMultiScale(
+                gray[y0:y1, x0:x1], 1.1, 4,
+                minSize=(int(size * 0.7),) * 2,
+                maxSize=(int(size * 1.4),) * 2
+            )
+            if len(found) == 0:
+                track.misses += 1
+                self._lost = True  # confirm with a full detection on the next frame
+                continue
+
+            candidates = [(fx + x0, fy + y0, fw, fh) for fx, fy, fw, fh in found]
+            track.box = tuple(int(v) for v in max(candidates, key=lambda box: iou(track.box, box)))
+            track.misses = 0
+
+        self.tracks = [track for track in self.tracks if track.misses <= self.max_misses]
+
+
+class TrackerSessions:
+    """FaceTracker per client session id, forgetting idle and least recently used sessions"""
+
+    def __init__(self, limit=SESSION_LIMIT, ttl=SESSION_TTL):
+        self.limit = limit
+        self.ttl = ttl
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, session_id):
+        with self._lock:
+            now = time.monotonic()
+            tracker = self._sessions.pop(session_id, None)
+            while self._sessions:
+                oldest = next(iter(self._sessions.values()))
+                if now - oldest.last_used <= self.ttl and len(self._sessions) < self.limit:
+                    break
+                self._sessions.popitem(last=False)
+
+            if tracker is None or now - tracker.last_used > self.ttl:
+                tracker = FaceTracker()
+            self._sessions[session_id] = tracker
+            return tracker
+
+    def __len__(self):
+        return len(self._sessions)
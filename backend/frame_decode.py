@@ -0,0 +1,96 @@
+"""
+Decoding uploads for face detection
+Detection only needs a grayscale image at its working resolution, so JPEGs
+are decoded straight to grayscale at 1/2, 1/4 or 1/8 scale with libjpeg's
+DCT scaling (IMREAD_REDUCED_GRAYSCALE_*), never materialising the full-size
+colour frame. Other formats have no scaled decoder and are decoded at full
+size. Box coordinates are mapped back to the original image either way.
+Every upload passes upload_guard.check() first, which reads its size from
+the header and may require a larger reduction (or reject it).
+"""
+import cv2
+import numpy as np
+
+import upload_guard
+
+GRAY_FLAGS = {
+    1: cv2.IMREAD_GRAYSCALE,
+    2: cv2.IMREAD_REDUCED_GRAYSCALE_2,
+    4: cv2.IMREAD_REDUCED_GRAYSCALE_4,
+    8: cv2.IMREAD_REDUCED_GRAYSCALE_8,
+}
+COLOR_FLAGS = {
+    1: cv2.IMREAD_COLOR,
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+}
+
+
+class DecodedFrame:
+    """A decoded upload plus the factor that maps its pixels back to the original"""
+
+    def __init__(self, gray, color, width, height, reduction):
+        self.gray = gray
+        self.color = color
+        self.width = width          # original size, after EXIF orientation
+        self.height = height
+        self.reduction = reduction  # 1, 2, 4 or 8
+
+    @property
+    def scale(self):
+        """Original pixels per decoded pixel along x and y"""
+        return self.width / self.gray.shape[1], self.height / self.gray.shape[0]
+
+    def to_original(self, boxes):
+        """Map (x, y, w, h) boxes from decoded to original coordinates"""
+        boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+        if self.reduction == 1:
+            return boxes.astype(np.int32)
+        sx, sy = self.scale
+        return np.round(boxes * (sx, sy, sx, sy)).astype(np.int32)
+
+
+def reduction_for(width, height, max_side):
+    """Largest libjpeg scale (8, 4, 2) that still leaves at least max_side pixels on the longer side"""
+    if not max_side:
+        return 1
+    for reduction in (8, 4, 2):
+        if max(width, height) / reduction >= max_side:
+            return reduction
+    return 1
+
+
+def decode(data, max_side=None, color=False):
+    """Decode an upload for detection at (at least) max_side pixels on its longer side
+
+    Returns a DecodedFrame, or None if OpenCV cannot decode the bytes; raises
+    upload_guard.UploadRejected for uploads over the size limits. With
+    color=True the BGR image is decoded (at the same reduction) instead of
+    grayscale, and gray is derived from it.
+    """
+    info = upload_guard.check(data)
+    reduction = info.reduction
+    if info.format in upload_guard.JPEG_FORMATS:
+        reduction = max(reduction, reduction_for(info.width, info.height, max_side))
+
+    buffer = np.frombuffer(data, np.uint8)
+    if color:
+        image = cv2.imdecode(buffer, COLOR_FLAGS[reduction])
+        if image is None:
+            return None
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    else:
+        image = None
+        gray = cv2.imdecode(buffer, GRAY_FLAGS[reduction])
+        if gray is None:
+            return None
+
+    height, width = gray.shape[:2]
+    if reduction > 1:
+        # OpenCV applies EXIF orientation, the header size does not
+        header_w, header_h = info.width, info.height
+        if (header_w > header_h) != (width > height):
+            header_w, header_h = header_h, header_w
+        width, height = header_w, header_h
+    return DecodedFrame(gray, image, width, height, reduction)
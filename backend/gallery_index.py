@@ -0,0 +1,532 @@
+"""
+Nearest-neighbour indexes for the face gallery
+Exact brute force for small galleries and an inverted-file (IVF) index for
+large ones, both pure NumPy over unit-length float32 descriptors. Over a
+memory-mapped descriptor file the IVF centroids and each row's list are
+persisted next to it, so every worker maps them instead of training its own
+"""
+import os
+
+import numpy as np
+
+# 'exact' always brute-forces; 'auto' switches to IVF once the gallery reaches IVF_THRESHOLD;
+# 'ivf' switches as soon as there are IVF_MIN_FACES descriptors to train the centroids on
+INDEX_KINDS = ('exact', 'auto', 'ivf')
+INDEX_KIND = os.environ.get('FACE_INDEX', 'auto')
+IVF_THRESHOLD = int(os.environ.get('FACE_INDEX_IVF_THRESHOLD', 20000))
+IVF_MIN_FACES = 256
+# Number of coarse clusters (0 = sqrt of the gallery size at training time)
+IVF_NLIST = int(os.environ.get('FACE_INDEX_NLIST', 0))
+# Clusters scanned per query: higher means better recall and slower queries
+IVF_NPROBE = int(os.environ.get('FACE_INDEX_NPROBE', 16))
+
+
+def _empty_top(queries, k):
+    return np.full((len(queries), k), -1, dtype=np.int64), np.full((len(queries), k), -np.inf, dtype=np.float32)
+
+
+def _top_k(ids, scores, k):
+    """The k best (ids, scores) of every row, best first; rows with fewer
+    candidates are padded with id -1 and score -inf"""
+    if scores.shape[1] > k:
+        columns = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    else:
+        columns = np.broadcast_to(np.arange(scores.shape[1]), scores.shape)
+    top = np.take_along_axis(scores, columns, axis=1)
+    order = np.argsort(-top, axis=1, kind='stable')
+    columns = np.take_along_axis(columns, order, axis=1)
+    top = np.take_along_axis(top, order, axis=1)
+    top_ids = np.take_along_axis(np.broadcast_to(ids, scores.shape), columns, axis=1)
+    top_ids = np.where(np.isneginf(top), -1, top_ids)
+    if top.shape[1] < k:
+        pad_ids, pad_scores = _empty_top(scores, k - top.shape[1])
+        top_ids = np.concatenate([top_ids, pad_ids], axis=1)
+        top = np.concatenate([top, pad_scores], axis=1)
+    return top_ids.astype(np.int64), top.astype(np.float32)
+
+
+class _Rows:
+    """Growable contiguous matrix of descriptors with a parallel id array"""
+
+    def __init__(self, dim, capacity=64):
+        self.matrix = np.zeros((capacity, dim), dtype=np.float32)
+        self.ids = np.zeros(capacity, dtype=np.int64)
+        self.count = 0
+
+    def append(self, face_id, vector):
+        """Store a row and return its position"""
+        if self.count == len(self.ids):
+            capacity = len(self.ids) * 2
+            matrix = np.zeros((capacity, self.matrix.shape[1]), dtype=np.float32)
+            matrix[:self.count] = self.matrix[:self.count]
+            ids = np.zeros(capacity, dtype=np.int64)
+            ids[:self.count] = self.ids[:self.count]
+            self.matrix, self.ids = matrix, ids
+        row = self.count
+        self.matrix[row] = vector
+        self.ids[row] = face_id
+        self.count += 1
+        return row
+
+    def pop(self, row):
+        """Remove a row by moving the last row into its place; return the moved id or None"""
+        last = self.count - 1
+        moved = None
+        if row != last:
+            self.matrix[row] = self.matrix[last]
+            self.ids[row] = self.ids[last]
+            moved = int(self.ids[row])
+        self.count = last
+        return moved
+
+    def best(self, queries):
+        """Best (id, score) of every query row within these rows"""
+        scores = queries @ self.matrix[:self.count].T
+        best = scores.argmax(axis=1)
+        return self.ids[best], scores[np.arange(len(best)), best]
+
+    def top(self, queries, k):
+        """The k best (ids, scores) of every query row within these rows, best first"""
+        return _top_k(self.ids[:self.count], queries @ self.matrix[:self.count].T, k)
+
+
+class BruteForceIndex:
+    """Exact search: every query is scored against every stored descriptor"""
+
+    kind = 'exact'
+    needs_vectors = True
+
+    def __init__(self, dim):
+        self.dim = dim
+        self._rows = _Rows(dim)
+        self._positions = {}
+
+    def __len__(self):
+        return self._rows.count
+
+    def add(self, face_id, vector):
+        self._positions[face_id] = self._rows.append(face_id, vector)
+
+    def add_many(self, ids, vectors):
+        for face_id, vector in zip(ids, vectors):
+            self.add(int(face_id), vector)
+
+    def remove(self, face_id):
+        row = self._positions.pop(face_id, None)
+        if row is None:
+            return
+        moved = self._rows.pop(row)
+        if moved is not None:
+            self._positions[moved] = row
+
+    def items(self):
+        """All stored (ids, vectors) as arrays"""
+        count = self._rows.count
+        return self._rows.ids[:count].copy(), self._rows.matrix[:count].copy()
+
+    def search(self, queries):
+        """Nearest stored id and its cosine similarity for every query row"""
+        if self._rows.count == 0:
+            return np.full(len(queries), -1, dtype=np.int64), np.zeros(len(queries), dtype=np.float32)
+        return self._rows.best(queries)
+
+    def search_k(self, queries, k):
+        """The k nearest stored ids and their similarities for every query row, best first"""
+        if self._rows.count == 0:
+            return _empty_top(queries, k)
+        return self._rows.top(queries, k)
+
+
+class MappedIndex:
+    """Exact search straight over an externally owned descriptor matrix, such
+    as a memory-mapped file, where each face id is its row number"""
+
+    kind = 'exact'
+    needs_vectors = False
+
+    def __init__(self, dim, get_matrix):
+        self.dim = dim
+        self._get_matrix = get_matrix
+        self._live = np.zeros(0, dtype=bool)
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    def add(self, face_id, vector=None):
+        """Mark a row live; the descriptor itself is already in the matrix"""
+        if face_id >= len(self._live):
+            live = np.zeros(max(face_id + 1, len(self._live) * 2), dtype=bool)
+            live[:len(self._live)] = self._live
+            self._live = live
+        if not self._live[face_id]:
+            self._live[face_id] = True
+            self._count += 1
+
+    def add_many(self, ids, vectors=None):
+        ids = np.asarray(ids, dtype=np.int64)
+        if len(ids) == 0:
+            return
+        self.add(int(ids.max()))
+        self._live[ids] = True
+        self._count = int(self._live.sum())
+
+    def remove(self, face_id):
+        if face_id < len(self._live) and self._live[face_id]:
+            self._live[face_id] = False
+            self._count -= 1
+
+    def live_ids(self):
+        return np.nonzero(self._live)[0]
+
+    def items(self):
+        matrix = self._get_matrix()
+        ids = np.nonzero(self._live[:len(matrix)])[0]
+        return ids, np.asarray(matrix[ids], dtype=np.float32)
+
+    def search(self, queries):
+        """Nearest live row and its cosine similarity for every query row"""
+        matrix = self._get_matrix()
+        rows = min(len(matrix), len(self._live))
+        if self._count == 0 or rows == 0:
+            return np.full(len(queries), -1, dtype=np.int64), np.zeros(len(queries), dtype=np.float32)
+
+        scores = queries @ matrix[:rows].T
+        scores[:, ~self._live[:rows]] = -np.inf
+        best = scores.argmax(axis=1)
+        return best.astype(np.int64), scores[np.arange(len(best)), best]
+
+    def search_k(self, queries, k):
+        """The k nearest live rows and their similarities for every query row, best first"""
+        matrix = self._get_matrix()
+        rows = min(len(matrix), len(self._live))
+        if self._count == 0 or rows == 0:
+            return _empty_top(queries, k)
+
+        scores = queries @ matrix[:rows].T
+        scores[:, ~self._live[:rows]] = -np.inf
+        return _top_k(np.arange(rows), scores, k)
+
+
+def _train_centroids(vectors, nlist, iterations=10, seed=0):
+    """Spherical k-means: unit-length centroids that maximise cosine similarity"""
+    rng = np.random.RandomState(seed)
+    # A few dozen points per cluster is plenty to place the centroids
+    sample_size = min(len(vectors), nlist * 64)
+    sample = vectors[rng.choice(len(vectors), sample_size, replace=False)]
+    centroids = sample[rng.choice(sample_size, nlist, replace=False)].copy()
+
+    for _ in range(iterations):
+        assignment = (sample @ centroids.T).argmax(axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignment, sample)
+        norms = np.linalg.norm(sums, axis=1, keepdims=True)
+        empty = norms[:, 0] == 0
+        # Re-seed clusters that lost all their points
+        sums[empty] = sample[rng.choice(sample_size, int(empty.sum()))]
+        norms[empty] = 1.0
+        centroids = (sums / norms).astype(np.float32)
+    return centroids
+
+
+class IVFIndex:
+    """Inverted-file index: descriptors are bucketed by nearest centroid and
+    a query only scans its nprobe closest buckets"""
+
+    kind = 'ivf'
+    needs_vectors = True
+
+    def __init__(self, dim, centroids, nprobe=IVF_NPROBE):
+        self.dim = dim
+        self.centroids = np.ascontiguousarray(centroids, dtype=np.float32)
+        self.nprobe = max(1, min(nprobe, len(self.centroids)))
+        self._lists = [_Rows(dim, capacity=16) for _ in range(len(self.centroids))]
+        self._positions = {}
+
+    @classmethod
+    def train(cls, ids, vectors, nlist=IVF_NLIST, nprobe=IVF_NPROBE):
+        """Build an index whose centroids are learnt from, and which holds, the given vectors"""
+        if nlist <= 0:
+            nlist = int(np.sqrt(len(vectors)))
+        nlist = max(1, min(nlist, len(vectors)))
+        index = cls(vectors.shape[1], _train_centroids(vectors, nlist), nprobe)
+        index.add_many(ids, vectors)
+        return index
+
+    def __len__(self):
+        return len(self._positions)
+
+    def add(self, face_id, vector):
+        bucket = int((self.centroids @ vector).argmax())
+        self._positions[face_id] = (bucket, self._lists[bucket].append(face_id, vector))
+
+    def add_many(self, ids, vectors):
+        buckets = (vectors @ self.centroids.T).argmax(axis=1)
+        for face_id, vector, bucket in zip(ids, vectors, buckets):
+            self._positions[int(face_id)] = (int(bucket), self._lists[bucket].append(face_id, vector))
+
+    def remove(self, face_id):
+        position = self._positions.pop(face_id, None)
+        if position is None:
+            return
+        bucket, row = position
+        moved = self._lists[bucket].pop(row)
+        if moved is not None:
+            self._positions[moved] = (bucket, row)
+
+    def items(self):
+        ids = np.concatenate([rows.ids[:rows.count] for rows in self._lists])
+        vectors = np.concatenate([rows.matrix[:rows.count] for rows in self._lists])
+        return ids, vectors
+
+    def search(self, queries):
+        """Approximate nearest stored id and its cosine similarity for every query row"""
+        best_ids = np.full(len(queries), -1, dtype=np.int64)
+        best_scores = np.full(len(queries), -np.inf, dtype=np.float32)
+
+        coarse = queries @ self.centroids.T
+        probes = np.argpartition(-coarse, self.nprobe - 1, axis=1)[:, :self.nprobe]
+
+        # Score each probed bucket once for all the queries that probe it
+        for bucket in np.unique(probes):
+            rows = self._lists[bucket]
+            if rows.count == 0:
+                continue
+            members = np.nonzero((probes == bucket).any(axis=1))[0]
+            ids, scores = rows.best(queries[members])
+            better = scores > best_scores[members]
+            best_ids[members[better]] = ids[better]
+            best_scores[members[better]] = scores[better]
+
+        best_scores[best_ids < 0] = 0.0
+        return best_ids, best_scores
+
+    def search_k(self, queries, k):
+        """Approximate k nearest stored ids and their similarities for every query row, best first"""
+        top_ids, top_scores = _empty_top(queries, k)
+
+        coarse = queries @ self.centroids.T
+        probes = np.argpartition(-coarse, self.nprobe - 1, axis=1)[:, :self.nprobe]
+
+        for bucket in np.unique(probes):
+            rows = self._lists[bucket]
+            if rows.count == 0:
+                continue
+            members = np.nonzero((probes == bucket).any(axis=1))[0]
+            ids, scores = rows.top(queries[members], k)
+            top_ids[members], top_scores[members] = _top_k(
+                np.concatenate([top_ids[members], ids], axis=1),
+                np.concatenate([top_scores[members], scores], axis=1), k)
+        return top_ids, top_scores
+
+
+class MappedIVFIndex:
+    """IVF search straight over an externally owned, memory-mapped descriptor
+    matrix, where each face id is its row number
+
+    The centroids (ivf_centroids.f32) and the list of every row
+    (ivf_lists.i32, list + 1 per row, 0 for rows not assigned yet) live in
+    directory, next to the descriptor file. The first worker to need them
+    trains the centroids from a sample; every other worker, and every later
+    start, loads them and reads the row lists, so no descriptor is copied
+    into memory beyond the rows a query scans.
+    """
+
+    kind = 'ivf'
+    needs_vectors = False
+
+    CENTROIDS_FILE = 'ivf_centroids.f32'
+    LISTS_FILE = 'ivf_lists.i32'
+
+    def __init__(self, dim, get_matrix, directory, ids, nlist=IVF_NLIST, nprobe=IVF_NPROBE):
+        self.dim = dim
+        self._get_matrix = get_matrix
+        self._lists_path = os.path.join(directory, self.LISTS_FILE)
+        self.centroids = self._load_centroids(os.path.join(directory, self.CENTROIDS_FILE), ids, nlist)
+        self.nprobe = max(1, min(nprobe, len(self.centroids)))
+
+        ids = np.asarray(ids, dtype=np.int64)
+        self._list_of = np.full(int(ids.max()) + 1 if len(ids) else 0, -1, dtype=np.int32)
+        stored = np.fromfile(self._lists_path, dtype=np.int32) if os.path.exists(self._lists_path) else []
+        known = ids[ids < len(stored)]
+        self._list_of[known] = np.asarray(stored, dtype=np.int32)[known] - 1
+        missing = ids[self._list_of[ids] < 0]
+        if len(missing):
+            self._list_of[missing] = self._assign(missing)
+
+        order = ids[np.argsort(self._list_of[ids], kind='stable')]
+        bounds = np.searchsorted(self._list_of[order], np.arange(1, len(self.centroids)))
+        self._lists = np.split(order, bounds)
+        self._count = len(ids)
+
+    def _load_centroids(self, path, ids, nlist):
+        """Centroids from path, trained and written there first if no worker has yet"""
+        if not os.path.exists(path):
+            matrix = self._get_matrix()
+            if nlist <= 0:
+                nlist = int(np.sqrt(len(ids)))
+            nlist = max(1, min(nlist, len(ids)))
+            sample = np.random.RandomState(0).choice(ids, min(len(ids), nlist * 64), replace=False)
+            centroids = _train_centroids(np.asarray(matrix[np.sort(sample)], dtype=np.float32), nlist)
+            partial = f'{path}.{os.getpid()}'
+            centroids.tofile(partial)
+            try:
+                # Linking never replaces an existing file: if another worker got
+                # there first, its centroids win and these are dropped
+                os.link(partial, path)
+            except FileExistsError:
+                pass
+            finally:
+                os.remove(partial)
+        return np.fromfile(path, dtype=np.float32).reshape(-1, self.dim)
+
+    def _assign(self, ids):
+        """Nearest list of every row in ids (ascending), written to the lists file for other workers"""
+        lists = np.empty(len(ids), dtype=np.int32)
+        if len(ids) == 0:
+            return lists
+        matrix = self._get_matrix()
+        for start in range(0, len(ids), 4096):
+            chunk = ids[start:start + 4096]
+            lists[start:start + len(chunk)] = (np.asarray(matrix[chunk]) @ self.centroids.T).argmax(axis=1)
+
+        # Every worker computes the same lists from the same centroids, so
+        # concurrent writes of one row agree; holes left by sparse writes read as 0
+        open(self._lists_path, 'ab').close()
+        with open(self._lists_path, 'r+b') as f:
+            for run in np.split(np.arange(len(ids)), np.nonzero(np.diff(ids) != 1)[0] + 1):
+                f.seek(int(ids[run[0]]) * 4)
+                f.write((lists[run] + 1).astype(np.int32).tobytes())
+        return lists
+
+    def __len__(self):
+        return self._count
+
+    def add(self, face_id, vector=None):
+        self.add_many([face_id])
+
+    def add_many(self, ids, vectors=None):
+        ids = np.unique(np.asarray(ids, dtype=np.int64))
+        if len(ids) == 0:
+            return
+        if ids[-1] >= len(self._list_of):
+            grown = np.full(max(int(ids[-1]) + 1, len(self._list_of) * 2), -1, dtype=np.int32)
+            grown[:len(self._list_of)] = self._list_of
+            self._list_of = grown
+        ids = ids[self._list_of[ids] < 0]
+        lists = self._assign(ids)
+        self._list_of[ids] = lists
+        for bucket in np.unique(lists):
+            self._lists[bucket] = np.concatenate([self._lists[bucket], ids[lists == bucket]])
+        self._count += len(ids)
+
+    def remove(self, face_id):
+        if face_id < len(self._list_of) and self._list_of[face_id] >= 0:
+            bucket = self._list_of[face_id]
+            self._lists[bucket] = self._lists[bucket][self._lists[bucket] != face_id]
+            self._list_of[face_id] = -1
+            self._count -= 1
+
+    def items(self):
+        ids = np.sort(np.concatenate(self._lists))
+        return ids, np.asarray(self._get_matrix()[ids], dtype=np.float32)
+
+    def _probed(self, queries):
+        """(list, queries probing it, those rows' descriptors) for every non-empty probed list"""
+        coarse = queries @ self.centroids.T
+        probes = np.argpartition(-coarse, self.nprobe - 1, axis=1)[:, :self.nprobe]
+        matrix = self._get_matrix()
+        for bucket in np.unique(probes):
+            ids = self._lists[bucket]
+            if len(ids):
+                members = np.nonzero((probes == bucket).any(axis=1))[0]
+                yield ids, members, np.asarray(matrix[ids])
+
+    def search(self, queries):
+        """Approximate nearest live row and its cosine similarity for every query row"""
+        best_ids = np.full(len(queries), -1, dtype=np.int64)
+        best_scores = np.full(len(queries), -np.inf, dtype=np.float32)
+        for ids, members, vectors in self._probed(queries):
+            scores = queries[members] @ vectors.T
+            best = scores.argmax(axis=1)
+            found = scores[np.arange(len(best)), best]
+            better = found > best_scores[members]
+            best_ids[members[better]] = ids[best[better]]
+            best_scores[members[better]] = found[better]
+        best_scores[best_ids < 0] = 0.0
+        return best_ids, best_scores
+
+    def search_k(self, queries, k):
+        """Approximate k nearest live rows and their similarities for every query row, best first"""
+        top_ids, top_scores = _empty_top(queries, k)
+        for ids, members, vectors in self._probed(queries):
+            found_ids, found_scores = _top_k(ids, queries[members] @ vectors.T, k)
+            top_ids[members], top_scores[members] = _top_k(
+                np.concatenate([top_ids[members], found_ids], axis=1),
+                np.concatenate([top_scores[members], found_scores], axis=1), k)
+        return top_ids, top_scores
+
+
+class AutoIndex:
+    """Exact search until the gallery reaches a size threshold, IVF afterwards
+
+    switch(exact) builds the IVF index from the exact one; by default an
+    in-memory IVFIndex trained on copies of every descriptor.
+    """
+
+    def __init__(self, dim, threshold=IVF_THRESHOLD, exact=None, switch=None):
+        self.dim = dim
+        self.threshold = threshold
+        self._index = exact if exact is not None else BruteForceIndex(dim)
+        self._switch = switch if switch is not None else lambda exact: IVFIndex.train(*exact.items())
+
+    @property
+    def kind(self):
+        return self._index.kind
+
+    @property
+    def needs_vectors(self):
+        return self._index.needs_vectors
+
+    def __len__(self):
+        return len(self._index)
+
+    def add(self, face_id, vector):
+        self._index.add(face_id, vector)
+        self._maybe_switch()
+
+    def add_many(self, ids, vectors):
+        self._index.add_many(ids, vectors)
+        self._maybe_switch()
+
+    def _maybe_switch(self):
+        if self._index.kind == 'exact' and len(self._index) >= self.threshold:
+            self._index = self._switch(self._index)
+
+    def remove(self, face_id):
+        self._index.remove(face_id)
+
+    def items(self):
+        return self._index.items()
+
+    def search(self, queries):
+        return self._index.search(queries)
+
+    def search_k(self, queries, k):
+        return self._index.search_k(queries, k)
+
+
+def create_index(dim, kind=INDEX_KIND, exact=None, switch=None):
+    """Build an empty index of the configured kind, optionally around an existing exact index
+
+    switch is how 'auto' and 'ivf' build their IVF index from the exact one
+    (see AutoIndex); 'ivf' only differs in switching at IVF_MIN_FACES.
+    """
+    exact = exact if exact is not None else BruteForceIndex(dim)
+    if kind == 'exact':
+        return exact
+    if kind == 'auto':
+        return AutoIndex(dim, exact=exact, switch=switch)
+    if kind == 'ivf':
+        return AutoIndex(dim, threshold=IVF_MIN_FACES, exact=exact, switch=switch)
+    raise ValueError(f"Unknown face index kind: {kind} (FACE_INDEX must be one of {', '.join(INDEX_KINDS)})")
@@ -0,0 +1,277 @@
+"""
+Output encoding for processed images
+Picks between the legacy base64-in-JSON response and raw image bytes from
+the request's Accept header, chooses the codec and its speed/size settings,
+and encodes images for either
+"""
+import base64
+import io
+import os
+import struct
+import time
+import zlib
+
+import startup
+
+# Only the streaming PNG encoder needs numpy, and only 'auto' needs PIL by name;
+# importing this module for its constants stays cheap
+np = startup.lazy_import('numpy')
+Image = startup.lazy_import('PIL.Image')
+
+JSON_MIMETYPE = 'application/json'
+
+# Binary response formats a client can ask for with the Accept header
+FORMATS = {
+    'image/png': 'PNG',
+    'image/jpeg': 'JPEG',
+    'image/webp': 'WEBP',
+}
+MIMETYPES = {fmt: mimetype for mimetype, fmt in FORMATS.items()}
+
+# Values accepted in the 'format' form field and OUTPUT_FORMAT
+FORMAT_NAMES = {'png': 'PNG', 'jpeg': 'JPEG', 'jpg': 'JPEG', 'webp': 'WEBP', 'auto': 'auto'}
+
+# Server-wide defaults; each can be overridden per request with a form field
+OUTPUT_FORMAT = os.environ.get('OUTPUT_FORMAT', 'png').lower()
+PNG_COMPRESS_LEVEL = int(os.environ.get('PNG_COMPRESS_LEVEL', 6))
+JPEG_QUALITY = int(os.environ.get('JPEG_QUALITY', 85))
+WEBP_QUALITY = int(os.environ.get('WEBP_QUALITY', 80))
+WEBP_METHOD = int(os.environ.get('WEBP_METHOD', 4))
+WEBP_LOSSLESS = os.environ.get('WEBP_LOSSLESS', '0') == '1'
+
+# 'auto' picks PNG when a 64px thumbnail has at most this many colours
+FLAT_MAX_COLORS = 32
+
+# Sent with binary responses; listed for CORS so browser code can read them
+METADATA_HEADERS = ['X-Process-Type', 'X-Image-Width', 'X-Image-Height', 'X-Image-Mode',
+                    'X-Encode-Time-Ms', 'X-Encoded-Bytes', 'X-Cache', 'ETag', 'X-Batch-Count', 'Retry-After',
+                    'X-Downscale', 'X-Tiles', 'X-Profile-Id']
+
+
+def negotiate(accept_mimetypes):
+    """Pillow format for a binary response, or None for the JSON default
+
+    JSON is listed first so '*/*' and a missing Accept header (what
+    script.js sends) keep getting the JSON shape.
+    """
+    best = accept_mimetypes.best_match([JSON_MIMETYPE] + list(FORMATS))
+    return FORMATS.get(best)
+
+
+def _clamp(value, low, high):
+    return max(low, min(high, value))
+
+
+def _has_alpha(image):
+    return 'A' in image.mode or 'transparency' in image.info
+
+
+def _auto_format(image, chain):
+    """PNG for line art and flat graphics, lossy for photographic content"""
+    if any(spec.lossless_output for spec in chain):
+        return 'PNG'
+
+    # Few distinct colours on a thumbnail means flat graphics that PNG compresses well.
+    # Nearest-neighbour sampling adds no blended edge colours, so line art stays
+    # at a handful while a grayscale or sepia photo still shows hundreds of tones
+    sample = image.copy()
+    sample.thumbnail((64, 64), Image.NEAREST, reducing_gap=None)
+    if sample.getcolors(maxcolors=FLAT_MAX_COLORS) is not None:
+        return 'PNG'
+    return 'WEBP' if _has_alpha(image) else 'JPEG'
+
+
+def choose_output(form, binary_format, chain, image):
+    """Pick the output format and Pillow save options for one response
+
+    An image type from the Accept header wins; otherwise the 'format' form
+    field, then OUTPUT_FORMAT. 'quality', 'compress_level', 'lossless' and
+    'method' form fields tune the chosen codec.
+    """
+    fmt = binary_format
+    if fmt is None:
+        requested = (form.get('format') or OUTPUT_FORMAT).lower()
+        fmt = FORMAT_NAMES.get(requested, FORMAT_NAMES.get(OUTPUT_FORMAT, 'PNG'))
+    if fmt == 'auto':
+        fmt = _auto_format(image, chain)
+
+    if fmt == 'PNG':
+        level = form.get('compress_level', default=PNG_COMPRESS_LEVEL, type=int)
+        return fmt, {'compress_level': _clamp(level, 0, 9)}
+    if fmt == 'JPEG':
+        quality = form.get('quality', default=JPEG_QUALITY, type=int)
+        return fmt, {'quality': _clamp(quality, 1, 100)}
+
+    lossless = form.get('lossless', default='1' if WEBP_LOSSLESS else '0') in ('1', 'true')
+    quality = form.get('quality', default=WEBP_QUALITY, type=int)
+    method = form.get('method', default=WEBP_METHOD, type=int)
+    return fmt, {'lossless': lossless, 'quality': _clamp(quality, 1, 100), 'method': _clamp(method, 0, 6)}
+
+
+def _convert_for(image, fmt):
+    """Convert to a mode the target format can store"""
+    if fmt == 'JPEG' and image.mode not in ('L', 'RGB', 'CMYK'):
+        return image.convert('L' if image.mode in ('1', 'LA', 'I', 'F') else 'RGB')
+    if fmt == 'WEBP' and image.mode not in ('RGB', 'RGBA'):
+        return image.convert('RGBA' if _has_alpha(image) else 'RGB')
+    return image
+
+
+def encode(image, fmt='PNG', **save_options):
+    """Encode an image into a rewound BytesIO"""
+    buffer = io.BytesIO()
+    _convert_for(image, fmt).save(buffer, format=fmt, **save_options)
+    buffer.seek(0)
+    return buffer
+
+
+def encode_timed(image, fmt='PNG', save_options=None):
+    """Encode an image and report what it cost: (buffer, {'format', 'bytes', 'encode_ms'})"""
+    start = time.perf_counter()
+    buffer = encode(image, fmt, **(save_options or {}))
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    return buffer, {
+        'format': fmt.lower(),
+        'bytes': buffer.getbuffer().nbytes,
+        'encode_ms': round(elapsed_ms, 2),
+        'options': save_options or {},
+    }
+
+
+def to_data_url(data, fmt='PNG'):
+    """Wrap encoded bytes as a data: URL for the JSON response"""
+    encoded = base64.b64encode(data).decode('utf-8')
+    return f"data:{MIMETYPES[fmt]};base64,{encoded}"
+
+
+def metadata_headers(process_type, width, height, mode, encoding=None):
+    """Headers describing a binary response"""
+    headers = {
+        'X-Process-Type': process_type,
+        'X-Image-Width': str(width),
+        'X-Image-Height': str(height),
+        'X-Image-Mode': mode,
+    }
+    if encoding:
+        headers['X-Encode-Time-Ms'] = str(encoding['encode_ms'])
+        headers['X-Encoded-Bytes'] = str(encoding['bytes'])
+    return headers
+
+
+# Pillow modes png_stream can write, and their PNG colour types
+PNG_COLOR_TYPES = {'L': 0, 'RGB': 2, 'LA': 4, 'RGBA': 6}
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+PNG_BLOCK_ROWS = 16      # scanlines filtered at a time, bounding the filter's temporaries
+ADLER_BASE = 65521
+
+
+def _png_chunk(kind, data):
+    return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data))
+
+
+def _adler32_combine(adler1, adler2, length2):
+    """Adler-32 of two byte strings joined, from their separate checksums (zlib's adler32_combine)"""
+    remainder = length2 % ADLER_BASE
+    sum1 = adler1 & 0xFFFF
+    sum2 = (remainder * sum1) % ADLER_BASE
+    sum1 = (sum1 + (adler2 & 0xFFFF) + ADLER_BASE - 1) % ADLER_BASE
+    sum2 = (sum2 + (adler1 >> 16) + (adler2 >> 16) + ADLER_BASE - remainder) % ADLER_BASE
+    return sum1 | (sum2 << 16)
+
+
+def _filter_rows(rows, previous, channels):
+    """PNG-filter a block of scanlines, each prefixed with its filter type byte
+
+    Every filter's predictor reads only unfiltered neighbours, so all five
+    are computed for whole rows at once, one filter at a time, and each row
+    keeps the one with the smallest sum of absolute values, the heuristic
+    libpng and Pillow use.
+    """
+    raw = rows.astype(np.int16)
+    up = np.vstack([previous[None].astype(np.int16), raw[:-1]])
+    left = np.zeros_like(raw)
+    left[:, channels:] = raw[:, :-channels]
+    up_left = np.zeros_like(raw)
+    up_left[:, channels:] = up[:, :-channels]
+
+    estimate = left + up - up_left
+    pa, pb, pc = np.abs(estimate - left), np.abs(estimate - up), np.abs(estimate - up_left)
+    paeth = np.where((pa <= pb) & (pa <= pc), left, np.where(pb <= pc, up, up_left))
+
+    chosen, choice, best = None, None, None
+    for kind, predictor in enumerate((0, left, up, (left + up) >> 1, paeth)):
+        filtered = ((raw - predictor) & 0xFF).astype(np.uint8)
+        score = np.abs(filtered.view(np.int8).astype(np.int16)).sum(axis=1)
+        if chosen is None:
+            chosen, choice, best = filtered, np.zeros(len(rows), np.uint8), score
+            continue
+        better = score < best
+        chosen[better], choice[better], best[better] = filtered[better], kind, score[better]
+    return np.hstack([choice[:, None], chosen])
+
+
+def _rows(image, top, bottom):
+    """Scanlines top..bottom of an image as a (rows, bytes per row) uint8 array"""
+    return np.asarray(image.crop((0, top, image.width, bottom))).reshape(bottom - top, -1)
+
+
+def _deflate_strip(strip, previous, channels, level, last):
+    """Filter and raw-deflate one strip image; returns (data, adler32 of the input, input length)
+
+    Strips end on a byte boundary (Z_SYNC_FLUSH), so independently
+    compressed strips concatenate into one valid deflate stream.
+    """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+    chunks, adler, length = [], 1, 0
+    for top in range(0, strip.height, PNG_BLOCK_ROWS):
+        block = _rows(strip, top, min(strip.height, top + PNG_BLOCK_ROWS))
+        filtered = _filter_rows(block, previous, channels).tobytes()
+        previous = block[-1]
+        adler = zlib.adler32(filtered, adler)
+        length += len(filtered)
+        chunks.append(compressor.compress(filtered))
+    chunks.append(compressor.flush(zlib.Z_FINISH if last else zlib.Z_SYNC_FLUSH))
+    return b''.join(chunks), adler, length
+
+
+def png_stream(strips, width, height, mode, compress_level=PNG_COMPRESS_LEVEL, pool=None):
+    """Encode a PNG from (top, strip image) pairs in order, yielding bytes as they are ready
+
+    For outputs produced a strip at a time (see tiling.iter_strips): only the
+    strips being compressed are held, never the whole image or file. With a
+    work pool, strips are filtered and compressed in parallel, pigz-style.
+    """
+    channels = len(mode)
+    level = _clamp(compress_level, 0, 9)
+    yield PNG_SIGNATURE + _png_chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8,
+                                                           PNG_COLOR_TYPES[mode], 0, 0, 0))
+    yield _png_chunk(b'IDAT', b'\x78\x9c')  # zlib header: deflate, 32K window
+
+    def compressed(parts):
+        adler = 1
+        for data, part_adler, length in parts:
+            adler = _adler32_combine(adler, part_adler, length)
+            if data:
+                yield _png_chunk(b'IDAT', data)
+        yield _png_chunk(b'IDAT', struct.pack('>I', adler)) + _png_chunk(b'IEND', b'')
+
+    def parts():
+        previous = np.zeros(width * channels, np.uint8)
+        pending = []
+        remaining = height
+        for _, strip in strips:
+            if strip.mode != mode:
+                strip = strip.convert(mode)
+            remaining -= strip.height
+            args = (strip, previous, channels, level, remaining == 0)
+            previous = _rows(strip, strip.height - 1, strip.height)[0]
+            if pool is None:
+                yield _deflate_strip(*args)
+                continue
+            pending.append(pool.submit(_deflate_strip, *args, block=True))
+            if len(pending) > pool.workers:
+                yield pending.pop(0).result()
+        for future in pending:
+            yield future.result()
+
+    yield from compressed(parts())
@@ -0,0 +1,163 @@
+"""
+Filter registry shared by backend/app.py and serve_app.py
+Each filter declares how expensive it is, which Pillow modes it accepts,
+whether it may run on a downscaled proxy, whether its output needs a
+lossless codec and how many neighbouring pixels it reads (its halo, for
+tiled execution); requests dispatch and chain through it
+"""
+from PIL import Image, ImageEnhance, ImageFilter
+
+import metrics
+
+# Cost classes, cheapest first
+COST_POINT = 'point'              # one lookup per pixel
+COST_GLOBAL = 'global'            # per-pixel, but needs a statistic of the whole image
+COST_CONVOLUTION = 'convolution'  # small kernel neighbourhood per pixel
+
+ANY_MODE = None
+COLOR_MODES = ('L', 'LA', 'RGB', 'RGBA')
+
+DEFAULT_FILTER = 'grayscale'
+
+# Sepia tone as one lookup table per output channel, indexed by the grayscale value
+SEPIA_LUTS = (
+    [min(255, int(v * 1.0)) for v in range(256)],
+    [min(255, int(v * 0.8)) for v in range(256)],
+    [min(255, int(v * 0.6)) for v in range(256)],
+)
+
+FILTERS = {}
+
+
+class FilterSpec:
+    """A registered filter and what the engine needs to know to schedule it"""
+
+    def __init__(self, name, func, cost, modes, proxy_safe, lossless_output, halo):
+        self.name = name
+        self.func = func
+        self.cost = cost
+        self.modes = modes
+        self.proxy_safe = proxy_safe
+        self.lossless_output = lossless_output
+        self.halo = halo
+
+    def apply(self, image):
+        if self.modes is not ANY_MODE and image.mode not in self.modes:
+            image = image.convert('RGBA' if _has_alpha(image) else 'RGB')
+        return self.func(image)
+
+    def describe(self):
+        return {
+            'name': self.name,
+            'cost': self.cost,
+            'modes': list(self.modes) if self.modes is not ANY_MODE else 'any',
+            'proxy_safe': self.proxy_safe,
+            'lossless_output': self.lossless_output,
+            'tileable': self.halo is not None
+        }
+
+
+def register_filter(name, cost, modes=ANY_MODE, proxy_safe=False, lossless_output=False, halo=None):
+    """Decorator adding a function(image) -> image to the registry
+
+    lossless_output marks filters whose result (thin lines, hard edges) should
+    not go through a lossy codec when the output format is 'auto'. halo is
+    how many pixels around each output pixel the filter reads (0 for point
+    filters); None means it needs the whole image and cannot be tiled.
+    """
+    def decorator(func):
+        FILTERS[name] = FilterSpec(name, func, cost, modes, proxy_safe, lossless_output, halo)
+        return func
+    return decorator
+
+
+def _kernel_radius(kernel):
+    return kernel.filterargs[0][0] // 2
+
+
+def chain_halo(chain):
+    """Pixels of context the whole chain needs around a tile, or None if it cannot be tiled"""
+    if any(spec.halo is None for spec in chain):
+        return None
+    return sum(spec.halo for spec in chain)
+
+
+def _has_alpha(image):
+    return 'A' in image.mode or 'transparency' in image.info
+
+
+def tone_map(grayscale, luts):
+    """Map an 'L' image to RGB through per-channel lookup tables in a single pass"""
+    return grayscale.convert('RGB').point(luts[0] + luts[1] + luts[2])
+
+
+@register_filter('grayscale', COST_POINT, proxy_safe=True, halo=0)
+def grayscale(image):
+    return image.convert('L')
+
+
+@register_filter('sepia', COST_POINT, proxy_safe=True, halo=0)
+def sepia(image):
+    return tone_map(image.convert('L'), SEPIA_LUTS)
+
+
+@register_filter('brightness', COST_POINT, COLOR_MODES, proxy_safe=True, halo=0)
+def brightness(image):
+    return ImageEnhance.Brightness(image).enhance(1.3)
+
+
+@register_filter('contrast', COST_GLOBAL, COLOR_MODES, proxy_safe=True)
+def contrast(image):
+    return ImageEnhance.Contrast(image).enhance(1.2)
+
+
+@register_filter('blur', COST_CONVOLUTION, COLOR_MODES, halo=_kernel_radius(ImageFilter.BLUR))
+def blur(image):
+    return image.filter(ImageFilter.BLUR)
+
+
+@register_filter('sharpen', COST_CONVOLUTION, COLOR_MODES, halo=_kernel_radius(ImageFilter.SHARPEN))
+def sharpen(image):
+    return image.filter(ImageFilter.SHARPEN)
+
+
+@register_filter('edge', COST_CONVOLUTION, COLOR_MODES, lossless_output=True,
+                 halo=_kernel_radius(ImageFilter.FIND_EDGES))
+def edge(image):
+    return image.filter(ImageFilter.FIND_EDGES)
+
+
+def parse_chain(process_type):
+    """Split 'blur,sharpen,edge' into filter specs; unknown names fall back to grayscale"""
+    names = [name.strip() for name in (process_type or '').split(',') if name.strip()]
+    return [FILTERS.get(name, FILTERS[DEFAULT_FILTER]) for name in names or [DEFAULT_FILTER]]
+
+
+def apply_chain(image, chain, preview_size=None):
+    """Run every filter in order on one decoded image
+
+    With preview_size, the result is at most preview_size pixels on its longer
+    side. When the whole chain is proxy-safe the image is shrunk first so the
+    filters only touch the small proxy; otherwise they run at full resolution.
+    """
+    if preview_size and all(spec.proxy_safe for spec in chain):
+        image = _downscale(image, preview_size)
+        preview_size = None
+
+    for spec in chain:
+        with metrics.FILTER_SECONDS.time(spec.name):
+            image = spec.apply(image)
+
+    if preview_size:
+        image = _downscale(image, preview_size)
+    return image
+
+
+def _downscale(image, max_size):
+    if max(image.size) <= max_size:
+        return image
+    if image.mode == 'P':
+        image = image.convert('RGBA' if _has_alpha(image) else 'RGB')
+    image = image.copy()
+    image.thumbnail((max_size, max_size), Image.LANCZOS)
+    return image
@@ -0,0 +1,377 @@
+"""
+/process-image and /process-batch request handling shared by backend/app.py and serve_app.py
+Hashes the upload, answers from the result cache when it can, and otherwise
+decodes once, runs the filter chain, encodes once and caches the result
+"""
+import io
+import json
+import os
+import uuid
+import zipfile
+import zlib
+from concurrent.futures import FIRST_COMPLETED, wait
+
+from flask import Response, jsonify, make_response, send_file, stream_with_context
+from PIL import Image
+from werkzeug.datastructures import MultiDict
+
+import image_codecs
+import image_filters
+import metrics
+import profiling
+import tiling
+import upload_guard
+import work_pool
+
+# Form fields that change the output, and therefore the cache key and ETag
+OUTPUT_PARAMS = ('type', 'preview_size', 'format', 'quality', 'compress_level', 'lossless', 'method')
+
+# Images accepted in one /process-batch request
+BATCH_MAX_FILES = int(os.environ.get('BATCH_MAX_FILES', 100))
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.webp', '.bmp', '.gif', '.tif', '.tiff')
+EXTENSIONS = {'PNG': 'png', 'JPEG': 'jpg', 'WEBP': 'webp'}
+
+
+def render(image_data, form, binary_format):
+    """Decode, filter and encode one upload; returns (encoded bytes, response metadata)"""
+    process_type = form.get('type', 'grayscale')
+    chain = image_filters.parse_chain(process_type)
+    preview_size = form.get('preview_size', type=int)
+
+    # Dimensions are checked from the header first; oversized JPEGs may decode reduced
+    with metrics.stage('decode'):
+        image, info = upload_guard.open_image(image_data)
+        image.load()
+    profiling.annotate(filter=process_type, width=image.width, height=image.height, mode=image.mode,
+                       format=info.format, upload_bytes=len(image_data), downscale=info.reduction)
+    if tiling.should_tile(image.width, image.height, chain, preview_size):
+        with metrics.stage('filter_tiled'):
+            processed_image = tiling.apply_tiled(image, chain)
+    else:
+        processed_image = image_filters.apply_chain(image, chain, preview_size)
+
+    output_format, save_options = image_codecs.choose_output(form, binary_format, chain, processed_image)
+    with metrics.stage('encode'):
+        buffer, encoding = image_codecs.encode_timed(processed_image, output_format, save_options)
+    return buffer.getvalue(), {
+        'process_type': process_type,
+        'format': output_format,
+        'width': processed_image.width,
+        'height': processed_image.height,
+        'mode': processed_image.mode,
+        'encoding': encoding,
+        'downscale': info.reduction,
+    }
+
+
+@metrics.timed('decode')
+def _load(image_data):
+    image, info = upload_guard.open_image(image_data)
+    image.load()
+    return image, info
+
+
+def _tiled_png(image_data, form, pool):
+    """Binary PNG response for a large image, filtered in tiles and sent as each strip is encoded
+
+    Returns None when the request is not a tiling candidate. The result is
+    not cached: holding the whole output is what streaming avoids. The
+    filtering and encoding happen while the body is sent, after the work
+    pool has let go of the request, so streams take a tiling.TILE_MAX_STREAMS
+    slot instead, held until the response is closed; raises
+    work_pool.PoolFull when none is free.
+    """
+    chain = image_filters.parse_chain(form.get('type', 'grayscale'))
+    info = upload_guard.check(image_data)
+    width, height = -(-info.width // info.reduction), -(-info.height // info.reduction)
+    if not tiling.should_tile(width, height, chain, form.get('preview_size', type=int)):
+        return None
+
+    if not tiling.acquire_stream():
+        raise work_pool.PoolFull(tiling.get_pool().retry_after())
+    try:
+        response = _stream_tiled_png(image_data, form, pool, chain)
+    except BaseException:
+        tiling.release_stream()
+        raise
+    if response is None:
+        tiling.release_stream()
+    else:
+        response.call_on_close(tiling.release_stream)
+    return response
+
+
+def _stream_tiled_png(image_data, form, pool, chain):
+    """The streamed response; None when the chain's output mode has no PNG colour type"""
+    image, info = pool.run(_load, image_data)
+    profiling.annotate(filter=form.get('type', 'grayscale'), width=image.width, height=image.height,
+                       mode=image.mode, format=info.format, upload_bytes=len(image_data),
+                       downscale=info.reduction, tiles=tiling.tile_count(image.width, image.height))
+    mode = tiling.output_mode(image, chain)
+    if mode not in image_codecs.PNG_COLOR_TYPES:
+        return None
+    _, save_options = image_codecs.choose_output(form, 'PNG', chain, image)
+    stream = image_codecs.png_stream(tiling.iter_strips(image, chain), image.width, image.height,
+                                     mode, save_options['compress_level'], pool=tiling.get_pool())
+
+    response = Response(stream_with_context(stream), mimetype='image/png')
+    response.headers.update(image_codecs.metadata_headers(
+        form.get('type', 'grayscale'), image.width, image.height, mode))
+    response.headers['X-Tiles'] = str(tiling.tile_count(image.width, image.height))
+    response.headers['X-Downscale'] = str(info.reduction)
+    return response
+
+
+def sample_upload(size=64):
+    """A small JPEG, for warming up decode and detection at start-up"""
+    return image_codecs.encode(Image.new('RGB', (size, size), 'gray'), 'JPEG').getvalue()
+
+
+def warm_up(pool):
+    """Decode, filter and encode a small image once in every output format, loading Pillow's codecs"""
+    sample = sample_upload()
+    for output_format in image_codecs.MIMETYPES:
+        pool.run(render, sample, MultiDict({'type': 'grayscale'}), output_format)
+
+
+def cache_key(cache, image_data, form, binary_format):
+    params = [(name, form.get(name, '')) for name in OUTPUT_PARAMS]
+    params.append(('accept', binary_format or 'json'))
+    return cache.make_key(image_data, params)
+
+
+def process_request(request, cache, pool):
+    """Build the /process-image response for a request that has an 'image' file
+
+    Decoding, filtering and encoding run on the work pool; raises
+    work_pool.PoolFull when it has no room and upload_guard.UploadRejected
+    for uploads over the size limits.
+    """
+    # Clients whose Accept names an image type get the bytes raw, with metadata in headers
+    binary_format = image_codecs.negotiate(request.accept_mimetypes)
+    image_data = upload_guard.read_upload(request.files['image'])
+
+    key = cache_key(cache, image_data, request.form, binary_format)
+
+    # The key is derived from the input, so a matching ETag needs no processing at all
+    if request.if_none_match.contains(key):
+        cache.count('not_modified')
+        response = make_response('', 304)
+        response.set_etag(key)
+        response.vary.add('Accept')
+        return response
+
+    entry = cache.get(key)
+    if entry is None and binary_format == 'PNG':
+        # Very large images stream out strip by strip instead of being encoded whole
+        response = _tiled_png(image_data, request.form, pool)
+        if response is not None:
+            response.set_etag(key)
+            response.headers['X-Cache'] = 'BYPASS'
+            response.vary.add('Accept')
+            return response
+
+    cache_status = 'HIT'
+    if entry is None:
+        cache_status = 'MISS'
+        entry = cache.put(key, *pool.run(render, image_data, request.form, binary_format))
+
+    meta = entry.meta
+    if binary_format:
+        response = send_file(io.BytesIO(entry.data), mimetype=image_codecs.MIMETYPES[meta['format']])
+        response.headers.update(image_codecs.metadata_headers(
+            meta['process_type'], meta['width'], meta['height'], meta['mode'], meta['encoding']))
+    else:
+        # Default: data URL inside JSON, as script.js expects
+        with metrics.stage('serialize'):
+            response = jsonify({
+                "success": True,
+                "processed_image": image_codecs.to_data_url(entry.data, meta['format']),
+                "process_type": meta['process_type'],
+                "encoding": meta['encoding'],
+                "downscale": meta.get('downscale', 1),
+                "cache": cache_status.lower()
+            })
+
+    response.set_etag(key)
+    response.headers['X-Cache'] = cache_status
+    response.headers['X-Downscale'] = str(meta.get('downscale', 1))
+    response.vary.add('Accept')
+    return response
+
+
+def batch_inputs(request):
+    """(filename, bytes) for every 'images' file and every image inside an 'archive' zip
+
+    A generator, so zip members are only read as the pool has room for them.
+    A file over the upload byte limit is yielded as an UploadRejected instead
+    of its bytes; zip members are checked by their declared size before any
+    of them is inflated, and a member that fails to inflate is yielded as an
+    UploadRejected too, so the rest of the batch still streams out.
+    """
+    for file in request.files.getlist('images'):
+        try:
+            yield file.filename, upload_guard.read_upload(file)
+        except upload_guard.UploadRejected as e:
+            yield file.filename, e
+
+    archive = request.files.get('archive')
+    if archive is not None:
+        with zipfile.ZipFile(archive.stream) as zf:
+            for info in zf.infolist():
+                if info.is_dir() or not info.filename.lower().endswith(IMAGE_EXTENSIONS):
+                    continue
+                if info.file_size > upload_guard.MAX_UPLOAD_BYTES:
+                    yield info.filename, upload_guard.UploadRejected(
+                        'file_too_large', f"Image file is larger than the {upload_guard.MAX_UPLOAD_BYTES} byte limit")
+                    continue
+                try:
+                    data = zf.read(info)
+                except (zipfile.BadZipFile, zlib.error, OSError) as e:
+                    yield info.filename, upload_guard.UploadRejected(
+                        'corrupt_archive_member', f"Could not read {info.filename} from the archive: {e}", status=400)
+                    continue
+                yield info.filename, data
+
+
+def count_batch_inputs(request):
+    count = len(request.files.getlist('images'))
+    archive = request.files.get('archive')
+    if archive is not None:
+        with zipfile.ZipFile(archive.stream) as zf:
+            count += sum(1 for info in zf.infolist()
+                         if not info.is_dir() and info.filename.lower().endswith(IMAGE_EXTENSIONS))
+        archive.stream.seek(0)
+    return count
+
+
+def _render_cached(cache, image_data, form):
+    key = cache_key(cache, image_data, form, None)
+    entry = cache.get(key)
+    if entry is None:
+        entry = cache.put(key, *render(image_data, form, None))
+    return entry
+
+
+def _iter_results(request, cache, pool):
+    """Yield (index, filename, entry or exception) in completion order
+
+    At most twice the pool size is decoded or waiting at once, so memory stays
+    bounded however many images the batch holds. The batch was admitted as a
+    whole, so each image waits for a pool slot rather than being rejected.
+    """
+    form = request.form
+    max_in_flight = pool.workers * 2
+    pending = {}
+
+    def finished(done):
+        for future in done:
+            index, filename = pending.pop(future)
+            try:
+                yield index, filename, future.result()
+            except Exception as e:
+                yield index, filename, e
+
+    for index, (filename, image_data) in enumerate(batch_inputs(request)):
+        if isinstance(image_data, Exception):
+            yield index, filename, image_data
+            continue
+        if len(pending) >= max_in_flight:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            yield from finished(done)
+        future = pool.submit(_render_cached, cache, image_data, form, block=True)
+        pending[future] = (index, filename)
+
+    while pending:
+        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+        yield from finished(done)
+
+
+def _output_name(filename, entry):
+    stem = os.path.splitext(os.path.basename(filename or 'image'))[0]
+    return f"{stem}.{EXTENSIONS[entry.meta['format']]}"
+
+
+def _multipart_stream(results, boundary):
+    for index, filename, result in results:
+        if isinstance(result, Exception):
+            body = json.dumps({"error": str(result), "reason": getattr(result, 'reason', None),
+                               "filename": filename, "index": index}).encode()
+            headers = [('Content-Type', 'application/json')]
+        else:
+            body = result.data
+            headers = [
+                ('Content-Type', image_codecs.MIMETYPES[result.meta['format']]),
+                ('Content-Disposition', f'attachment; filename="{_output_name(filename, result)}"'),
+            ]
+            headers += image_codecs.metadata_headers(
+                result.meta['process_type'], result.meta['width'], result.meta['height'],
+                result.meta['mode'], result.meta['encoding']).items()
+        headers += [('X-Batch-Index', str(index)), ('Content-Length', str(len(body)))]
+
+        head = f"--{boundary}\r\n" + ''.join(f"{name}: {value}\r\n" for name, value in headers) + "\r\n"
+        yield head.encode() + body + b"\r\n"
+    yield f"--{boundary}--\r\n".encode()
+
+
+class _ChunkSink:
+    """Write-only file object for zipfile that hands each written chunk to the generator"""
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data, self.chunks = b''.join(self.chunks), []
+        return data
+
+
+def _zip_stream(results):
+    # The sink cannot seek, so zipfile writes data descriptors and each member streams out whole
+    sink = _ChunkSink()
+    with zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_STORED) as zf:
+        for index, filename, result in results:
+            if isinstance(result, Exception):
+                name = f"{index:04d}_{os.path.basename(filename or 'image')}.error.json"
+                zf.writestr(name, json.dumps({"error": str(result), "reason": getattr(result, 'reason', None),
+                                              "filename": filename}))
+            else:
+                zf.writestr(f"{index:04d}_{_output_name(filename, result)}", result.data)
+            yield sink.drain()
+    yield sink.drain()
+
+
+def process_batch(request, cache, pool):
+    """Stream every processed image back as it finishes: multipart/mixed by
+    default, or a zip when the client's Accept prefers application/zip"""
+    if not pool.has_capacity():
+        raise work_pool.PoolFull(pool.retry_after())
+
+    try:
+        count = count_batch_inputs(request)
+    except zipfile.BadZipFile:
+        return jsonify({"error": "Archive is not a valid zip file", "reason": "not_a_zip"}), 400
+    if count == 0:
+        return jsonify({"error": "No image files provided"}), 400
+    if count > BATCH_MAX_FILES:
+        return jsonify({"error": f"Too many images: {count} (limit {BATCH_MAX_FILES})"}), 400
+
+    results = _iter_results(request, cache, pool)
+    container = request.accept_mimetypes.best_match(['multipart/mixed', 'application/zip'])
+    if container == 'application/zip':
+        response = Response(stream_with_context(_zip_stream(results)), mimetype='application/zip')
+        response.headers['Content-Disposition'] = 'attachment; filename="processed.zip"'
+    else:
+        boundary = uuid.uuid4().hex
+        response = Response(stream_with_context(_multipart_stream(results, boundary)),
+                            content_type=f'multipart/mixed; boundary={boundary}')
+    response.headers['X-Batch-Count'] = str(count)
+    response.vary.add('Accept')
+    return response
@@ -0,0 +1,95 @@
+"""
+Paging helpers for the listing endpoints (/registered-faces, /attendance)
+Pages are addressed by an opaque cursor holding the sort key of the last row
+sent, so each page is one index range scan however deep it is. Clients can
+ask for a subset of fields, and for NDJSON, which streams one record per
+line from a generator instead of building the whole body in memory.
+"""
+import base64
+import binascii
+import itertools
+import json
+
+from flask import Response, stream_with_context
+
+NDJSON_MIMETYPE = 'application/x-ndjson'
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+
+def wants_ndjson(request):
+    """NDJSON when asked for with ?format=ndjson or an Accept header preferring it"""
+    if request.args.get('format') == 'ndjson':
+        return True
+    return request.accept_mimetypes.best_match(['application/json', NDJSON_MIMETYPE]) == NDJSON_MIMETYPE
+
+
+def page_size(request, default=DEFAULT_PAGE_SIZE):
+    return max(1, min(request.args.get('limit', default=default, type=int), MAX_PAGE_SIZE))
+
+
+def stream(request, records, fields):
+    """NDJSON response for every record, or only the first ?limit= ones if given"""
+    if 'limit' in request.args:
+        records = itertools.islice(records, page_size(request))
+    return ndjson_response(records, fields)
+
+
+def parse_fields(value, allowed):
+    """Requested field names from ?fields=a,b, or None for all; ValueError on unknown ones"""
+    if not value:
+        return None
+    fields = [field.strip() for field in value.split(',') if field.strip()]
+    unknown = [field for field in fields if field not in allowed]
+    if unknown:
+        raise ValueError(f"Unknown field(s): {', '.join(unknown)}; choose from {', '.join(allowed)}")
+    return fields
+
+
+def project(record, fields):
+    return record if fields is None else {field: record[field] for field in fields}
+
+
+def encode_cursor(key):
+    """Opaque token for the sort key of the last row on a page"""
+    return base64.urlsafe_b64encode(json.dumps(key, separators=(',', ':')).encode()).decode().rstrip('=')
+
+
+def decode_cursor(token, shape):
+    """Sort key from encode_cursor(); ValueError unless it has the expected shape
+
+    shape is the key's type, or a tuple of types for a composite key.
+    """
+    try:
+        key = json.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+    except (binascii.Error, ValueError, UnicodeDecodeError):
+        raise ValueError("Invalid cursor")
+    if isinstance(shape, tuple):
+        valid = (isinstance(key, list) and len(key) == len(shape)
+                 and all(isinstance(part, kind) for part, kind in zip(key, shape)))
+    else:
+        valid = isinstance(key, shape)
+    if not valid or isinstance(key, bool):
+        raise ValueError("Invalid cursor")
+    return key
+
+
+def paginate(records, limit, key):
+    """First `limit` records and the cursor for the next page (None on the last page)
+
+    Reads one record past the page from the generator to know whether there
+    is another page, without counting.
+    """
+    page = list(itertools.islice(records, limit + 1))
+    if len(page) <= limit:
+        return page, None
+    page.pop()
+    return page, encode_cursor(key(page[-1]))
+
+
+def ndjson_response(records, fields=None):
+    """Stream records, one JSON object per line, as the generator produces them"""
+    def generate():
+        for record in records:
+            yield json.dumps(project(record, fields)) + '\n'
+    return Response(stream_with_context(generate()), mimetype=NDJSON_MIMETYPE)
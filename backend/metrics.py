@@ -0,0 +1,260 @@
+"""
+Request and stage timing, exported in the Prometheus text format
+Routes, pipeline stages (multipart parsing, decode, detect, embed, filter,
+encode, serialization) and individual filters are timed into fixed-bucket
+histograms; an observation is a bisect and a few additions under a lock,
+so recording costs microseconds against requests that take milliseconds.
+Gauges for in-flight requests, pool queues and caches are read when
+/metrics is scraped. Values are per process: gunicorn runs one worker.
+"""
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+from flask import Response, g, request
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Seconds; fine at the low end for per-stage times, up to the gunicorn timeout
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 120.0)
+
+_registry = []
+
+
+def _labels(names, values):
+    if not names:
+        return ''
+    pairs = (f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+    return '{' + ','.join(pairs) + '}'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Histogram:
+    """Cumulative-bucket histogram keyed by label values"""
+
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, labelnames=(), buckets=BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}  # label values -> [bucket counts..., +Inf count, sum]
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def observe(self, value, *labelvalues):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labelvalues)
+            if series is None:
+                series = self._series[labelvalues] = [0] * (len(self.buckets) + 2)
+            series[index] += 1
+            series[-1] += value
+
+    @contextmanager
+    def time(self, *labelvalues):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *labelvalues)
+
+    def samples(self):
+        with self._lock:
+            series = {labels: list(values) for labels, values in self._series.items()}
+        for labelvalues, values in sorted(series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), values):
+                cumulative += count
+                yield (f'{self.name}_bucket',
+                       _labels(self.labelnames + ('le',), labelvalues + (_number(bound),)), cumulative)
+            yield f'{self.name}_count', _labels(self.labelnames, labelvalues), cumulative
+            yield f'{self.name}_sum', _labels(self.labelnames, labelvalues), round(values[-1], 6)
+
+
+class Counter:
+    """Monotonic count keyed by label values"""
+
+    kind = 'counter'
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def inc(self, *labelvalues, amount=1):
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = dict(self._values)
+        for labelvalues, value in sorted(values.items()):
+            yield self.name, _labels(self.labelnames, labelvalues), value
+
+
+class Gauge:
+    """Current value keyed by label values, set directly or read from callbacks at scrape time
+
+    Each collector() -> {label values tuple: value} is called on every
+    scrape. kind='counter' exports values a callback reads from an existing
+    running total (pool and cache counters) as a counter.
+    """
+
+    kind = 'gauge'
+
+    def __init__(self, name, help_text, labelnames=(), collect=None, kind='gauge'):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.kind = kind
+        self._collectors = [collect] if collect else []
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def add_collector(self, collect):
+        self._collectors.append(collect)
+
+    def inc(self, *labelvalues, amount=1):
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def dec(self, *labelvalues, amount=1):
+        self.inc(*labelvalues, amount=-amount)
+
+    def samples(self):
+        with self._lock:
+            values = dict(self._values)
+        for collect in self._collectors:
+            values.update(collect())
+        for labelvalues, value in sorted(values.items()):
+            yield self.name, _labels(self.labelnames, labelvalues), value
+
+
+REQUEST_SECONDS = Histogram('http_request_duration_seconds',
+                            'Time from request start to response, by route', ('route', 'method', 'status'))
+STAGE_SECONDS = Histogram('stage_duration_seconds', 'Time spent in each processing stage', ('stage',))
+FILTER_SECONDS = Histogram('filter_duration_seconds', 'Time spent applying each image filter', ('filter',))
+IN_FLIGHT = Gauge('http_requests_in_flight', 'Requests currently being handled, by route', ('route',))
+POOL_TASKS = Gauge('work_pool_tasks', 'Tasks running or queued on each work pool', ('pool', 'state'))
+POOL_EVENTS = Gauge('work_pool_tasks_total', 'Tasks completed, failed or rejected by each work pool',
+                    ('pool', 'outcome'), kind='counter')
+CACHE_EVENTS = Gauge('result_cache_events_total', 'Processed image cache lookups and evictions',
+                     ('event',), kind='counter')
+CACHE_BYTES = Gauge('result_cache_bytes', 'Bytes held in the in-memory result cache')
+
+
+@contextmanager
+def stage(name):
+    """Time a block as one processing stage"""
+    with STAGE_SECONDS.time(name):
+        yield
+
+
+def timed(name):
+    """Decorator timing every call of a function as one processing stage"""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with STAGE_SECONDS.time(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def observe_timings(timings):
+    """Record a route's timings dict ({'decode_ms': 4.2, ...}) as stage observations"""
+    for key, value in timings.items():
+        if key.endswith('_ms') and key != 'total_ms':
+            STAGE_SECONDS.observe(value / 1000, key[:-3])
+
+
+def watch_pool(name, pool):
+    """Export a WorkPool's running/queued gauges and outcome counters under pool=name"""
+    def tasks():
+        stats = pool.stats()
+        return {(name, 'running'): stats['running'], (name, 'queued'): stats['queued']}
+
+    def events():
+        stats = pool.stats()
+        return {(name, outcome): stats[outcome] for outcome in ('completed', 'failed', 'rejected')}
+
+    POOL_TASKS.add_collector(tasks)
+    POOL_EVENTS.add_collector(events)
+
+
+def watch_cache(cache):
+    """Export a ResultCache's counters and size"""
+    def events():
+        stats = cache.stats()
+        return {(event,): stats[event] for event in cache.counters}
+
+    CACHE_EVENTS.add_collector(events)
+    CACHE_BYTES.add_collector(lambda: {(): cache.stats()['bytes']})
+
+
+def parse_form():
+    """Parse the request's multipart body now, timed as the 'parse' stage"""
+    with stage('parse'):
+        return request.files
+
+
+def render():
+    """Every registered metric in the Prometheus text exposition format"""
+    lines = []
+    for metric in _registry:
+        samples = list(metric.samples())
+        if not samples:
+            continue
+        lines.append(f'# HELP {metric.name} {metric.help}')
+        lines.append(f'# TYPE {metric.name} {metric.kind}')
+        lines.extend(f'{name}{labels} {_number(value)}' for name, labels, value in samples)
+    return '\n'.join(lines) + '\n'
+
+
+def _route():
+    return request.url_rule.rule if request.url_rule is not None else 'unmatched'
+
+
+def instrument(app, path='/metrics'):
+    """Time every request of an app, count those in flight and serve the metrics at path"""
+
+    @app.before_request
+    def start_timer():
+        g.metrics_start = time.perf_counter()
+        g.metrics_route = _route()
+        IN_FLIGHT.inc(g.metrics_route)
+
+    @app.after_request
+    def record_request(response):
+        start = g.pop('metrics_start', None)
+        if start is not None:
+            REQUEST_SECONDS.observe(time.perf_counter() - start, g.metrics_route, request.method,
+                                    str(response.status_code))
+        return response
+
+    @app.teardown_request
+    def finish_request(error=None):
+        route = g.pop('metrics_route', None)
+        if route is not None:
+            IN_FLIGHT.dec(route)
+
+    @app.route(path, methods=['GET'])
+    def metrics_endpoint():
+        return Response(render(), content_type=CONTENT_TYPE)
@@ -0,0 +1,259 @@
+"""
+Opt-in stack-sampling profiler for single requests
+A request that sends X-Profile with the admin token (PROFILE_TOKEN), or any
+X-Profile header when PROFILE_REQUESTS=1, is profiled: a sampler thread
+records the stacks of the request thread and of every work pool thread doing
+work for it (cProfile would only see the request thread waiting on the
+pool). Stacks are kept in the folded format that flamegraph.pl, speedscope
+and inferno read, headed by '# key: value' lines with the image size,
+filter and timings, which those tools skip. The slowest PROFILE_KEEP
+profiles are kept in memory for download from /profiles.
+"""
+import heapq
+import hmac
+import itertools
+import os
+import sys
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from flask import Response, abort, g, jsonify, request
+
+PROFILE_TOKEN = os.environ.get('PROFILE_TOKEN', '')                         # admin token, sent as X-Profile
+PROFILE_REQUESTS = os.environ.get('PROFILE_REQUESTS', '0') == '1'           # any X-Profile header; dev only
+PROFILE_INTERVAL = float(os.environ.get('PROFILE_INTERVAL_MS', 5)) / 1000  # seconds between samples
+PROFILE_KEEP = int(os.environ.get('PROFILE_KEEP', 20))                      # slowest profiles kept
+
+HEADER = 'X-Profile'
+MIMETYPE = 'text/plain; charset=utf-8'
+
+_local = threading.local()
+
+
+class Profile:
+    """Folded stack counts for one request, from every thread that worked on it"""
+
+    def __init__(self, method, path, route):
+        self.id = uuid.uuid4().hex[:12]
+        self.method = method
+        self.path = path
+        self.route = route
+        self.started_at = time.time()
+        self.metadata = {}
+        self.stacks = {}     # folded stack -> samples
+        self.duration_ms = None
+        self.status = None
+        self._threads = {}   # thread ident -> role, the root frame of its stacks
+        self._lock = threading.Lock()
+        self._start = time.perf_counter()
+
+    def add_thread(self, ident, role):
+        with self._lock:
+            self._threads[ident] = role
+
+    def remove_thread(self, ident):
+        with self._lock:
+            self._threads.pop(ident, None)
+
+    def sample(self, frames):
+        with self._lock:
+            for ident, role in self._threads.items():
+                frame = frames.get(ident)
+                if frame is not None:
+                    stack = role + ';' + _fold(frame)
+                    self.stacks[stack] = self.stacks.get(stack, 0) + 1
+
+    def finish(self):
+        self.duration_ms = round((time.perf_counter() - self._start) * 1000, 2)
+
+    def summary(self):
+        return {
+            'id': self.id,
+            'method': self.method,
+            'path': self.path,
+            'route': self.route,
+            'status': self.status,
+            'started_at': time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(self.started_at)) + 'Z',
+            'duration_ms': self.duration_ms,
+            'samples': sum(self.stacks.values()),
+            'interval_ms': PROFILE_INTERVAL * 1000,
+            **self.metadata,
+        }
+
+    def folded(self):
+        """Folded stacks ('root;caller;callee count' per line) headed by the request's metadata"""
+        header = ''.join(f'# {key}: {value}\n' for key, value in self.summary().items())
+        with self._lock:
+            stacks = sorted(self.stacks.items())
+        return header + ''.join(f'{stack} {count}\n' for stack, count in stacks)
+
+
+def _fold(frame):
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+class _Sampler:
+    """One background thread sampling every active profile while there is any"""
+
+    def __init__(self):
+        self._profiles = set()
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+
+    def add(self, profile):
+        with self._lock:
+            self._profiles.add(profile)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._loop, name='profile-sampler', daemon=True)
+                self._thread.start()
+        self._wake.set()
+
+    def discard(self, profile):
+        with self._lock:
+            self._profiles.discard(profile)
+
+    def _loop(self):
+        while True:
+            with self._lock:
+                profiles = list(self._profiles)
+                if not profiles:
+                    self._wake.clear()
+            if not profiles:
+                self._wake.wait()
+                continue
+            frames = sys._current_frames()
+            for profile in profiles:
+                profile.sample(frames)
+            del frames
+            time.sleep(PROFILE_INTERVAL)
+
+
+_sampler = _Sampler()
+_slowest = []  # min-heap of (duration, sequence, profile), at most PROFILE_KEEP
+_slowest_lock = threading.Lock()
+_sequence = itertools.count()
+
+
+def current():
+    """The profile the calling thread is working for, or None"""
+    return getattr(_local, 'profile', None)
+
+
+@contextmanager
+def attach(profile):
+    """Sample the calling thread into profile for the duration of the block; a no-op for None
+
+    WorkPool runs every task under the profile of the thread that submitted it.
+    """
+    if profile is None:
+        yield
+        return
+    previous = current()
+    ident = threading.get_ident()
+    _local.profile = profile
+    profile.add_thread(ident, threading.current_thread().name.rsplit('_', 1)[0])
+    try:
+        yield
+    finally:
+        profile.remove_thread(ident)
+        _local.profile = previous
+
+
+def annotate(**fields):
+    """Attach metadata (image size, filter, preset...) to the current profile, if any"""
+    profile = current()
+    if profile is not None:
+        profile.metadata.update(fields)
+
+
+def _request_token():
+    """Token sent as X-Profile or as an Authorization bearer token; never from the URL, which ends up in logs"""
+    token = request.headers.get(HEADER)
+    if not token and request.authorization is not None and request.authorization.type == 'bearer':
+        token = request.authorization.token
+    return token
+
+
+def _authorized(value):
+    if PROFILE_TOKEN and value and hmac.compare_digest(value.encode(), PROFILE_TOKEN.encode()):
+        return True
+    return PROFILE_REQUESTS and bool(value)
+
+
+def _keep(profile):
+    with _slowest_lock:
+        entry = (profile.duration_ms, next(_sequence), profile)
+        if len(_slowest) < PROFILE_KEEP:
+            heapq.heappush(_slowest, entry)
+        elif PROFILE_KEEP:
+            heapq.heappushpop(_slowest, entry)
+
+
+def slowest():
+    """Kept profiles, slowest first"""
+    with _slowest_lock:
+        return [profile for _, _, profile in sorted(_slowest, key=lambda entry: entry[:2], reverse=True)]
+
+
+def instrument(app, prefix=''):
+    """Profile requests that opt in with the X-Profile header, and serve the kept profiles under prefix"""
+
+    @app.before_request
+    def start_profile():
+        if not (PROFILE_TOKEN or PROFILE_REQUESTS) or not _authorized(_request_token()):
+            return
+        route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        profile = Profile(request.method, request.path, route)
+        g.profile = profile
+        _local.profile = profile
+        profile.add_thread(threading.get_ident(), 'request')
+        _sampler.add(profile)
+
+    @app.after_request
+    def tag_response(response):
+        profile = g.get('profile')
+        if profile is not None:
+            profile.status = response.status_code
+            response.headers['X-Profile-Id'] = profile.id
+        return response
+
+    @app.teardown_request
+    def finish_profile(error=None):
+        # After a streamed body has been sent, so tiled PNG output is included
+        profile = g.pop('profile', None)
+        if profile is None:
+            return
+        profile.remove_thread(threading.get_ident())
+        _local.profile = None
+        _sampler.discard(profile)
+        profile.finish()
+        _keep(profile)
+
+    def check_token():
+        if not (PROFILE_TOKEN or PROFILE_REQUESTS):
+            abort(404)
+        if not _authorized(_request_token()):
+            abort(403)
+
+    @app.route(f'{prefix}/profiles', methods=['GET'])
+    def list_profiles():
+        check_token()
+        return jsonify({"success": True, "profiles": [profile.summary() for profile in slowest()]})
+
+    @app.route(f'{prefix}/profiles/<profile_id>', methods=['GET'])
+    def download_profile(profile_id):
+        check_token()
+        for profile in slowest():
+            if profile.id == profile_id:
+                response = Response(profile.folded(), mimetype=MIMETYPE)
+                response.headers['Content-Disposition'] = f'attachment; filename="profile-{profile.id}.folded"'
+                return response
+        return jsonify({"error": f"No kept profile {profile_id}"}), 404
@@ -0,0 +1,310 @@
+"""
+Face embeddings and gallery matching for the Face Recognition API
+Turns detected face crops into fixed-length float32 descriptors and matches
+them against every registered face through a nearest-neighbour index
+"""
+import functools
+import os
+import threading
+
+import cv2
+import numpy as np
+
+import gallery_index
+
+# Optional OpenCV DNN embedding model (ONNX, Torch .t7, ...); HOG is used when unset
+EMBEDDING_MODEL_PATH = os.environ.get('FACE_EMBEDDING_MODEL', '')
+EMBEDDING_INPUT_SIZE = int(os.environ.get('FACE_EMBEDDING_INPUT_SIZE', 112))
+EMBEDDING_SCALE = float(os.environ.get('FACE_EMBEDDING_SCALE', 1.0))
+# The model's descriptor size; when set, the model is first loaded by warm_up() rather than
+# probed at import, and a model that fails to load fails readiness instead of falling back to HOG
+EMBEDDING_DIM = int(os.environ.get('FACE_EMBEDDING_DIM', 0))
+
+# Cosine similarity needed to call a face known; defaults to the embedder's own value
+MATCH_THRESHOLD = os.environ.get('FACE_MATCH_THRESHOLD')
+# How far the best identity must score above the next-best one; defaults to the embedder's own value
+MATCH_MARGIN = os.environ.get('FACE_MATCH_MARGIN')
+# Nearest faces looked at to find the next-best identity (a person may be registered several times)
+MATCH_CANDIDATES = 8
+
+HOG_EMBEDDING_DIM = 128
+
+_hog_projection = None
+_local = threading.local()
+_factory = None
+_factory_lock = threading.Lock()
+_probed_dim = None
+
+
+def _l2_normalize(vectors):
+    """Scale each row to unit length so a dot product is a cosine similarity"""
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def align_faces(image, boxes, size, interpolation=cv2.INTER_AREA):
+    """Crop every (x, y, w, h) box and resample it to size x size, stacked into one (n, size, size[, 3]) batch
+
+    Haar boxes carry no landmarks, so alignment is position and scale only.
+    """
+    batch = np.empty((len(boxes), size, size) + image.shape[2:], dtype=image.dtype)
+    for i, (x, y, w, h) in enumerate(boxes):
+        batch[i] = cv2.resize(image[y:y + h, x:x + w], (size, size), interpolation=interpolation)
+    return batch
+
+
+def _get_hog_projection(input_dim):
+    """Fixed random projection from the raw HOG vector down to HOG_EMBEDDING_DIM"""
+    global _hog_projection
+    if _hog_projection is None:
+        # RandomState (not default_rng) so the stream, and therefore every stored
+        # descriptor, stays identical across NumPy versions and workers
+        rng = np.random.RandomState(250703)
+        projection = rng.standard_normal((input_dim, HOG_EMBEDDING_DIM)).astype(np.float32)
+        _hog_projection = projection / np.sqrt(HOG_EMBEDDING_DIM)
+    return _hog_projection
+
+
+class HogEmbedder:
+    """CPU fallback: HOG of an equalized 64x64 grayscale crop, projected to 128 dims
+
+    HOG describes edges, not identity: different people score about as close
+    as two shots of one person (see benchmark_match_threshold.py). The
+    threshold sits above the highest impostor score measured there, so a
+    match is rare but meaningful, and discriminative is False so attendance
+    is not recorded from it automatically.
+    """
+
+    name = 'hog-128'
+    dim = HOG_EMBEDDING_DIM
+    threshold = 0.8
+    margin = 0.05
+    discriminative = False
+
+    def __init__(self):
+        self._hog = cv2.HOGDescriptor((64, 64), (16, 16), (8, 8), (8, 8), 9)
+        self._projection = _get_hog_projection(self._hog.getDescriptorSize())
+
+    def embed(self, image, boxes):
+        """Return one unit-length float32 row per (x, y, w, h) box"""
+        gray = image if image.ndim == 2 else cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        return self.embed_aligned(align_faces(gray, boxes, 64))
+
+    def embed_aligned(self, crops):
+        """Descriptors for an (n, 64, 64) batch of grayscale crops, projected together"""
+        # OpenCV's HOG has no batch call; one compute over the crops stacked
+        # into a single image was measured no faster, so each crop is computed
+        # on its own and the batch is shared from projection onwards
+        features = np.empty((len(crops), self._hog.getDescriptorSize()), dtype=np.float32)
+        for i, crop in enumerate(crops):
+            features[i] = self._hog.compute(cv2.equalizeHist(crop)).ravel()
+
+        # HOG bins are all positive; centring them keeps unrelated faces near zero
+        features -= features.mean(axis=1, keepdims=True)
+        return _l2_normalize(features @ self._projection)
+
+
+class DnnEmbedder:
+    """OpenCV DNN embedding network loaded from a local model file"""
+
+    threshold = 0.4
+    margin = 0.05
+    discriminative = True
+
+    def __init__(self, model_path):
+        self._net = cv2.dnn.readNet(model_path)
+        self.name = self.model_name(model_path)
+        probe = np.zeros((EMBEDDING_INPUT_SIZE, EMBEDDING_INPUT_SIZE, 3), dtype=np.uint8)
+        self.dim = self.embed(probe, [(0, 0, EMBEDDING_INPUT_SIZE, EMBEDDING_INPUT_SIZE)]).shape[1]
+        if EMBEDDING_DIM and self.dim != EMBEDDING_DIM:
+            raise ValueError(f"{model_path} gives {self.dim}-dim descriptors, FACE_EMBEDDING_DIM is {EMBEDDING_DIM}")
+
+    @staticmethod
+    def model_name(model_path):
+        return 'dnn:' + os.path.basename(model_path)
+
+    def embed(self, image, boxes):
+        """Return one unit-length float32 row per (x, y, w, h) box, in a single forward pass"""
+        color = image if image.ndim == 3 else cv2.cvtColor(image, cv2.COLOR_GRAY2BGR)
+        # Bilinear, as blobFromImages resized the crops before they were aligned here
+        return self.embed_aligned(align_faces(color, boxes, EMBEDDING_INPUT_SIZE, cv2.INTER_LINEAR))
+
+    def embed_aligned(self, crops):
+        """Descriptors for an (n, size, size, 3) BGR batch in a single forward pass"""
+        blob = cv2.dnn.blobFromImages(list(crops), EMBEDDING_SCALE,
+                                      (EMBEDDING_INPUT_SIZE, EMBEDDING_INPUT_SIZE),
+                                      swapRB=True, crop=False)
+        self._net.setInput(blob)
+        output = self._net.forward().reshape(len(crops), -1)
+        return _l2_normalize(output.astype(np.float32))
+
+
+def _resolve_factory():
+    """Pick the embedder class once per process so every thread produces the same descriptors"""
+    global _factory, _probed_dim
+    with _factory_lock:
+        if _factory is None:
+            if EMBEDDING_MODEL_PATH and EMBEDDING_DIM:
+                _factory = functools.partial(DnnEmbedder, EMBEDDING_MODEL_PATH)
+            elif EMBEDDING_MODEL_PATH:
+                try:
+                    _probed_dim = DnnEmbedder(EMBEDDING_MODEL_PATH).dim
+                    _factory = functools.partial(DnnEmbedder, EMBEDDING_MODEL_PATH)
+                except cv2.error as e:
+                    print(f"⚠️ Could not load embedding model {EMBEDDING_MODEL_PATH}, using HOG: {e}")
+            if _factory is None:
+                _factory = HogEmbedder
+    return _factory
+
+
+def get_embedder():
+    """Return the calling thread's embedder, loading it on first use"""
+    embedder = getattr(_local, 'embedder', None)
+    if embedder is None:
+        embedder = _local.embedder = _resolve_factory()()
+    return embedder
+
+
+def get_embedder_class():
+    """The class every thread's embedder is an instance of, without building one"""
+    factory = _resolve_factory()
+    return getattr(factory, 'func', factory)
+
+
+def embedder_spec():
+    """(name, descriptor size) of the embedder every thread will build, without building one
+
+    Needs no model for HOG, or for a DNN model with FACE_EMBEDDING_DIM set;
+    otherwise the model was loaded once to check it works.
+    """
+    embedder_class = get_embedder_class()
+    if embedder_class is DnnEmbedder:
+        return DnnEmbedder.model_name(EMBEDDING_MODEL_PATH), EMBEDDING_DIM or _probed_dim
+    return embedder_class.name, embedder_class.dim
+
+
+def get_match_threshold():
+    """Similarity at or above which a match counts as a known face"""
+    if MATCH_THRESHOLD is not None:
+        return float(MATCH_THRESHOLD)
+    return get_embedder_class().threshold
+
+
+def get_match_margin():
+    """Lead the best identity needs over the next-best one for a match to count"""
+    if MATCH_MARGIN is not None:
+        return float(MATCH_MARGIN)
+    return get_embedder_class().margin
+
+
+def warm_up():
+    """Load the embedding model and run one descriptor through it"""
+    get_embedder().embed(np.zeros((64, 64), dtype=np.uint8), [(0, 0, 64, 64)])
+
+
+class FaceGallery:
+    """Registered faces: a FaceStore on disk plus a nearest-neighbour index over its descriptors
+
+    Other workers write to the same store, so every search first replays any
+    inserts or deletes committed since this worker last looked.
+    """
+
+    def __init__(self, store, kind=gallery_index.INDEX_KIND):
+        self.store = store
+        self._lock = threading.Lock()
+        exact = gallery_index.MappedIndex(store.dim, lambda: store.embeddings)
+        # Past the IVF threshold, search the same mapped rows through lists persisted in the store
+        switch = lambda exact: gallery_index.MappedIVFIndex(store.dim, lambda: store.embeddings,
+                                                            store.directory, exact.live_ids())
+        self._index = gallery_index.create_index(store.dim, kind, exact=exact, switch=switch)
+        self._seq = 0
+        self._version = None
+        self._sync(force=True)
+
+    def __len__(self):
+        return self.store.count()
+
+    @property
+    def names(self):
+        return self.store.names()
+
+    @property
+    def index_kind(self):
+        return self._index.kind
+
+    def _sync(self, force=False):
+        """Apply store changes made since the last sync; caller holds self._lock unless initialising"""
+        version = self.store.data_version()
+        if not force and version == self._version:
+            return
+        self._version = version
+
+        changes = self.store.changes_since(self._seq)
+        if not changes:
+            return
+        self.store.refresh()
+        added = [face_id for face_id, deleted, _ in changes if not deleted]
+        for face_id, deleted, _ in changes:
+            if deleted:
+                self._index.remove(face_id)
+        if added:
+            # A memory-mapped exact index reads rows in place; only IVF needs copies
+            vectors = None
+            if self._index.needs_vectors:
+                vectors = np.asarray(self.store.embeddings[added], dtype=np.float32)
+            self._index.add_many(added, vectors)
+        self._seq = changes[-1][2]
+
+    def add(self, name, embedding, location, crop=None):
+        """Persist and index one descriptor; returns the new face id"""
+        return self.add_many([(name, embedding, location, crop)])[0]
+
+    def add_many(self, faces):
+        """Persist and index (name, embedding, location, crop) faces together; returns their ids"""
+        face_ids = self.store.add_many(faces)
+        with self._lock:
+            self._sync(force=True)
+        return face_ids
+
+    def remove_name(self, name):
+        """Forget every face registered under a name and return their ids"""
+        face_ids = self.store.delete_name(name)
+        with self._lock:
+            self._sync(force=True)
+        return face_ids
+
+    def match(self, embeddings, threshold, margin=0.0):
+        """Match every query row against the gallery in one index search
+
+        Returns a (name or None, similarity) pair per query row; name is None
+        when the best similarity is below threshold, when it does not beat
+        the best-scoring other person by at least margin, or when the gallery
+        is empty.
+        """
+        queries = np.asarray(embeddings, dtype=np.float32)
+        with self._lock:
+            self._sync()
+            if margin > 0:
+                candidate_ids, candidate_scores = self._index.search_k(queries, MATCH_CANDIDATES)
+            else:
+                face_ids, scores = self._index.search(queries)
+        if margin <= 0:
+            names = self.store.names_for(face_ids[scores >= threshold])
+            return [(names.get(int(face_id)) if score >= threshold else None, float(score))
+                    for face_id, score in zip(face_ids, scores)]
+
+        accepted = candidate_scores[:, 0] >= threshold
+        names = self.store.names_for(candidate_ids[accepted][candidate_ids[accepted] >= 0])
+        results = []
+        for ids, scores, ok in zip(candidate_ids, candidate_scores, accepted):
+            name = names.get(int(ids[0])) if ok else None
+            if name is not None:
+                # The next-best person; if every candidate is this person, the
+                # last candidate's score bounds anyone else's from above
+                others = [score for face_id, score in zip(ids[1:], scores[1:])
+                          if face_id >= 0 and names.get(int(face_id)) != name]
+                runner_up = others[0] if others else scores[-1]
+                if scores[0] - runner_up < margin:
+                    name = None
+            results.append((name, float(scores[0]) if ids[0] >= 0 else 0.0))
+        return results
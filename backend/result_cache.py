@@ -0,0 +1,189 @@
+"""
+Content-addressed cache of processed images
+Keys are a hash of the uploaded bytes plus every parameter that affects the
+output; values are the encoded result. A byte-capped in-memory LRU sits in
+front of an optional directory that every worker can share.
+"""
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+# Bump when a filter or codec change would make old cached results wrong
+CACHE_VERSION = '1'
+
+
+class CacheEntry:
+    """Encoded result bytes plus what is needed to rebuild the response"""
+
+    def __init__(self, data, meta):
+        self.data = data
+        self.meta = meta
+
+    @property
+    def size(self):
+        return len(self.data)
+
+
+class ResultCache:
+    """Byte-capped LRU with an optional shared on-disk tier"""
+
+    def __init__(self, max_bytes, disk_dir=None, disk_max_bytes=1 << 30):
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir
+        self.disk_max_bytes = disk_max_bytes
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._disk_writes = 0
+        self.counters = {
+            'memory_hits': 0,
+            'disk_hits': 0,
+            'misses': 0,
+            'evictions': 0,
+            'disk_evictions': 0,
+            'not_modified': 0,
+        }
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    @staticmethod
+    def make_key(data, params):
+        """Hex digest of the upload and the (name, value) parameters that shape the output"""
+        digest = hashlib.blake2b(digest_size=20)
+        digest.update(CACHE_VERSION.encode())
+        digest.update(json.dumps(sorted(params), separators=(',', ':')).encode())
+        digest.update(data)
+        return digest.hexdigest()
+
+    def count(self, counter):
+        with self._lock:
+            self.counters[counter] += 1
+
+    def get(self, key):
+        """Cached entry for a key, promoting disk hits into memory, or None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.counters['memory_hits'] += 1
+                return entry
+
+        entry = self._read_disk(key)
+        with self._lock:
+            if entry is None:
+                self.counters['misses'] += 1
+                return None
+            self.counters['disk_hits'] += 1
+            self._remember(key, entry)
+        return entry
+
+    def put(self, key, data, meta):
+        """Store an encoded result in memory and, if configured, on disk"""
+        entry = CacheEntry(data, meta)
+        with self._lock:
+            self._remember(key, entry)
+        self._write_disk(key, entry)
+        return entry
+
+    def _remember(self, key, entry):
+        """Insert into the memory tier and evict least recently used entries; caller holds the lock"""
+        if entry.size > self.max_bytes:
+            return
+        previous = self._entries.pop(key, None)
+        if previous is not None:
+            self._bytes -= previous.size
+        self._entries[key] = entry
+        self._bytes += entry.size
+        while self._bytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= evicted.size
+            self.counters['evictions'] += 1
+
+    def _disk_paths(self, key):
+        folder = os.path.join(self.disk_dir, key[:2])
+        return folder, os.path.join(folder, key + '.bin'), os.path.join(folder, key + '.json')
+
+    def _read_disk(self, key):
+        if not self.disk_dir:
+            return None
+        _, data_path, meta_path = self._disk_paths(key)
+        try:
+            with open(meta_path) as f:
+                meta = json.load(f)
+            with open(data_path, 'rb') as f:
+                data = f.read()
+            os.utime(data_path)  # recently used files survive trimming
+        except (OSError, ValueError):
+            return None
+        return CacheEntry(data, meta)
+
+    def _write_disk(self, key, entry):
+        """Write both files atomically so other workers never read half an entry"""
+        if not self.disk_dir or entry.size > self.disk_max_bytes:
+            return
+        folder, data_path, meta_path = self._disk_paths(key)
+        try:
+            os.makedirs(folder, exist_ok=True)
+            for path, payload in ((data_path, entry.data), (meta_path, json.dumps(entry.meta).encode())):
+                fd, tmp_path = tempfile.mkstemp(dir=folder)
+                with os.fdopen(fd, 'wb') as f:
+                    f.write(payload)
+                os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"⚠️ Could not write result cache entry {key}: {e}")
+            return
+
+        with self._lock:
+            self._disk_writes += 1
+            trim = self._disk_writes % 64 == 0
+        if trim:
+            self._trim_disk()
+
+    def _trim_disk(self):
+        """Delete the least recently used files until the directory fits disk_max_bytes"""
+        files = []
+        for root, _, names in os.walk(self.disk_dir):
+            for name in names:
+                if name.endswith('.bin'):
+                    path = os.path.join(root, name)
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue
+                    files.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.disk_max_bytes:
+                break
+            for stale in (path, path[:-len('.bin')] + '.json'):
+                try:
+                    os.remove(stale)
+                except OSError:
+                    pass
+            total -= size
+            self.count('disk_evictions')
+
+    def stats(self):
+        with self._lock:
+            lookups = self.counters['memory_hits'] + self.counters['disk_hits'] + self.counters['misses']
+            hits = lookups - self.counters['misses']
+            return dict(self.counters,
+                        entries=len(self._entries),
+                        bytes=self._bytes,
+                        max_bytes=self.max_bytes,
+                        disk_dir=self.disk_dir,
+                        hit_rate=round(hits / lookups, 4) if lookups else 0.0,
+                        pid=os.getpid())
+
+
+def from_environment():
+    """Cache configured by RESULT_CACHE_BYTES, RESULT_CACHE_DIR and RESULT_CACHE_DISK_BYTES"""
+    return ResultCache(
+        max_bytes=int(os.environ.get('RESULT_CACHE_BYTES', 64 << 20)),
+        disk_dir=os.environ.get('RESULT_CACHE_DIR') or None,
+        disk_max_bytes=int(os.environ.get('RESULT_CACHE_DISK_BYTES', 1 << 30))
+    )
@@ -0,0 +1,126 @@
+"""
+Fast worker start
+Heavy libraries can be imported on first use through lazy_import(), and
+model loading, pool threads and codecs are warmed up on a background thread
+(STARTUP_WARMUP=background, the default) so a worker binds its port and
+answers the liveness check at once. /healthz only says the process is up;
+/readyz answers 503 until every warm-up step has finished, which is what a
+load balancer should route on. STARTUP_WARMUP=blocking runs the steps
+before the app module finishes importing instead, and STARTUP_WARMUP=off
+skips them, leaving every first-use cost to the first requests.
+"""
+import importlib
+import os
+import threading
+import time
+import types
+
+from flask import jsonify
+
+STARTUP_WARMUP = os.environ.get('STARTUP_WARMUP', 'background').lower()  # 'background', 'blocking' or 'off'
+
+# When this module was first imported, close to when the worker started importing the app
+STARTED_AT = time.perf_counter()
+
+
+class _LazyModule(types.ModuleType):
+    """Stand-in for a module that is imported the first time one of its attributes is used"""
+
+    def __init__(self, name, on_load=None):
+        super().__init__(name)
+        self._on_load = on_load
+        self._lock = threading.Lock()
+
+    def _load(self):
+        with self._lock:
+            if '_module' not in self.__dict__:
+                module = importlib.import_module(self.__name__)
+                if self._on_load is not None:
+                    self._on_load(module)
+                # Later lookups find the module's attributes directly, without __getattr__
+                self.__dict__.update(module.__dict__)
+                self.__dict__['_module'] = module
+        return self.__dict__['_module']
+
+    def __getattr__(self, name):
+        return getattr(self._load(), name)
+
+
+def lazy_import(name, on_load=None):
+    """A module proxy that imports name, then calls on_load(module), on first attribute access"""
+    return _LazyModule(name, on_load)
+
+
+class Warmup:
+    """Named start-up steps, run once in order; ready when all of them have succeeded"""
+
+    def __init__(self):
+        self.steps = []
+        self.results = {}  # step name -> {'ms': ...} or {'error': ...}
+        self.ready_after_s = None
+        self._ready = threading.Event()
+        self._thread = None
+
+    def step(self, name, func):
+        self.steps.append((name, func))
+
+    def start(self, mode=STARTUP_WARMUP):
+        if mode == 'off':
+            self.steps = []
+            self._run()
+        elif mode == 'blocking':
+            self._run()
+        else:
+            self._thread = threading.Thread(target=self._run, name='warm-up', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        for name, func in self.steps:
+            start = time.perf_counter()
+            try:
+                func()
+            except Exception as e:
+                # A worker that cannot load its models must never report ready
+                self.results[name] = {'error': str(e)}
+                return
+            self.results[name] = {'ms': round((time.perf_counter() - start) * 1000, 1)}
+        self.ready_after_s = round(time.perf_counter() - STARTED_AT, 3)
+        self._ready.set()
+
+    def is_ready(self):
+        return self._ready.is_set()
+
+    def wait(self, timeout=None):
+        return self._ready.wait(timeout)
+
+    def status(self):
+        if self.is_ready():
+            state = 'ready'
+        elif any('error' in result for result in self.results.values()):
+            state = 'failed'
+        else:
+            state = 'starting'
+        return {
+            'status': state,
+            'steps': {name: self.results.get(name, 'pending') for name, _ in self.steps},
+            'ready_after_s': self.ready_after_s,
+            'uptime_s': round(time.perf_counter() - STARTED_AT, 3),
+        }
+
+
+def instrument(app, warmup, prefix=''):
+    """Serve liveness at {prefix}/healthz and readiness at {prefix}/readyz"""
+
+    @app.route(f'{prefix}/healthz', methods=['GET'])
+    def liveness():
+        return jsonify({"status": "alive"})
+
+    @app.route(f'{prefix}/readyz', methods=['GET'])
+    def readiness():
+        status = warmup.status()
+        if warmup.is_ready():
+            return jsonify(status)
+        response = jsonify(status)
+        response.status_code = 503
+        response.headers['Retry-After'] = '1'
+        return response
@@ -0,0 +1,134 @@
+"""
+Tiled filtering for very large images
+The image is cut into tiles, each padded by the filter chain's halo (the
+neighbouring pixels its kernels read), and the tiles are filtered in
+parallel on a small thread pool; Pillow releases the GIL while it filters.
+Results come back as full-width strips, top to bottom, so they can be
+encoded and sent as they finish. Working memory is a few strips, not the
+several full-size copies a whole-image filter chain makes. Interior tile
+edges fall inside the discarded halo, so the output is pixel-identical to
+filtering the whole image at once.
+"""
+import os
+import threading
+from collections import deque
+
+from PIL import Image
+
+import image_filters
+import metrics
+import work_pool
+
+TILE_SIZE = int(os.environ.get('TILE_SIZE', 512))                 # tile side in pixels
+TILE_MIN_PIXELS = int(os.environ.get('TILE_MIN_PIXELS', 16_000_000))  # smaller images are filtered whole
+TILE_WORKERS = int(os.environ.get('TILE_WORKERS', os.cpu_count() or 1))
+# Streamed tiled responses at once; each holds a decoded upload, so more are turned away with 503
+TILE_MAX_STREAMS = int(os.environ.get('TILE_MAX_STREAMS', 2))
+
+_pool = None
+_streams = threading.BoundedSemaphore(TILE_MAX_STREAMS)
+
+
+def get_pool():
+    """Thread pool shared by every tiled request, created on first use
+
+    Separate from the request work pool: a tiled render already holds one of
+    its threads and must not wait on it for its own tiles.
+    """
+    global _pool
+    if _pool is None:
+        _pool = work_pool.WorkPool(TILE_WORKERS, TILE_WORKERS * 2, thread_name_prefix='tile')
+        metrics.watch_pool('tile', _pool)
+    return _pool
+
+
+def acquire_stream():
+    """Take one of the TILE_MAX_STREAMS streaming slots; False when all are in use"""
+    return _streams.acquire(blocking=False)
+
+
+def release_stream():
+    _streams.release()
+
+
+def _forget_pool():
+    # A forked child has the pool object but none of its threads
+    global _pool
+    _pool = None
+
+
+os.register_at_fork(after_in_child=_forget_pool)
+
+
+def should_tile(width, height, chain, preview_size=None):
+    """Whether a request is worth tiling: a large image, a tileable chain, full-size output"""
+    return (not preview_size and width * height >= TILE_MIN_PIXELS
+            and image_filters.chain_halo(chain) is not None)
+
+
+def tile_count(width, height, tile_size=TILE_SIZE):
+    return -(-width // tile_size) * -(-height // tile_size)
+
+
+def output_mode(image, chain):
+    """Mode the chain's output will have, found by running it on a few pixels"""
+    return image_filters.apply_chain(image.crop((0, 0, min(image.width, 3), min(image.height, 3))), chain).mode
+
+
+def _filter_tile(image, chain, box, halo):
+    """Filter one tile with its halo and return the tile's own pixels"""
+    left, top, right, bottom = box
+    padded = (max(0, left - halo), max(0, top - halo),
+              min(image.width, right + halo), min(image.height, bottom + halo))
+    result = image.crop(padded)
+    for spec in chain:
+        result = spec.apply(result)
+    x, y = left - padded[0], top - padded[1]
+    return result.crop((x, y, x + right - left, y + bottom - top))
+
+
+def iter_strips(image, chain, tile_size=TILE_SIZE, pool=None):
+    """Yield (top, strip) for each tile_size-tall strip of the filtered image, in order
+
+    Tiles of the next strip are already being filtered while the current
+    one is handed out, but never more than two strips are in memory.
+    """
+    pool = pool or get_pool()
+    halo = image_filters.chain_halo(chain)
+    image.load()
+
+    def submit(top):
+        bottom = min(image.height, top + tile_size)
+        return top, [pool.submit(_filter_tile, image, chain,
+                                 (left, top, min(image.width, left + tile_size), bottom), halo, block=True)
+                     for left in range(0, image.width, tile_size)]
+
+    pending = deque()
+    for top in range(0, image.height, tile_size):
+        pending.append(submit(top))
+        if len(pending) > 1:
+            yield _assemble(*pending.popleft())
+    while pending:
+        yield _assemble(*pending.popleft())
+
+
+def _assemble(top, futures):
+    tiles = [future.result() for future in futures]
+    if len(tiles) == 1:
+        return top, tiles[0]
+    strip = Image.new(tiles[0].mode, (sum(tile.width for tile in tiles), tiles[0].height))
+    left = 0
+    for tile in tiles:
+        strip.paste(tile, (left, 0))
+        left += tile.width
+    return top, strip
+
+
+def apply_tiled(image, chain, tile_size=TILE_SIZE, pool=None):
+    """The whole filtered image, built strip by strip from parallel tiles"""
+    output = None
+    for top, strip in iter_strips(image, chain, tile_size, pool):
+        if output is None:
+            output = Image.new(strip.mode, image.size)
+        output.paste(strip, (0, top))
+    return output
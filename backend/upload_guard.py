@@ -0,0 +1,146 @@
+"""
+Upload limits, enforced before an image is decoded
+Request bodies are capped while they stream in (MAX_CONTENT_LENGTH, lowered
+per route by check_request_size()), each image file is read no further than its byte limit, and an image's dimensions
+are read from its header before any pixel is decoded. Images with more
+pixels than allowed are rejected, or, for JPEGs with UPLOAD_OVERSIZE=downscale,
+decoded straight to a reduced size, so a worker's memory per image stays
+bounded whatever a client sends.
+"""
+import io
+import os
+import warnings
+from collections import namedtuple
+
+from flask import current_app, g, jsonify
+from werkzeug.exceptions import RequestEntityTooLarge
+from werkzeug.wsgi import LimitedStream
+
+import metrics
+import startup
+
+MAX_UPLOAD_BYTES = int(os.environ.get('MAX_UPLOAD_BYTES', 20 * 1024 * 1024))    # one image, or one request
+MAX_BATCH_BYTES = int(os.environ.get('MAX_BATCH_BYTES', 200 * 1024 * 1024))     # a whole /process-batch request
+MAX_IMAGE_PIXELS = int(os.environ.get('MAX_IMAGE_PIXELS', 40_000_000))          # width x height after downscaling
+OVERSIZE = os.environ.get('UPLOAD_OVERSIZE', 'reject').lower()                  # 'reject' or 'downscale'
+
+# libjpeg can decode at 1/2, 1/4 or 1/8 scale, so a JPEG up to 64x the pixel
+# limit can still be brought under it without a full-size decode. Pillow's own
+# decompression bomb check is set to match and only fires beyond that.
+REDUCTIONS = (2, 4, 8)
+JPEG_FORMATS = ('JPEG', 'MPO')  # Pillow reports some camera JPEGs as MPO
+
+
+def _limit_pixels(module):
+    module.MAX_IMAGE_PIXELS = MAX_IMAGE_PIXELS * REDUCTIONS[-1] ** 2 // 2
+
+
+# Pillow is imported when the first upload is checked, so serve_app.py starts without it
+Image = startup.lazy_import('PIL.Image', on_load=_limit_pixels)
+
+UploadInfo = namedtuple('UploadInfo', 'format width height reduction')
+
+REJECTIONS = metrics.Counter('upload_rejections_total', 'Uploads refused for exceeding a limit', ('reason',))
+
+
+class UploadRejected(ValueError):
+    """An upload over a limit; reason is a short machine-readable code"""
+
+    def __init__(self, reason, message, status=413):
+        super().__init__(message)
+        self.reason = reason
+        self.status = status
+
+
+# What upload routes catch: the limits checked here, plus the body limit
+# werkzeug enforces while the form is parsed
+ERRORS = (UploadRejected, RequestEntityTooLarge)
+
+
+def rejected_response(error):
+    """JSON error response, with the reason code, for any of ERRORS"""
+    if isinstance(error, RequestEntityTooLarge):
+        limit = g.get('upload_limit', current_app.config['MAX_CONTENT_LENGTH'])
+        error = UploadRejected('request_too_large', f"Request body is larger than the {limit} byte limit")
+    REJECTIONS.inc(error.reason)
+    return jsonify({"error": str(error), "reason": error.reason}), error.status
+
+
+def configure(app):
+    """Cap request bodies for an app and answer over-limit requests with the JSON error shape
+
+    The cap is the batch limit; single-image routes also call check_request_size().
+    """
+    app.config['MAX_CONTENT_LENGTH'] = max(MAX_UPLOAD_BYTES, MAX_BATCH_BYTES)
+    app.config.setdefault('SOCK_SERVER_OPTIONS', {})['max_message_size'] = MAX_UPLOAD_BYTES
+    app.register_error_handler(RequestEntityTooLarge, rejected_response)
+
+
+def check_request_size(request, limit=MAX_UPLOAD_BYTES):
+    """Cap a request's body at limit, for routes below the app-wide MAX_CONTENT_LENGTH
+
+    A declared Content-Length over limit is rejected before the body is read;
+    a chunked body is cut off (RequestEntityTooLarge) once more than limit
+    bytes of it have been read. Call before the form is parsed.
+    """
+    if request.content_length is not None and request.content_length > limit:
+        raise UploadRejected('request_too_large',
+                             f"Request body is {request.content_length} bytes, the limit is {limit}")
+    g.upload_limit = limit
+    request.stream = LimitedStream(request.stream, limit, is_max=True)
+
+
+def read_upload(file, limit=MAX_UPLOAD_BYTES):
+    """Bytes of an uploaded file, reading at most one byte past the limit"""
+    data = file.read(limit + 1)
+    if len(data) > limit:
+        raise UploadRejected('file_too_large', f"Image file is larger than the {limit} byte limit")
+    return data
+
+
+@metrics.timed('sniff')
+def check(data, max_pixels=MAX_IMAGE_PIXELS, oversize=OVERSIZE):
+    """Read an image's header and decide how (or whether) to decode it
+
+    Returns UploadInfo with the original size and the JPEG scale reduction
+    needed to stay within max_pixels (1 if none). Raises UploadRejected for
+    data that is not an image, or that is too large to decode.
+    """
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', Image.DecompressionBombWarning)
+            with Image.open(io.BytesIO(data)) as image:
+                fmt, (width, height) = image.format, image.size
+    except Image.DecompressionBombError:
+        raise UploadRejected('too_many_pixels', f"Image has too many pixels; the limit is {max_pixels}")
+    except Exception:
+        raise UploadRejected('not_an_image', "Invalid image format", status=400)
+
+    pixels = width * height
+    if pixels <= max_pixels:
+        return UploadInfo(fmt, width, height, 1)
+
+    message = f"Image is {width}x{height} ({pixels} pixels); the limit is {max_pixels} pixels"
+    if oversize != 'downscale':
+        raise UploadRejected('too_many_pixels', message)
+    if fmt not in JPEG_FORMATS:
+        raise UploadRejected('too_many_pixels', message + "; only JPEGs are downscaled on upload")
+    for reduction in REDUCTIONS:
+        if pixels / reduction ** 2 <= max_pixels:
+            return UploadInfo(fmt, width, height, reduction)
+    raise UploadRejected('too_many_pixels', message + "; too large to downscale")
+
+
+def open_image(data, info=None):
+    """Pillow image for an upload, checked first and decoded at the reduced size if needed
+
+    Returns (image, UploadInfo).
+    """
+    info = info or check(data)
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', Image.DecompressionBombWarning)
+        image = Image.open(io.BytesIO(data))
+    if info.reduction > 1:
+        # JPEG draft mode picks libjpeg's DCT scaling, so the full-size image is never decoded
+        image.draft(image.mode, (-(-info.width // info.reduction), -(-info.height // info.reduction)))
+    return image, info
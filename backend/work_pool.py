@@ -0,0 +1,133 @@
+"""
+Bounded thread pool for the CPU-heavy part of each request
+Pillow and OpenCV release the GIL while they decode, filter and detect, so
+request threads hand that work to a pool sized to the cores. Admission is
+capped at the pool size plus a queue depth; beyond that requests are turned
+away straight away with 503 and Retry-After instead of waiting out the
+gunicorn timeout.
+"""
+import math
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import jsonify
+
+import profiling
+
+
+class PoolFull(RuntimeError):
+    """Raised by submit() when every worker is busy and the queue is full"""
+
+    def __init__(self, retry_after):
+        super().__init__("Server is busy, try again shortly")
+        self.retry_after = retry_after
+
+
+class WorkPool:
+    """ThreadPoolExecutor with a cap on running plus queued tasks"""
+
+    def __init__(self, workers, queue_depth, initializer=None, thread_name_prefix='work'):
+        self.workers = workers
+        self.queue_depth = queue_depth
+        self._executor = ThreadPoolExecutor(max_workers=workers, initializer=initializer,
+                                            thread_name_prefix=thread_name_prefix)
+        self._slots = threading.BoundedSemaphore(workers + queue_depth)
+        self._lock = threading.Lock()
+        self._admitted = 0
+        self._running = 0
+        self._avg_seconds = 0.0  # moving average of task time, for Retry-After
+        self.counters = {'completed': 0, 'failed': 0, 'rejected': 0}
+
+    def submit(self, func, *args, block=False, **kwargs):
+        """Queue func(*args, **kwargs) and return its Future
+
+        Raises PoolFull when the pool is saturated, unless block is set, in
+        which case the caller waits for a slot (used by work that has already
+        been admitted, like the rest of a batch).
+        """
+        if not self._slots.acquire(blocking=block):
+            with self._lock:
+                self.counters['rejected'] += 1
+            raise PoolFull(self.retry_after())
+
+        with self._lock:
+            self._admitted += 1
+        try:
+            # A profiled request's tasks are sampled into its profile too
+            return self._executor.submit(self._run, profiling.current(), func, args, kwargs)
+        except Exception:
+            self._release()
+            raise
+
+    def run(self, func, *args, **kwargs):
+        """Run func on the pool and wait for its result"""
+        return self.submit(func, *args, **kwargs).result()
+
+    def prestart(self, timeout=60):
+        """Start every worker thread now, running the initializer on each, instead of on first use"""
+        barrier = threading.Barrier(self.workers)
+        futures = [self._executor.submit(barrier.wait, timeout) for _ in range(self.workers)]
+        for future in futures:
+            future.result()
+
+    def has_capacity(self):
+        with self._lock:
+            return self._admitted < self.workers + self.queue_depth
+
+    def _run(self, profile, func, args, kwargs):
+        with self._lock:
+            self._running += 1
+        start = time.perf_counter()
+        failed = True
+        try:
+            with profiling.attach(profile):
+                result = func(*args, **kwargs)
+            failed = False
+            return result
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self._running -= 1
+                self.counters['failed' if failed else 'completed'] += 1
+                self._avg_seconds = elapsed if not self._avg_seconds else 0.9 * self._avg_seconds + 0.1 * elapsed
+            self._release()
+
+    def _release(self):
+        with self._lock:
+            self._admitted -= 1
+        self._slots.release()
+
+    def retry_after(self):
+        """Whole seconds until the current backlog should have drained"""
+        with self._lock:
+            backlog = self._admitted * self._avg_seconds / self.workers
+        return max(1, math.ceil(backlog))
+
+    def stats(self):
+        with self._lock:
+            return dict(self.counters,
+                        workers=self.workers,
+                        queue_depth=self.queue_depth,
+                        running=self._running,
+                        queued=self._admitted - self._running,
+                        avg_task_ms=round(self._avg_seconds * 1000, 2))
+
+
+def busy_response(error):
+    """503 telling the client when to retry"""
+    response = jsonify({"error": str(error), "retry_after": error.retry_after})
+    response.status_code = 503
+    response.headers['Retry-After'] = str(error.retry_after)
+    return response
+
+
+def from_environment(initializer=None):
+    """Pool configured by WORK_POOL_WORKERS (default: one per core) and WORK_QUEUE_DEPTH (default: 2x workers)"""
+    workers = int(os.environ.get('WORK_POOL_WORKERS', 0)) or os.cpu_count() or 1
+    return WorkPool(
+        workers=workers,
+        queue_depth=int(os.environ.get('WORK_QUEUE_DEPTH', 2 * workers)),
+        initializer=initializer
+    )
@@ -0,0 +1,320 @@
+#!/usr/bin/env python3
+"""
+In-process benchmark of backend/app.py
+Sends requests through Flask's test client, with no server or network, for
+every filter, detection preset and output codec on the demo images and on
+synthetic images from VGA to 24 MP, and records ops/sec, p50/p99 latency and
+peak RSS for each. Results are written as JSON; given a baseline from an
+earlier run, any case that got slower or bigger beyond the tolerance fails
+"""
+
+import argparse
+import io
+import json
+import math
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+from PIL import Image
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+DEMO_DIR = os.path.join(ROOT, "demo_images")
+
+# Width x height of the synthetic uploads
+SIZES = {
+    'vga': (640, 480),
+    '720p': (1280, 720),
+    '1080p': (1920, 1080),
+    '5mp': (2592, 1944),
+    '12mp': (4000, 3000),
+    '24mp': (6000, 4000),
+}
+QUICK_SIZES = ['vga', '1080p']
+GROUPS = ['filter', 'detect', 'codec']
+CODECS = ['png', 'jpeg', 'webp']
+CODEC_FILTER = 'brightness'  # a cheap point filter that keeps RGB, so the codec dominates
+
+
+def load_app():
+    """Import backend/app.py with the result cache off and a throwaway face store"""
+    os.environ['RESULT_CACHE_BYTES'] = '0'
+    os.environ.pop('RESULT_CACHE_DIR', None)
+    os.environ.setdefault('FACE_STORE_DIR', tempfile.mkdtemp(prefix='benchmark_faces_'))
+    sys.path.insert(0, os.path.join(ROOT, 'backend'))
+    import app
+    return app
+
+
+def demo_uploads():
+    """(name, PNG bytes) for every demo image, creating them first if needed"""
+    if not os.path.exists(DEMO_DIR):
+        cwd = os.getcwd()
+        os.chdir(ROOT)
+        try:
+            from create_demo_images import create_demo_images
+            create_demo_images()
+        finally:
+            os.chdir(cwd)
+    uploads = []
+    for filename in sorted(os.listdir(DEMO_DIR)):
+        if filename.lower().endswith(('.png', '.jpg', '.jpeg')):
+            with open(os.path.join(DEMO_DIR, filename), 'rb') as f:
+                uploads.append((filename, f.read()))
+    return uploads
+
+
+def demo_mosaic(uploads):
+    """The demo images side by side, 3x2, as the content of the synthetic uploads"""
+    mosaic = Image.new('RGB', (1200, 800))
+    images = [Image.open(io.BytesIO(data)).convert('RGB') for _, data in uploads]
+    for i, image in enumerate((images * 6)[:6]):
+        mosaic.paste(image.resize((400, 400)), ((i % 3) * 400, (i // 3) * 400))
+    return mosaic
+
+
+def synthetic_upload(width, height, source):
+    """Photo-like JPEG of the given size: source scaled up, plus sensor noise"""
+    image = source.convert('RGB').resize((width, height), Image.BICUBIC)
+    image = Image.blend(image, Image.effect_noise((width, height), 24).convert('RGB'), 0.15)
+    buffer = io.BytesIO()
+    image.save(buffer, 'JPEG', quality=90)
+    return buffer.getvalue()
+
+
+class PeakRSS:
+    """Peak resident memory of this process, reset between cases where Linux allows it"""
+
+    def __init__(self):
+        self.resettable = self._reset()
+
+    @staticmethod
+    def _reset():
+        # Writing 5 to clear_refs resets VmHWM (Linux 4.0+)
+        try:
+            with open('/proc/self/clear_refs', 'w') as f:
+                f.write('5')
+            return True
+        except OSError:
+            return False
+
+    def reset(self):
+        if self.resettable:
+            self._reset()
+
+    def current_mb(self):
+        return self._status('VmRSS')
+
+    def peak_mb(self):
+        if self.resettable:
+            return self._status('VmHWM')
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+    @staticmethod
+    def _status(field):
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith(field + ':'):
+                    return int(line.split()[1]) / 1024
+        return 0.0
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an ascending list"""
+    return sorted_values[max(0, math.ceil(fraction * len(sorted_values)) - 1)]
+
+
+def run_case(client, rss, request, seconds, min_runs, max_runs):
+    """Time one request repeatedly: at least min_runs, then until seconds have passed or max_runs"""
+    response = request(client)  # warm-up, and a check that the case works at all
+    body = response.get_data()  # read every body, so a streamed response releases its request context
+    if response.status_code != 200:
+        return {'error': f"HTTP {response.status_code}: {body[:200].decode(errors='replace')}"}
+
+    baseline = rss.current_mb()
+    rss.reset()
+    latencies = []
+    start = time.perf_counter()
+    while len(latencies) < max_runs and (len(latencies) < min_runs or time.perf_counter() - start < seconds):
+        begin = time.perf_counter()
+        response = request(client)
+        response.get_data()  # streamed bodies are produced while being read
+        latencies.append(time.perf_counter() - begin)
+        if response.status_code != 200:
+            return {'error': f"HTTP {response.status_code}"}
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        'runs': len(latencies),
+        'ops_per_sec': round(len(latencies) / elapsed, 3),
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 2),
+        'peak_rss_mb': round(rss.peak_mb(), 1),
+        'extra_rss_mb': round(max(0.0, rss.peak_mb() - baseline), 1),
+    }
+
+
+def process_request(image_data, form, accept):
+    def request(client):
+        data = dict(form, image=(io.BytesIO(image_data), 'upload.jpg'))
+        return client.post('/process-image', data=data, headers={'Accept': accept},
+                           content_type='multipart/form-data')
+    return request
+
+
+def detect_request(image_data, preset):
+    def request(client):
+        return client.post('/detect-faces', data={'image': (io.BytesIO(image_data), 'frame.jpg'), 'preset': preset},
+                           content_type='multipart/form-data')
+    return request
+
+
+def build_cases(app, args):
+    """(group, name, image label, width, height, request) for every selected case"""
+    demo = demo_uploads()
+    mosaic = demo_mosaic(demo)
+    face_source = Image.open(args.face_image) if args.face_image else None
+    images = [('demo', demo)]
+    for label in args.sizes:
+        width, height = SIZES[label]
+        images.append((label, [(label, synthetic_upload(width, height, mosaic))]))
+
+    cases = []
+    for label, uploads in images:
+        for filename, data in uploads:
+            image_label = f"{label}/{filename}" if label == 'demo' else label
+            with Image.open(io.BytesIO(data)) as image:
+                width, height = image.size
+            if 'filter' in args.groups:
+                for name in args.filters:
+                    cases.append(('filter', name, image_label, width, height,
+                                  process_request(data, {'type': name}, 'image/png')))
+            if 'codec' in args.groups:
+                for codec in CODECS:
+                    cases.append(('codec', codec, image_label, width, height,
+                                  process_request(data, {'type': CODEC_FILTER, 'format': codec}, f'image/{codec}')))
+            if 'detect' in args.groups and label != 'demo':
+                frame = data if face_source is None else synthetic_upload(width, height, face_source)
+                for preset in args.presets:
+                    cases.append(('detect', preset, image_label, width, height, detect_request(frame, preset)))
+    return cases
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline, tolerance, p99_tolerance, rss_slack_mb):
+    """Regression messages for cases that are slower or use more memory than in baseline"""
+    previous = {(r['group'], r['name'], r['image']): r for r in baseline.get('results', []) if 'error' not in r}
+    regressions = []
+    for result in results:
+        before = previous.get((result['group'], result['name'], result['image']))
+        if before is None or 'error' in result:
+            continue
+        case = f"{result['group']} {result['name']} @ {result['image']}"
+        if result['ops_per_sec'] < before['ops_per_sec'] * (1 - tolerance):
+            regressions.append(f"{case}: {result['ops_per_sec']} ops/s, was {before['ops_per_sec']}")
+        if result['p50_ms'] > before['p50_ms'] * (1 + tolerance):
+            regressions.append(f"{case}: p50 {result['p50_ms']} ms, was {before['p50_ms']}")
+        if result['p99_ms'] > before['p99_ms'] * (1 + p99_tolerance):
+            regressions.append(f"{case}: p99 {result['p99_ms']} ms, was {before['p99_ms']}")
+        if result['extra_rss_mb'] > before['extra_rss_mb'] * (1 + tolerance) + rss_slack_mb:
+            regressions.append(f"{case}: +{result['extra_rss_mb']} MB peak RSS, was +{before['extra_rss_mb']}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--groups', default=','.join(GROUPS), help='comma-separated: filter, detect, codec')
+    parser.add_argument('--sizes', default=','.join(SIZES), help=f"comma-separated from {', '.join(SIZES)}")
+    parser.add_argument('--filters', default=None, help='comma-separated filters (default: all)')
+    parser.add_argument('--presets', default=None, help='comma-separated detection presets (default: all)')
+    parser.add_argument('--quick', action='store_true', help=f"only {' and '.join(QUICK_SIZES)}, fewer runs")
+    parser.add_argument('--seconds', type=float, default=2.0, help='time spent on each case')
+    parser.add_argument('--min-runs', type=int, default=3, help='runs per case however slow')
+    parser.add_argument('--max-runs', type=int, default=200, help='runs per case however fast')
+    parser.add_argument('--face-image', help='photo with faces, scaled to each size for the detection cases')
+    parser.add_argument('--output', default='benchmark_results.json', help='where to write the JSON results')
+    parser.add_argument('--baseline', help='earlier results JSON to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed relative slowdown or growth')
+    parser.add_argument('--p99-tolerance', type=float, default=0.5,
+                        help='allowed relative growth of p99, which is noisier with few runs')
+    parser.add_argument('--rss-slack', type=float, default=16.0, help='allowed extra peak RSS in MB on top')
+    args = parser.parse_args()
+
+    app = load_app()
+    args.groups = args.groups.split(',')
+    args.sizes = QUICK_SIZES if args.quick else args.sizes.split(',')
+    args.filters = args.filters.split(',') if args.filters else list(app.image_filters.FILTERS)
+    args.presets = args.presets.split(',') if args.presets else list(app.detectors.DETECTION_PRESETS)
+    if args.quick:
+        args.seconds, args.max_runs = min(args.seconds, 0.5), min(args.max_runs, 20)
+    unknown = [size for size in args.sizes if size not in SIZES]
+    if unknown:
+        parser.error(f"unknown size(s): {', '.join(unknown)}")
+
+    print("🧪 In-process benchmark of backend/app.py")
+    print("=" * 60)
+    client = app.app.test_client()
+    rss = PeakRSS()
+    if not rss.resettable:
+        print("⚠️ Peak RSS cannot be reset here; peak_rss_mb is the process peak so far")
+
+    results = []
+    for group, name, image, width, height, request in build_cases(app, args):
+        result = {'group': group, 'name': name, 'image': image, 'width': width, 'height': height}
+        result.update(run_case(client, rss, request, args.seconds, args.min_runs, args.max_runs))
+        results.append(result)
+        if 'error' in result:
+            print(f"❌ {group:6} {name:10} {image:24} {result['error']}")
+        else:
+            print(f"✅ {group:6} {name:10} {image:24} {result['ops_per_sec']:8.2f} ops/s  "
+                  f"p50 {result['p50_ms']:9.2f} ms  p99 {result['p99_ms']:9.2f} ms  "
+                  f"peak {result['peak_rss_mb']:7.1f} MB (+{result['extra_rss_mb']:.1f})")
+
+    report = {
+        'meta': {
+            'commit': git_commit(),
+            'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+            'work_pool_workers': app.cpu_pool.workers,
+            'rss_resettable': rss.resettable,
+            'seconds_per_case': args.seconds,
+        },
+        'results': results,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print("=" * 60)
+    print(f"📄 {len(results)} cases written to {args.output}")
+
+    failures = sum(1 for result in results if 'error' in result)
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance, args.p99_tolerance, args.rss_slack)
+        for message in regressions:
+            print(f"❌ regression: {message}")
+        failures += len(regressions)
+
+    if failures:
+        print(f"⚠️ {failures} check(s) failed")
+        return 1
+    print("🎉 All cases ran" + (" with no regressions" if args.baseline else ""))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
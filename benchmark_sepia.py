@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Regression benchmark for the sepia filter
+Compares the original per-pixel loop with the lookup-table version in
+backend/image_filters.py on every demo image: output must be identical and faster
+"""
+
+import argparse
+import os
+import sys
+import time
+
+from PIL import Image
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'backend'))
+from image_filters import SEPIA_LUTS, tone_map
+
+DEMO_DIR = "demo_images"
+
+
+def legacy_sepia(image):
+    """The original nested-loop sepia from serve_app.py, kept as the reference"""
+    grayscale = image.convert('L')
+    sepia = Image.new('RGB', grayscale.size)
+    pixels = sepia.load()
+    gray_pixels = grayscale.load()
+
+    for i in range(grayscale.width):
+        for j in range(grayscale.height):
+            gray = gray_pixels[i, j]
+            r = min(255, int(gray * 1.0))
+            g = min(255, int(gray * 0.8))
+            b = min(255, int(gray * 0.6))
+            pixels[i, j] = (r, g, b)
+    return sepia
+
+
+def vectorized_sepia(image):
+    return tone_map(image.convert('L'), SEPIA_LUTS)
+
+
+def best_time(func, image, repeat):
+    """Fastest of several runs, in seconds"""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(image)
+        times.append(time.perf_counter() - start)
+    return min(times), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--scale', type=int, default=1, help='upscale each demo image by this factor')
+    parser.add_argument('--repeat', type=int, default=3, help='runs per implementation')
+    parser.add_argument('--min-speedup', type=float, default=100.0, help='fail below this speedup')
+    args = parser.parse_args()
+
+    if not os.path.exists(DEMO_DIR):
+        print(f"❌ Demo directory '{DEMO_DIR}' not found! Run create_demo_images.py first")
+        return 1
+
+    print("🧪 Sepia regression benchmark")
+    print("=" * 60)
+
+    failures = 0
+    for filename in sorted(os.listdir(DEMO_DIR)):
+        if not filename.lower().endswith(('.png', '.jpg', '.jpeg')):
+            continue
+        image = Image.open(os.path.join(DEMO_DIR, filename))
+        image.load()
+        if args.scale > 1:
+            image = image.resize((image.width * args.scale, image.height * args.scale))
+
+        legacy_time, expected = best_time(legacy_sepia, image, args.repeat)
+        new_time, actual = best_time(vectorized_sepia, image, args.repeat)
+        speedup = legacy_time / new_time
+        identical = expected.mode == actual.mode and expected.tobytes() == actual.tobytes()
+
+        status = "✅" if identical and speedup >= args.min_speedup else "❌"
+        if status == "❌":
+            failures += 1
+        print(f"{status} {filename} {image.width}x{image.height}: "
+              f"loop {legacy_time * 1000:.1f} ms, LUT {new_time * 1000:.2f} ms, "
+              f"{speedup:.0f}x, identical={identical}")
+
+    print("=" * 60)
+    if failures:
+        print(f"⚠️ {failures} image(s) regressed")
+        return 1
+    print("🎉 Sepia output identical and fast enough on every demo image")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+Start-up time benchmark for backend/app.py and serve_app.py
+Measures how long importing each app takes in a fresh interpreter, then
+starts it as a server and times, from launch: the first answer from the
+liveness check (/healthz), readiness (/readyz), and the first successful
+/detect-faces (/api/process-image for serve_app.py) from a client that
+starts sending as soon as the port opens. Each STARTUP_WARMUP mode is
+measured: background (default), blocking and off
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import requests
+
+from benchmark_app import demo_mosaic, demo_uploads, synthetic_upload
+from load_test import TARGETS, start_server
+
+MODES = ['background', 'blocking', 'off']
+POLL_SECONDS = 0.02
+
+
+def import_seconds(target, runs):
+    """Median time to import the app module in a fresh interpreter, warm-up off, and the bare interpreter"""
+    spec = TARGETS[target]
+    code = (f"import time; start = time.perf_counter(); import {spec['module']}; "
+            f"print(time.perf_counter() - start)")
+    env = dict(os.environ, STARTUP_WARMUP='off')
+    times, totals, baselines = [], [], []
+    for _ in range(runs):
+        start = time.perf_counter()
+        output = subprocess.run([sys.executable, '-c', code], cwd=spec['cwd'], env=env,
+                                capture_output=True, text=True, check=True).stdout
+        totals.append(time.perf_counter() - start)
+        times.append(float(output.strip().splitlines()[-1]))
+        start = time.perf_counter()
+        subprocess.run([sys.executable, '-c', 'pass'], check=True)
+        baselines.append(time.perf_counter() - start)
+    return statistics.median(times), statistics.median(totals), statistics.median(baselines)
+
+
+def first_success(send, launched, stop):
+    """Seconds from launch until send() first returns 200, and that request's latency"""
+    while not stop.is_set():
+        start = time.perf_counter()
+        try:
+            if send().status_code == 200:
+                end = time.perf_counter()
+                return end - launched, end - start
+        except requests.RequestException:
+            pass
+        time.sleep(POLL_SECONDS)
+    return None, None
+
+
+def time_to_first(target, mode, port, use_gunicorn, payload, timeout):
+    """Launch the app with STARTUP_WARMUP=mode and time liveness, readiness and the first real request"""
+    spec = TARGETS[target]
+    base_url = f"http://127.0.0.1:{port}{spec['prefix']}"
+    if target == 'app':
+        def send():
+            return requests.post(f'{base_url}/detect-faces', files={'image': ('frame.jpg', payload, 'image/jpeg')},
+                                 timeout=timeout)
+    else:
+        def send():
+            return requests.post(f'{base_url}/process-image', files={'image': ('upload.jpg', payload, 'image/jpeg')},
+                                 data={'type': 'blur'}, timeout=timeout)
+
+    results, stop = {}, threading.Event()
+
+    def poll(name, path):
+        results[name] = first_success(lambda: requests.get(f'{base_url}{path}', timeout=timeout), launched, stop)[0]
+
+    def request():
+        results['first_request'], results['first_request_latency'] = first_success(send, launched, stop)
+
+    os.environ['STARTUP_WARMUP'] = mode
+    launched = time.perf_counter()
+    process = start_server(target, port, use_gunicorn)
+    threads = [threading.Thread(target=poll, args=('live', '/healthz')),
+               threading.Thread(target=poll, args=('ready', '/readyz')),
+               threading.Thread(target=request)]
+    try:
+        for thread in threads:
+            thread.start()
+        deadline = launched + timeout
+        for thread in threads:
+            thread.join(max(0.0, deadline - time.perf_counter()))
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join()
+        process.terminate()
+        process.wait()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--targets', default='app,serve_app', help='comma-separated: app, serve_app')
+    parser.add_argument('--modes', default=','.join(MODES), help='comma-separated STARTUP_WARMUP modes')
+    parser.add_argument('--runs', type=int, default=3, help='launches per target and mode (median reported)')
+    parser.add_argument('--gunicorn', action='store_true', help='launch under gunicorn as the Procfile does')
+    parser.add_argument('--port', type=int, default=5099, help='port for the launched servers')
+    parser.add_argument('--timeout', type=float, default=120.0, help='give up on a launch after this long')
+    parser.add_argument('--budget', type=float, help='fail if the first successful request takes longer (s)')
+    parser.add_argument('--json', dest='json_path', help='also write the results as JSON here')
+    args = parser.parse_args()
+
+    os.environ.setdefault('FACE_STORE_DIR', tempfile.mkdtemp(prefix='benchmark_faces_'))
+    payload = synthetic_upload(640, 480, demo_mosaic(demo_uploads()))
+
+    print("🧪 Start-up benchmark" + (" (gunicorn)" if args.gunicorn else " (Flask server)"))
+    print("=" * 60)
+    report, failures = {}, 0
+    for target in args.targets.split(','):
+        imported, total, interpreter = import_seconds(target, args.runs)
+        print(f"📦 {target}: import {imported * 1000:.0f} ms "
+              f"(process {total * 1000:.0f} ms, bare interpreter {interpreter * 1000:.0f} ms)")
+        report[target] = {'import_ms': round(imported * 1000, 1), 'process_ms': round(total * 1000, 1),
+                          'interpreter_ms': round(interpreter * 1000, 1), 'modes': {}}
+
+        for mode in args.modes.split(','):
+            runs = [time_to_first(target, mode, args.port, args.gunicorn, payload, args.timeout)
+                    for _ in range(args.runs)]
+            summary = {}
+            for key in ('live', 'ready', 'first_request', 'first_request_latency'):
+                values = [run.get(key) for run in runs]
+                summary[f'{key}_ms'] = (round(statistics.median(values) * 1000, 1)
+                                        if all(value is not None for value in values) else None)
+            report[target]['modes'][mode] = summary
+
+            first = summary['first_request_ms']
+            status = "✅" if first is not None and (args.budget is None or first <= args.budget * 1000) else "❌"
+            failures += status == "❌"
+            print(f"{status} {target:9} STARTUP_WARMUP={mode:10} live {summary['live_ms']} ms  "
+                  f"ready {summary['ready_ms']} ms  first success {first} ms "
+                  f"(that request took {summary['first_request_latency_ms']} ms)")
+
+    if args.json_path:
+        with open(args.json_path, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"📄 Results written to {args.json_path}")
+    print("=" * 60)
+    if failures:
+        print(f"⚠️ {failures} launch(es) failed or went over budget")
+        return 1
+    print("🎉 Every launch served its first request")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
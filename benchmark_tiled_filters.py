@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+Regression benchmark for tiled filtering
+Checks that blur, sharpen and edge chains filtered in tiles (backend/tiling.py)
+are pixel-identical to filtering the whole image, including through the
+streaming PNG encoder, then compares time and extra peak memory of the two on
+a large image: tiled output must be identical and use less memory
+"""
+
+import argparse
+import io
+import multiprocessing
+import os
+import resource
+import sys
+import time
+
+from PIL import Image
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'backend'))
+import image_codecs
+import image_filters
+import tiling
+
+DEMO_DIR = "demo_images"
+CHAINS = ['blur', 'sharpen', 'edge', 'blur,sharpen,edge', 'grayscale,edge', 'sepia,blur']
+MODES = ['RGB', 'L', 'RGBA']
+TILE_SIZES = [64, 97]  # one dividing typical sizes, one that leaves ragged edge tiles
+
+
+def test_images():
+    """Demo images plus an odd-sized synthetic one"""
+    images = []
+    if os.path.exists(DEMO_DIR):
+        for filename in sorted(os.listdir(DEMO_DIR)):
+            if filename.lower().endswith(('.png', '.jpg', '.jpeg')):
+                image = Image.open(os.path.join(DEMO_DIR, filename))
+                image.load()
+                images.append((filename, image))
+    images.append(('noise 301x203', Image.effect_noise((301, 203), 64).convert('RGB')))
+    return images
+
+
+def identical(a, b):
+    return a.mode == b.mode and a.size == b.size and a.tobytes() == b.tobytes()
+
+
+def check_correctness():
+    failures = 0
+    for name, image in test_images():
+        for mode in MODES:
+            source = image.convert(mode)
+            for process_type in CHAINS:
+                chain = image_filters.parse_chain(process_type)
+                expected = image_filters.apply_chain(source, chain)
+                for tile_size in TILE_SIZES:
+                    tiled = tiling.apply_tiled(source, chain, tile_size)
+                    streamed = Image.open(io.BytesIO(b''.join(image_codecs.png_stream(
+                        tiling.iter_strips(source, chain, tile_size),
+                        source.width, source.height, expected.mode, pool=tiling.get_pool()))))
+                    if not (identical(expected, tiled) and identical(expected, streamed)):
+                        failures += 1
+                        print(f"❌ {name} {mode} {process_type} tile {tile_size}: differs from untiled")
+        print(f"✅ {name}: {len(MODES) * len(CHAINS) * len(TILE_SIZES)} tiled outputs checked")
+    return failures
+
+
+def large_image(width, height):
+    """RGB image with photo-like noise, built without a second full-size temporary"""
+    image = Image.new('RGB', (width, height))
+    patch = Image.merge('RGB', [Image.effect_noise((512, 512), sigma) for sigma in (40, 60, 80)])
+    for top in range(0, height, 512):
+        for left in range(0, width, 512):
+            image.paste(patch, (left, top))
+    return image
+
+
+def untiled(image, chain):
+    return len(image_codecs.encode(image_filters.apply_chain(image, chain), 'PNG').getvalue())
+
+
+def tiled_stream(image, chain):
+    mode = tiling.output_mode(image, chain)
+    return sum(len(data) for data in image_codecs.png_stream(
+        tiling.iter_strips(image, chain), image.width, image.height, mode, pool=tiling.get_pool()))
+
+
+def _measure(func, width, height, process_type, results):
+    image = large_image(width, height)
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    size = func(image, image_filters.parse_chain(process_type))
+    elapsed = time.perf_counter() - start
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    results.put((elapsed, (peak - baseline) / 1024, size))
+
+
+def measure(func, width, height, process_type):
+    """(seconds, extra peak MB, output bytes) in a fresh process, so peaks do not carry over"""
+    context = multiprocessing.get_context('fork')
+    results = context.Queue()
+    process = context.Process(target=_measure, args=(func, width, height, process_type, results))
+    process.start()
+    result = results.get()
+    process.join()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--width', type=int, default=8000, help='large image width')
+    parser.add_argument('--height', type=int, default=6000, help='large image height')
+    parser.add_argument('--chains', default='blur,edge', help="'|'-separated chains to time")
+    args = parser.parse_args()
+
+    print("🧪 Tiled filter regression benchmark")
+    print("=" * 60)
+    failures = check_correctness()
+
+    megapixels = args.width * args.height / 1e6
+    print(f"\n📊 {args.width}x{args.height} ({megapixels:.0f} MP), "
+          f"tiles {tiling.TILE_SIZE}px on {tiling.TILE_WORKERS} threads")
+    for process_type in args.chains.split('|'):
+        whole_time, whole_mb, whole_bytes = measure(untiled, args.width, args.height, process_type)
+        tiled_time, tiled_mb, tiled_bytes = measure(tiled_stream, args.width, args.height, process_type)
+        status = "✅" if tiled_mb < whole_mb else "❌"
+        if status == "❌":
+            failures += 1
+        print(f"{status} {process_type}: whole {whole_time:.2f} s +{whole_mb:.0f} MB ({whole_bytes / 1e6:.1f} MB png), "
+              f"tiled {tiled_time:.2f} s +{tiled_mb:.0f} MB ({tiled_bytes / 1e6:.1f} MB png), "
+              f"{whole_time / tiled_time:.1f}x")
+
+    print("=" * 60)
+    if failures:
+        print(f"⚠️ {failures} check(s) failed")
+        return 1
+    print("🎉 Tiled output identical to untiled, with lower peak memory")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -81,6 +81,13 @@ let currentTab = 'imageProcessing';
 let permissionGranted = false;
 let isDetecting = false;
 let detectionInterval = null;
+let detectionSocket = null;
+let socketRetryTimer = null;
+let socketRetryDelay = 1000; // doubles after each dropped stream, up to SOCKET_RETRY_MAX_MS
+const SOCKET_RETRY_MAX_MS = 30000;
+let frameInFlight = false;
+const FRAME_INTERVAL_MS = 66; // up to ~15 fps; the server's speed sets the real rate
+const DETECTION_PRESET = 'balanced'; // webcam frames: detect at 640px, faces at least 8% of the frame
 let currentFaceData = null;
 
 
@@ -342,6 +349,16 @@ function stopRealTimeDetection() {
         detectionInterval = null;
     }
 
+    if (socketRetryTimer) {
+        clearTimeout(socketRetryTimer);
+        socketRetryTimer = null;
+    }
+
+    if (detectionSocket) {
+        detectionSocket.close();
+        detectionSocket = null;
+    }
+
     if (stream) {
         stream.getTracks().forEach(track => track.stop());
         stream = null;
@@ -358,61 +375,145 @@ function stopRealTimeDetection() {
 }
 
 // Detection Loop
+// Frames stream over a WebSocket when the backend supports it, otherwise over
+// /detect-faces; either way only one frame is in flight, so a slow server
+// lowers the frame rate instead of building up a backlog. A stream that drops
+// (redeploy, proxy idle timeout) reconnects with backoff; a socket that never
+// opens, or that the server turns away as full, falls back to HTTP
 function startDetectionLoop() {
-    detectionInterval = setInterval(async () => {
-        if (!isDetecting || !video.videoWidth) return;
-
-        try {
-            // Capture current frame
-            canvas.width = video.videoWidth;
-            canvas.height = video.videoHeight;
-            const ctx = canvas.getContext('2d');
-            ctx.drawImage(video, 0, 0);
-
-            // Convert to blob and send to backend
-            canvas.toBlob(async (blob) => {
-                if (!blob) return;
-
-                const formData = new FormData();
-                formData.append('image', blob, 'frame.jpg');
-
-                try {
-                    const response = await fetch(`${API_BASE_URL}/detect-faces`, {
-                        method: 'POST',
-                        body: formData
-                    });
-
-                    if (response.ok) {
-                        const result = await response.json();
-                        if (result.success) {
-                            drawRealTimeDetections(result);
-
-                            // Auto-attendance for known faces
-                            result.faces.forEach(face => {
-                                if (face.is_known && face.confidence > 0.7) {
-                                    addAttendanceRecord(face.name, face.confidence);
-                                }
-                            });
-
-                            // Enable register button if unknown face detected
-                            const unknownFaces = result.faces.filter(f => !f.is_known);
-                            if (unknownFaces.length > 0) {
-                                currentFaceData = result;
-                                registerBtn.disabled = false;
-                            } else {
-                                registerBtn.disabled = true;
-                            }
-                        }
+    const wsUrl = API_BASE_URL.replace(/^http/, 'ws') + `/ws/detect-faces?preset=${DETECTION_PRESET}`;
+    let opened = false;
+    let refused = false;
+    let socket;
+
+    try {
+        socket = detectionSocket = new WebSocket(wsUrl);
+    } catch (error) {
+        startHttpDetectionLoop();
+        return;
+    }
+    socket.binaryType = 'arraybuffer';
+
+    socket.onopen = () => {
+        opened = true;
+        frameInFlight = false;
+        detectionInterval = setInterval(() => {
+            // The server drops stale frames too; this keeps the send buffer empty
+            if (frameInFlight || socket.bufferedAmount > 0) return;
+            captureFrame(blob => {
+                if (socket.readyState !== WebSocket.OPEN) return;
+                frameInFlight = true;
+                socket.send(blob);
+            });
+        }, FRAME_INTERVAL_MS);
+    };
+
+    socket.onmessage = (event) => {
+        frameInFlight = false;
+        const result = JSON.parse(event.data);
+        if (result.success) {
+            socketRetryDelay = 1000;
+            handleDetectionResult(result);
+        } else if (result.reason === 'too_many_connections') {
+            refused = true;
+        }
+    };
+
+    socket.onclose = () => {
+        if (detectionSocket !== socket) return; // stopped, or replaced by a newer session
+        detectionSocket = null;
+        if (detectionInterval) {
+            clearInterval(detectionInterval);
+            detectionInterval = null;
+        }
+        if (!isDetecting) return;
+        // No WebSocket support on this backend, or no room for another stream: use HTTP posts
+        if (!opened || refused) {
+            startHttpDetectionLoop();
+            return;
+        }
+        // The stream dropped mid-session: reconnect after a growing delay
+        socketRetryTimer = setTimeout(() => {
+            socketRetryTimer = null;
+            if (isDetecting && !detectionSocket && !detectionInterval) {
+                startDetectionLoop();
+            }
+        }, socketRetryDelay);
+        socketRetryDelay = Math.min(socketRetryDelay * 2, SOCKET_RETRY_MAX_MS);
+    };
+}
+
+function startHttpDetectionLoop() {
+    frameInFlight = false;
+    // Lets the backend track faces across this camera session's frames
+    const sessionId = Date.now().toString(36) + Math.random().toString(36).slice(2);
+    detectionInterval = setInterval(() => {
+        if (frameInFlight) return;
+        captureFrame(async (blob) => {
+            frameInFlight = true;
+            const formData = new FormData();
+            formData.append('image', blob, 'frame.jpg');
+            formData.append('session_id', sessionId);
+            formData.append('preset', DETECTION_PRESET);
+
+            try {
+                const response = await fetch(`${API_BASE_URL}/detect-faces`, {
+                    method: 'POST',
+                    body: formData
+                });
+
+                if (response.ok) {
+                    const result = await response.json();
+                    if (result.success) {
+                        handleDetectionResult(result);
                     }
-                } catch (error) {
-                    console.error('Detection error:', error);
                 }
-            }, 'image/jpeg', 0.8);
+            } catch (error) {
+                console.error('Detection error:', error);
+            } finally {
+                frameInFlight = false;
+            }
+        });
+    }, FRAME_INTERVAL_MS);
+}
+
+// Capture the current video frame as a JPEG blob
+function captureFrame(callback) {
+    if (!isDetecting || !video.videoWidth) return;
+
+    try {
+        canvas.width = video.videoWidth;
+        canvas.height = video.videoHeight;
+        const ctx = canvas.getContext('2d');
+        ctx.drawImage(video, 0, 0);
+
+        canvas.toBlob((blob) => {
+            if (blob && isDetecting) callback(blob);
+        }, 'image/jpeg', 0.8);
 
-        } catch (error) {
-            console.error('Frame capture error:', error);
+    } catch (error) {
+        console.error('Frame capture error:', error);
+    }
+}
+
+function handleDetectionResult(result) {
+    drawRealTimeDetections(result);
+
+    // The backend records attendance and tells us when it did (at most once per person per window)
+    result.faces.forEach(face => {
+        if (face.attendance_recorded) {
+            addAttendanceRecord(face.name, face.confidence);
         }
-    }, 1000); // Detect every 1 second
+    });
+
+    // Enable register button if unknown face detected
+    const unknownFaces = result.faces.filter(f => !f.is_known);
+    if (unknownFaces.length > 0) {
+        currentFaceData = result;
+        registerBtn.disabled = false;
+    } else {
+        registerBtn.disabled = true;
+    }
 }
 
 // Draw Real-time Detections
@@ -457,23 +558,6 @@ function addAttendanceRecord(name, confidence) {
     const timeString = now.toLocaleTimeString();
     const dateString = now.toLocaleDateString();
 
-    // Check if already recorded in last 5 minutes
-    const recentAttendance = document.querySelectorAll('.attendance-item');
-    for (let item of recentAttendance) {
-        const itemName = item.querySelector('.attendance-name').textContent;
-        const itemTime = item.querySelector('.attendance-time').textContent;
-        const itemDate = itemTime.split(' ')[0];
-
-        if (itemName === name && itemDate === dateString) {
-            const recordTime = new Date(itemDate + ' ' + itemTime.split(' ')[1]);
-            const timeDiff = (now - recordTime) / (1000 * 60); // minutes
-
-            if (timeDiff < 5) {
-                return; // Skip if recorded within 5 minutes
-            }
-        }
-    }
-
     // Create attendance item
     const attendanceItem = document.createElement('div');
     attendanceItem.className = 'attendance-item';
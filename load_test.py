@@ -0,0 +1,311 @@
+#!/usr/bin/env python3
+"""
+Load generator for backend/app.py and serve_app.py
+Simulates webcam sessions posting JPEG frames to /detect-faces the way
+frontend/script.js does (a timer at the target fps that skips a tick while a
+frame is still in flight), mixed with /process-image uploads arriving at
+random at a target rate. Reports achieved throughput, latency percentiles,
+error and 503 rates per endpoint, and the server's work pool queue depth
+polled from /cache-stats while the load runs
+"""
+
+import argparse
+import json
+import os
+import random
+import signal
+import struct
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+import requests
+from PIL import Image
+
+from benchmark_app import demo_mosaic, demo_uploads, percentile, synthetic_upload
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+# How to start each app, and where its API lives
+TARGETS = {
+    'app': {'cwd': os.path.join(ROOT, 'backend'), 'module': 'app', 'port': 5000, 'prefix': ''},
+    'serve_app': {'cwd': ROOT, 'module': 'serve_app', 'port': 8080, 'prefix': '/api'},
+}
+
+
+class Recorder:
+    """Latency and outcome of every request, by endpoint"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = {}  # endpoint -> [seconds] of successful requests
+        self.outcomes = {}   # endpoint -> {'ok'|'503'|'4xx'|'5xx'|'error': count}
+        self.counters = {}
+
+    def record(self, endpoint, outcome, seconds=None):
+        with self._lock:
+            counts = self.outcomes.setdefault(endpoint, {})
+            counts[outcome] = counts.get(outcome, 0) + 1
+            if outcome == 'ok':
+                self.latencies.setdefault(endpoint, []).append(seconds)
+
+    def count(self, name, amount=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def summary(self, duration):
+        report = {}
+        with self._lock:
+            for endpoint, counts in sorted(self.outcomes.items()):
+                total = sum(counts.values())
+                latencies = sorted(self.latencies.get(endpoint, []))
+                entry = {
+                    'requests': total,
+                    'ok_per_sec': round(counts.get('ok', 0) / duration, 2),
+                    'error_rate': round((total - counts.get('ok', 0)) / total, 4),
+                    'busy_503_rate': round(counts.get('503', 0) / total, 4),
+                    'outcomes': dict(counts),
+                }
+                if latencies:
+                    entry.update({f'p{int(q * 100)}_ms': round(percentile(latencies, q) * 1000, 1)
+                                  for q in (0.5, 0.9, 0.99)})
+                    entry['max_ms'] = round(latencies[-1] * 1000, 1)
+                report[endpoint] = entry
+        return report
+
+
+def outcome_of(status_code):
+    if status_code == 200:
+        return 'ok'
+    if status_code == 503:
+        return '503'
+    return f'{status_code // 100}xx'
+
+
+def with_comment(jpeg, text):
+    """The JPEG with a COM segment after SOI, so every upload hashes differently and misses the result cache"""
+    payload = text.encode()
+    return jpeg[:2] + b'\xff\xfe' + struct.pack('>H', len(payload) + 2) + payload + jpeg[2:]
+
+
+def webcam_session(base_url, session, frame, fps, preset, stop, recorder, timeout):
+    """One camera: a tick every 1/fps, skipped while the previous frame is still in flight"""
+    http = requests.Session()
+    session_id = f'load-{session}-{random.getrandbits(32):08x}'
+    interval = 1.0 / fps
+    next_tick = time.perf_counter() + random.uniform(0, interval)  # cameras do not start in lockstep
+    while not stop.is_set():
+        delay = next_tick - time.perf_counter()
+        if delay > 0 and stop.wait(delay):
+            break
+        start = time.perf_counter()
+        try:
+            response = http.post(f'{base_url}/detect-faces', timeout=timeout,
+                                 files={'image': ('frame.jpg', frame, 'image/jpeg')},
+                                 data={'session_id': session_id, 'preset': preset})
+            recorder.record('/detect-faces', outcome_of(response.status_code), time.perf_counter() - start)
+        except requests.RequestException:
+            recorder.record('/detect-faces', 'error')
+        recorder.count('frames_sent')
+
+        # Ticks that fell while the frame was in flight are dropped, as setInterval does with frameInFlight
+        now = time.perf_counter()
+        missed = int((now - next_tick) // interval)
+        if missed > 0:
+            recorder.count('frames_skipped', missed)
+        next_tick += (missed + 1) * interval
+
+
+def upload(base_url, image_data, process_type, recorder, timeout):
+    start = time.perf_counter()
+    try:
+        response = requests.post(f'{base_url}/process-image', timeout=timeout,
+                                 files={'image': ('upload.jpg', image_data, 'image/jpeg')},
+                                 data={'type': process_type})
+        recorder.record('/process-image', outcome_of(response.status_code), time.perf_counter() - start)
+    except requests.RequestException:
+        recorder.record('/process-image', 'error')
+
+
+def upload_arrivals(base_url, images, filters, rate, max_in_flight, stop, recorder, timeout):
+    """Uploads arriving as a Poisson process at rate per second, in flight at most max_in_flight at once"""
+    slots = threading.BoundedSemaphore(max_in_flight)
+    with ThreadPoolExecutor(max_in_flight, thread_name_prefix='upload') as executor:
+        number = 0
+        while not stop.wait(random.expovariate(rate)):
+            if not slots.acquire(blocking=False):
+                recorder.count('uploads_dropped')  # the client side is saturated
+                continue
+            number += 1
+            label, image_data = random.choice(images)
+            future = executor.submit(upload, base_url, with_comment(image_data, f'load {number}'),
+                                     random.choice(filters), recorder, timeout)
+            future.add_done_callback(lambda _: slots.release())
+
+
+def poll_queue(base_url, stop, samples, interval=0.5):
+    """Sample the work pool's queued and running tasks from /cache-stats"""
+    http = requests.Session()
+    while not stop.wait(interval):
+        try:
+            stats = http.get(f'{base_url}/cache-stats', timeout=5).json()['work_pool']
+            samples.append((stats['queued'], stats['running'], stats['rejected']))
+        except (requests.RequestException, ValueError, KeyError):
+            pass
+
+
+def start_server(target, port, use_gunicorn):
+    """Launch the target app locally: gunicorn with the Procfile settings, or the Flask server"""
+    spec = TARGETS[target]
+    env = dict(os.environ, PORT=str(port))
+    if use_gunicorn:
+        command = ['gunicorn', f"{spec['module']}:app", '--bind', f'127.0.0.1:{port}',
+                   '--workers', '1', '--threads', '16', '--timeout', '120']
+    else:
+        command = [sys.executable, f"{spec['module']}.py"]
+    return subprocess.Popen(command, cwd=spec['cwd'], env=env, stdout=subprocess.DEVNULL,
+                            stderr=subprocess.DEVNULL, start_new_session=True)
+
+
+def wait_ready(base_url, timeout, process=None):
+    """Poll the readiness check until it answers 200; both apps answer 503 while warming up"""
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        if process is not None and process.poll() is not None:
+            raise RuntimeError(f"server exited with code {process.returncode}")
+        try:
+            if requests.get(f'{base_url}/readyz', timeout=2).status_code == 200:
+                return
+        except requests.RequestException:
+            pass
+        time.sleep(0.25)
+    raise RuntimeError(f"{base_url} not ready after {timeout:.0f} s")
+
+
+def parse_size(text):
+    width, height = text.lower().split('x')
+    return int(width), int(height)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--target', choices=TARGETS, default='app', help='which app is under load')
+    parser.add_argument('--url', help='server root (default: http://127.0.0.1:<5000 for app, 8080 for serve_app>); --start uses its port')
+    parser.add_argument('--start', action='store_true', help='start the target locally for the run and stop it after')
+    parser.add_argument('--gunicorn', action='store_true', help='with --start, run it under gunicorn as the Procfile does')
+    parser.add_argument('--duration', type=float, default=30.0, help='seconds of load')
+    parser.add_argument('--sessions', type=int, default=4, help='concurrent webcam sessions (app only)')
+    parser.add_argument('--fps', type=float, default=1.0, help='frames per second per session (script.js: 1)')
+    parser.add_argument('--frame-size', type=parse_size, default=(640, 480), help='webcam frame WxH')
+    parser.add_argument('--frame-image', help='photo to use as the webcam frame (default: synthetic)')
+    parser.add_argument('--preset', default='balanced', help='detection preset the sessions ask for')
+    parser.add_argument('--upload-rate', type=float, default=0.5, help='/process-image uploads per second')
+    parser.add_argument('--upload-sizes', default='1920x1080,4000x3000', help='comma-separated WxH, picked at random')
+    parser.add_argument('--filters', default='grayscale,blur,sharpen,edge', help='filters picked at random per upload')
+    parser.add_argument('--max-uploads-in-flight', type=int, default=16, help='client-side upload concurrency')
+    parser.add_argument('--timeout', type=float, default=120.0, help='per-request timeout (gunicorn: 120)')
+    parser.add_argument('--json', dest='json_path', help='also write the report as JSON here')
+    args = parser.parse_args()
+
+    spec = TARGETS[args.target]
+    # --start serves on the port --url names, so the server spawned is the one polled and loaded
+    port = (urlparse(args.url).port if args.url else None) or spec['port']
+    root_url = (args.url or f'http://127.0.0.1:{port}').rstrip('/')
+    base_url = root_url + spec['prefix']
+    if args.target == 'serve_app' and args.sessions:
+        print("ℹ️ serve_app.py has no /detect-faces; running uploads only")
+        args.sessions = 0
+
+    process = None
+    if args.start:
+        print(f"🚀 Starting {args.target} on port {port}" + (" under gunicorn" if args.gunicorn else ""))
+        process = start_server(args.target, port, args.gunicorn)
+    try:
+        started = time.perf_counter()
+        wait_ready(base_url, 180 if args.start else 10, process)
+        if args.start:
+            print(f"✅ Ready after {time.perf_counter() - started:.1f} s")
+
+        mosaic = demo_mosaic(demo_uploads())
+        frame_source = Image.open(args.frame_image) if args.frame_image else mosaic
+        frame = synthetic_upload(*args.frame_size, frame_source)
+        images = [(size, synthetic_upload(*parse_size(size), mosaic)) for size in args.upload_sizes.split(',')]
+        filters = args.filters.split(',')
+
+        print(f"🧪 {args.duration:.0f} s: {args.sessions} webcam session(s) at {args.fps:g} fps "
+              f"({args.frame_size[0]}x{args.frame_size[1]}, preset {args.preset}), "
+              f"{args.upload_rate:g} upload(s)/s of {args.upload_sizes}")
+        print("=" * 60)
+        recorder, stop, queue_samples = Recorder(), threading.Event(), []
+        threads = [threading.Thread(target=webcam_session, daemon=True,
+                                    args=(base_url, i, frame, args.fps, args.preset, stop, recorder, args.timeout))
+                   for i in range(args.sessions)]
+        if args.upload_rate > 0:
+            threads.append(threading.Thread(target=upload_arrivals, daemon=True,
+                                            args=(base_url, images, filters, args.upload_rate,
+                                                  args.max_uploads_in_flight, stop, recorder, args.timeout)))
+        threads.append(threading.Thread(target=poll_queue, daemon=True, args=(base_url, stop, queue_samples)))
+
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        stop.wait(args.duration)
+        stop.set()
+        for thread in threads:
+            thread.join()  # in-flight requests finish, so their latencies count
+        elapsed = time.perf_counter() - start
+    finally:
+        if process is not None:
+            os.killpg(process.pid, signal.SIGTERM)
+            process.wait()
+
+    report = {'target': args.target, 'duration_s': round(elapsed, 1), 'endpoints': recorder.summary(elapsed)}
+    counters = recorder.counters
+    if args.sessions:
+        sent = counters.get('frames_sent', 0)
+        report['webcam'] = {
+            'target_fps': args.fps * args.sessions,
+            'achieved_fps': round(sent / elapsed, 2),
+            'frames_skipped': counters.get('frames_skipped', 0),
+        }
+    report['uploads_dropped_client_side'] = counters.get('uploads_dropped', 0)
+    if queue_samples:
+        queued = [sample[0] for sample in queue_samples]
+        running = [sample[1] for sample in queue_samples]
+        report['server_queue'] = {
+            'samples': len(queue_samples),
+            'queued_mean': round(sum(queued) / len(queued), 2),
+            'queued_max': max(queued),
+            'running_mean': round(sum(running) / len(running), 2),
+            'rejected_during_run': queue_samples[-1][2] - queue_samples[0][2],
+        }
+
+    for endpoint, entry in report['endpoints'].items():
+        latency = (f"p50 {entry['p50_ms']} ms  p90 {entry['p90_ms']} ms  p99 {entry['p99_ms']} ms"
+                   if 'p50_ms' in entry else "no successful requests")
+        print(f"📊 {endpoint:15} {entry['requests']:5} requests  {entry['ok_per_sec']:6.2f} ok/s  {latency}  "
+              f"errors {entry['error_rate']:.1%}  503 {entry['busy_503_rate']:.1%}")
+    if 'webcam' in report:
+        webcam = report['webcam']
+        print(f"🎥 webcam: {webcam['achieved_fps']} of {webcam['target_fps']:g} fps sent, "
+              f"{webcam['frames_skipped']} tick(s) skipped while a frame was in flight")
+    if 'server_queue' in report:
+        queue = report['server_queue']
+        print(f"📥 work pool: {queue['queued_mean']} queued on average (max {queue['queued_max']}), "
+              f"{queue['running_mean']} running")
+    if report['uploads_dropped_client_side']:
+        print(f"⚠️ {report['uploads_dropped_client_side']} upload(s) not sent: "
+              f"all {args.max_uploads_in_flight} client slots were busy")
+
+    if args.json_path:
+        with open(args.json_path, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"📄 Report written to {args.json_path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -4,15 +4,53 @@ Combined Flask app serving both frontend and backend for task-250703
 Serves frontend from static/ folder and provides API endpoints
 """
 import os
+import sys
 from flask import Flask, request, jsonify, send_file, send_from_directory
 from flask_cors import CORS
-from PIL import Image, ImageFilter
-import io
-import base64
+
+# Filters are shared with the standalone backend
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'backend'))
+import image_codecs
+import metrics
+import profiling
+import result_cache
+import startup
+import upload_guard
+import work_pool
+
+# Pillow and numpy come in with these; static files never need them, so they
+# are imported by the warm-up thread (or the first API request) instead
+image_filters = startup.lazy_import('image_filters')
+image_pipeline = startup.lazy_import('image_pipeline')
 
 # Create Flask app with static folder for frontend
 app = Flask(__name__, static_folder='static', static_url_path='')
-CORS(app)  # Enable CORS for all routes
+CORS(app, expose_headers=image_codecs.METADATA_HEADERS)  # Enable CORS for all routes
+
+# Request body, image file and pixel limits, checked before anything is decoded
+upload_guard.configure(app)
+
+# Per-route and per-stage timings, in-flight and queue gauges
+metrics.instrument(app, '/api/metrics')
+
+# Requests sent with X-Profile: <PROFILE_TOKEN> are stack-sampled; the slowest are kept at /api/profiles
+profiling.instrument(app, '/api')
+
+# Processed images, keyed by upload hash plus filter and codec parameters
+processed_cache = result_cache.from_environment()
+metrics.watch_cache(processed_cache)
+
+# Filtering runs here so a slow image never blocks the static files
+cpu_pool = work_pool.from_environment()
+metrics.watch_pool('cpu', cpu_pool)
+
+# Image libraries, pool threads and codecs warm up in the background; /api/readyz answers 503 until they have
+warmup = startup.Warmup()
+warmup.step('imports', lambda: (image_filters.FILTERS, image_pipeline.render))
+warmup.step('work_pool', cpu_pool.prestart)
+warmup.step('pipelines', lambda: image_pipeline.warm_up(cpu_pool))
+startup.instrument(app, warmup, '/api')
+warmup.start()
 
 # Serve static files (frontend)
 @app.route('/')
@@ -31,70 +69,50 @@ def serve_static(filename):
 def health_check():
     return jsonify({"status": "healthy", "message": "Image Processing API is running"})
 
+@app.route('/api/cache-stats', methods=['GET'])
+def cache_stats():
+    return jsonify({"success": True, "cache": processed_cache.stats(), "work_pool": cpu_pool.stats()})
+
+@app.route('/api/filters', methods=['GET'])
+def list_filters():
+    return jsonify({
+        "success": True,
+        "filters": [spec.describe() for spec in image_filters.FILTERS.values()]
+    })
+
 @app.route('/api/process-image', methods=['POST'])
 def process_image():
     try:
-        if 'image' not in request.files:
+        upload_guard.check_request_size(request)
+
+        if 'image' not in metrics.parse_form():
             return jsonify({"error": "No image file provided"}), 400
         
         file = request.files['image']
         if file.filename == '':
             return jsonify({"error": "No image file selected"}), 400
         
-        process_type = request.form.get('type', 'grayscale')
-        
-        image = Image.open(file.stream)
-        
-        if process_type == 'grayscale':
-            processed_image = image.convert('L')
-        elif process_type == 'blur':
-            processed_image = image.filter(ImageFilter.BLUR)
-        elif process_type == 'sharpen':
-            processed_image = image.filter(ImageFilter.SHARPEN)
-        elif process_type == 'edge':
-            processed_image = image.filter(ImageFilter.FIND_EDGES)
-        elif process_type == 'sepia':
-            # Convert to sepia tone
-            grayscale = image.convert('L')
-            sepia = Image.new('RGB', grayscale.size)
-            pixels = sepia.load()
-            gray_pixels = grayscale.load()
-
-            for i in range(grayscale.width):
-                for j in range(grayscale.height):
-                    gray = gray_pixels[i, j]
-                    # Sepia formula
-                    r = min(255, int(gray * 1.0))
-                    g = min(255, int(gray * 0.8))
-                    b = min(255, int(gray * 0.6))
-                    pixels[i, j] = (r, g, b)
-            processed_image = sepia
-        elif process_type == 'brightness':
-            # Increase brightness
-            from PIL import ImageEnhance
-            enhancer = ImageEnhance.Brightness(image)
-            processed_image = enhancer.enhance(1.3)
-        elif process_type == 'contrast':
-            # Increase contrast
-            from PIL import ImageEnhance
-            enhancer = ImageEnhance.Contrast(image)
-            processed_image = enhancer.enhance(1.2)
-        else:
-            # Default to grayscale
-            processed_image = image.convert('L')
-        
-        img_buffer = io.BytesIO()
-        processed_image.save(img_buffer, format='PNG')
-        img_buffer.seek(0)
-        
-        img_base64 = base64.b64encode(img_buffer.getvalue()).decode('utf-8')
-        
-        return jsonify({
-            "success": True,
-            "processed_image": f"data:image/png;base64,{img_base64}",
-            "process_type": process_type
-        })
+        return image_pipeline.process_request(request, processed_cache, cpu_pool)
         
+    except upload_guard.ERRORS as e:
+        return upload_guard.rejected_response(e)
+    except work_pool.PoolFull as e:
+        return work_pool.busy_response(e)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/process-batch', methods=['POST'])
+def process_batch():
+    try:
+        if 'images' not in metrics.parse_form() and 'archive' not in request.files:
+            return jsonify({"error": "No image files provided"}), 400
+
+        return image_pipeline.process_batch(request, processed_cache, cpu_pool)
+
+    except upload_guard.ERRORS as e:
+        return upload_guard.rejected_response(e)
+    except work_pool.PoolFull as e:
+        return work_pool.busy_response(e)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -0,0 +1,69 @@
+"""
+Shared fixtures for the test suite
+The backend modules import each other from backend/, as they do under
+gunicorn, and every test gets a face store and attendance log of its own in
+a temporary directory. Models warm up on first use instead of at import.
+"""
+import io
+import os
+import sys
+import tempfile
+
+import numpy as np
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [os.path.join(ROOT, 'backend'), ROOT]
+
+# Read when app.py is imported, so set before any test module imports it
+os.environ.setdefault('STARTUP_WARMUP', 'off')
+os.environ['FACE_STORE_DIR'] = tempfile.mkdtemp(prefix='face-store-')
+
+from PIL import Image  # noqa: E402
+
+
+def image_bytes(size=(64, 48), color=(200, 80, 40), fmt='PNG'):
+    buffer = io.BytesIO()
+    Image.new('RGB', size, color).save(buffer, fmt)
+    return buffer.getvalue()
+
+
+def unit_vectors(count, dim, seed=0):
+    vectors = np.random.RandomState(seed).randn(count, dim).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+@pytest.fixture(scope='session')
+def backend():
+    """The backend app module (backend/app.py)"""
+    import app
+    app.app.config['TESTING'] = True
+    return app
+
+
+@pytest.fixture
+def client(backend):
+    return backend.app.test_client()
+
+
+@pytest.fixture
+def face_store(backend, tmp_path, monkeypatch):
+    """An empty face store and gallery, used by the backend's routes for this test"""
+    import recognition
+    from face_store import FaceStore
+
+    store = FaceStore(str(tmp_path / 'faces'), backend.embedder_dim, backend.embedder_name, keep_crops=False)
+    monkeypatch.setattr(backend, 'face_store', store)
+    monkeypatch.setattr(backend, 'face_gallery', recognition.FaceGallery(store))
+    return store
+
+
+@pytest.fixture
+def attendance_log(backend, tmp_path, monkeypatch):
+    """An empty attendance log, used by the backend's routes for this test"""
+    import attendance
+
+    log = attendance.AttendanceLog(str(tmp_path / 'attendance.sqlite3'), flush_seconds=0.05)
+    monkeypatch.setattr(backend, 'attendance_log', log)
+    yield log
+    log.close()
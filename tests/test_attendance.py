@@ -0,0 +1,86 @@
+import time
+
+import pytest
+
+import attendance
+
+
+@pytest.fixture
+def workers(tmp_path):
+    """Two logs over one SQLite file, as two gunicorn workers see it"""
+    logs = [attendance.AttendanceLog(str(tmp_path / 'attendance.sqlite3'), window_seconds=300,
+                                     min_confidence=0.7, flush_seconds=0.2) for _ in range(2)]
+    yield logs
+    for log in logs:
+        log.close()
+
+
+def test_second_sighting_within_the_window_is_not_recorded(workers):
+    log, _ = workers
+    now = time.time()
+
+    assert log.record('ann', 0.9, now)
+    assert not log.record('ann', 0.95, now + 10)
+    assert log.record('ann', 0.9, now + 301)
+    log.flush()
+
+    assert log.count(name='ann') == 2
+
+
+def test_low_confidence_and_unknown_faces_are_not_recorded(workers):
+    log, _ = workers
+
+    assert not log.record('ann', 0.5)
+    assert not log.record(None, 0.99)
+    log.flush()
+
+    assert log.count() == 0
+
+
+def test_sighting_recorded_by_another_worker_is_not_recorded_again(workers):
+    first, second = workers
+    now = time.time()
+    assert first.record('ann', 0.9, now)
+    first.flush()
+
+    assert not second.record('ann', 0.9, now + 5)
+    second.flush()
+
+    assert second.count() == 1
+
+
+def test_workers_queueing_the_same_person_at_once_write_one_record(workers):
+    first, second = workers
+    now = time.time()
+
+    # Neither has written yet, so both pass their own check
+    assert first.record('ann', 0.9, now)
+    assert second.record('ann', 0.8, now + 1)
+    first.flush()
+    second.flush()
+
+    assert first.count(name='ann') == 1
+
+
+def test_restarted_worker_remembers_the_window(tmp_path, workers):
+    log, _ = workers
+    log.record('ann', 0.9)
+    log.flush()
+
+    restarted = attendance.AttendanceLog(str(tmp_path / 'attendance.sqlite3'), window_seconds=300)
+    try:
+        assert not restarted.record('ann', 0.9)
+    finally:
+        restarted.close()
+
+
+def test_attendance_route_lists_recorded_sightings(client, attendance_log):
+    attendance_log.record('ann', 0.91)
+    attendance_log.record('bob', 0.88)
+    attendance_log.flush()
+
+    response = client.get('/attendance?name=bob')
+
+    assert response.status_code == 200
+    assert response.json['total_records'] == 1
+    assert response.json['attendance'][0]['name'] == 'bob'
@@ -0,0 +1,52 @@
+import pytest
+
+import recognition
+from conftest import unit_vectors
+from face_store import FaceStore
+
+DIM = 32
+LOCATION = {'x': 0, 'y': 0, 'w': 10, 'h': 10}
+
+
+@pytest.fixture
+def workers(tmp_path):
+    """Two galleries over one store directory, as two gunicorn workers see it"""
+    directory = str(tmp_path / 'faces')
+    return [recognition.FaceGallery(FaceStore(directory, DIM, 'test', keep_crops=False)) for _ in range(2)]
+
+
+def test_registration_in_one_worker_is_matched_by_another(workers):
+    first, second = workers
+    vectors = unit_vectors(3, DIM)
+    first.add_many([(name, vector, LOCATION, None) for name, vector in zip(('ann', 'bob', 'cy'), vectors)])
+
+    assert [name for name, _ in second.match(vectors, threshold=0.9)] == ['ann', 'bob', 'cy']
+    assert len(second) == 3
+
+
+def test_deletion_in_one_worker_is_seen_by_another(workers):
+    first, second = workers
+    vectors = unit_vectors(2, DIM)
+    first.add_many([('ann', vectors[0], LOCATION, None), ('bob', vectors[1], LOCATION, None)])
+    assert second.match(vectors[:1], threshold=0.9)[0][0] == 'ann'
+
+    second.remove_name('ann')
+
+    assert first.match(vectors, threshold=0.9)[0][0] is None
+    assert first.match(vectors, threshold=0.9)[1][0] == 'bob'
+    assert first.names == ['bob']
+
+
+def test_a_new_worker_loads_faces_registered_before_it_started(tmp_path, workers):
+    first, _ = workers
+    vectors = unit_vectors(4, DIM)
+    first.add_many([(f'p{i}', vector, LOCATION, None) for i, vector in enumerate(vectors)])
+
+    late = recognition.FaceGallery(FaceStore(str(tmp_path / 'faces'), DIM, 'test', keep_crops=False))
+
+    assert [name for name, _ in late.match(vectors, threshold=0.9)] == ['p0', 'p1', 'p2', 'p3']
+
+
+def test_store_refuses_descriptors_from_another_embedder(tmp_path, workers):
+    with pytest.raises(RuntimeError):
+        FaceStore(str(tmp_path / 'faces'), DIM, 'other', keep_crops=False)
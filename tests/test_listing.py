@@ -0,0 +1,103 @@
+import json
+import time
+
+import pytest
+
+from conftest import unit_vectors
+
+LOCATION = {'x': 1, 'y': 2, 'w': 30, 'h': 30}
+
+
+@pytest.fixture
+def faces(backend, face_store):
+    names = [f'person-{i}' for i in range(7)]
+    vectors = unit_vectors(len(names), backend.embedder_dim)
+    face_store.add_many([(name, vector, LOCATION, None) for name, vector in zip(names, vectors)])
+    return names
+
+
+@pytest.fixture
+def sightings(attendance_log):
+    now = time.time()
+    names = [f'person-{i}' for i in range(5)]
+    for offset, name in enumerate(names):
+        attendance_log.record(name, 0.9, now + offset)
+    attendance_log.flush()
+    return names[::-1]  # newest first
+
+
+def pages(client, url, key):
+    """Every item of a listing, following next_cursor to the last page, and the number of pages"""
+    items, count, cursor = [], 0, None
+    while True:
+        response = client.get(url + (f'&cursor={cursor}' if cursor else ''))
+        assert response.status_code == 200
+        items += response.json[key]
+        count += 1
+        cursor = response.json['next_cursor']
+        if cursor is None:
+            return items, count
+
+
+def test_registered_faces_page_by_cursor(client, faces):
+    items, count = pages(client, '/registered-faces?limit=3', 'faces')
+
+    assert [face['name'] for face in items] == faces
+    assert count == 3
+
+
+def test_cursor_skips_faces_deleted_between_pages(client, faces, backend):
+    first = client.get('/registered-faces?limit=3').json
+    backend.face_gallery.remove_name('person-3')
+
+    second = client.get(f"/registered-faces?limit=3&cursor={first['next_cursor']}").json
+
+    assert [face['name'] for face in second['faces']] == ['person-4', 'person-5', 'person-6']
+    assert second['total_registered'] == 6
+
+
+def test_registered_faces_project_requested_fields(client, faces):
+    response = client.get('/registered-faces?fields=id,name&limit=2')
+
+    assert response.json['faces'] == [{'id': 0, 'name': 'person-0'}, {'id': 1, 'name': 'person-1'}]
+
+
+def test_attendance_pages_newest_first(client, sightings):
+    items, count = pages(client, '/attendance?limit=2', 'attendance')
+
+    assert [record['name'] for record in items] == sightings
+    assert count == 3
+
+
+def test_attendance_projects_requested_fields(client, sightings):
+    response = client.get('/attendance?fields=name&limit=2')
+
+    assert response.json['attendance'] == [{'name': name} for name in sightings[:2]]
+    assert response.json['total_records'] == 5
+
+
+def test_offset_still_works_and_hands_over_to_a_cursor(client, sightings):
+    response = client.get('/attendance?limit=2&offset=2').json
+    assert [record['name'] for record in response['attendance']] == sightings[2:4]
+
+    rest = client.get(f"/attendance?limit=2&cursor={response['next_cursor']}").json
+    assert [record['name'] for record in rest['attendance']] == sightings[4:]
+
+
+def test_ndjson_streams_one_record_per_line(client, faces):
+    response = client.get('/registered-faces?format=ndjson&fields=name')
+
+    assert response.mimetype == 'application/x-ndjson'
+    assert [json.loads(line) for line in response.data.splitlines()] == [{'name': name} for name in faces]
+
+
+@pytest.mark.parametrize('url', [
+    '/registered-faces?fields=name,password',
+    '/registered-faces?cursor=not-a-cursor',
+    '/attendance?cursor=MQ',
+])
+def test_bad_fields_and_cursors_are_rejected(client, face_store, attendance_log, url):
+    response = client.get(url)
+
+    assert response.status_code == 400
+    assert response.json['error']
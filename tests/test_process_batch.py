@@ -0,0 +1,107 @@
+import io
+import json
+import zipfile
+
+import pytest
+
+import result_cache
+from conftest import image_bytes
+
+
+@pytest.fixture(autouse=True)
+def cache(backend, monkeypatch):
+    monkeypatch.setattr(backend, 'processed_cache', result_cache.ResultCache(max_bytes=16 << 20))
+
+
+def multipart_parts(response):
+    """(headers, body) of every part of a multipart/mixed response"""
+    boundary = response.headers['Content-Type'].split('boundary=')[1].encode()
+    parts = []
+    for chunk in response.data.split(b'--' + boundary)[1:]:
+        if chunk.startswith(b'--'):
+            break
+        head, body = chunk.lstrip(b'\r\n').split(b'\r\n\r\n', 1)
+        headers = dict(line.decode().split(': ', 1) for line in head.split(b'\r\n'))
+        parts.append((headers, body[:int(headers['Content-Length'])]))
+    return sorted(parts, key=lambda part: int(part[0]['X-Batch-Index']))
+
+
+def zip_of(members, compression=zipfile.ZIP_DEFLATED):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', compression) as zf:
+        for name, data in members:
+            zf.writestr(name, data)
+    return buffer.getvalue()
+
+
+def corrupt_member(archive, name):
+    """The archive with the compressed bytes of one member scrambled"""
+    data = bytearray(archive)
+    with zipfile.ZipFile(io.BytesIO(archive)) as zf:
+        info = zf.getinfo(name)
+    start = info.header_offset + 30 + len(name) + len(info.extra) + 4
+    for i in range(start, start + min(32, info.compress_size - 8)):
+        data[i] ^= 0xFF
+    return bytes(data)
+
+
+def test_multipart_upload_streams_every_image_back(client):
+    response = client.post('/process-batch', data={
+        'images': [(io.BytesIO(image_bytes(color=color)), f'{name}.png')
+                   for name, color in (('a', (255, 0, 0)), ('b', (0, 255, 0)), ('c', (0, 0, 255)))],
+        'type': 'grayscale'})
+
+    assert response.status_code == 200
+    assert response.headers['X-Batch-Count'] == '3'
+    parts = multipart_parts(response)
+    assert [headers['Content-Disposition'] for headers, _ in parts] == [
+        f'attachment; filename="{name}.png"' for name in 'abc']
+    assert all(body.startswith(b'\x89PNG') for _, body in parts)
+
+
+def test_zip_archive_comes_back_as_a_zip(client):
+    archive = zip_of([('a.jpg', image_bytes(fmt='JPEG')), ('notes.txt', b'skipped'), ('dir/b.png', image_bytes())])
+
+    response = client.post('/process-batch', headers={'Accept': 'application/zip'},
+                           data={'archive': (io.BytesIO(archive), 'photos.zip'), 'type': 'grayscale'})
+
+    assert response.status_code == 200
+    assert response.headers['X-Batch-Count'] == '2'
+    with zipfile.ZipFile(io.BytesIO(response.data)) as zf:
+        assert sorted(name.split('_', 1)[1] for name in zf.namelist()) == ['a.png', 'b.png']
+
+
+def test_corrupt_archive_member_is_reported_and_the_rest_still_processed(client):
+    archive = zip_of([('a.jpg', image_bytes(fmt='JPEG')), ('b.jpg', image_bytes(size=(320, 240), fmt='JPEG')),
+                      ('c.jpg', image_bytes(fmt='JPEG'))])
+
+    response = client.post('/process-batch', data={
+        'archive': (io.BytesIO(corrupt_member(archive, 'b.jpg')), 'photos.zip'), 'type': 'grayscale'})
+
+    assert response.status_code == 200
+    parts = multipart_parts(response)
+    assert len(parts) == 3
+    error = json.loads(parts[1][1])
+    assert parts[1][0]['Content-Type'] == 'application/json'
+    assert error['reason'] == 'corrupt_archive_member' and error['filename'] == 'b.jpg'
+    assert parts[0][1].startswith(b'\x89PNG') and parts[2][1].startswith(b'\x89PNG')
+
+
+def test_archive_that_is_not_a_zip_is_a_bad_request(client):
+    response = client.post('/process-batch', data={'archive': (io.BytesIO(b'not a zip'), 'photos.zip')})
+
+    assert response.status_code == 400
+    assert response.json['reason'] == 'not_a_zip'
+
+
+def test_non_image_in_a_batch_is_an_error_part(client):
+    response = client.post('/process-batch', data={
+        'images': [(io.BytesIO(image_bytes()), 'a.png'), (io.BytesIO(b'plain text'), 'b.png')]})
+
+    parts = multipart_parts(response)
+    assert parts[0][1].startswith(b'\x89PNG')
+    assert json.loads(parts[1][1])['reason'] == 'not_an_image'
+
+
+def test_batch_without_images_is_a_bad_request(client):
+    assert client.post('/process-batch', data={'type': 'grayscale'}).status_code == 400
@@ -0,0 +1,60 @@
+import io
+
+import pytest
+
+import result_cache
+from conftest import image_bytes
+
+
+@pytest.fixture
+def cache(backend, monkeypatch):
+    processed = result_cache.ResultCache(max_bytes=16 << 20)
+    monkeypatch.setattr(backend, 'processed_cache', processed)
+    return processed
+
+
+def post_image(client, data, process_type='grayscale', **headers):
+    return client.post('/process-image', headers=headers,
+                       data={'image': (io.BytesIO(data), 'photo.png'), 'type': process_type})
+
+
+def test_processed_image_carries_an_etag(client, cache):
+    response = post_image(client, image_bytes())
+
+    assert response.status_code == 200
+    assert response.json['success'] and response.json['cache'] == 'miss'
+    assert response.headers['ETag']
+    assert 'Accept' in response.headers['Vary']
+
+
+def test_matching_etag_answers_304_without_processing(client, cache):
+    data = image_bytes()
+    etag = post_image(client, data).headers['ETag']
+
+    response = post_image(client, data, **{'If-None-Match': etag})
+
+    assert response.status_code == 304
+    assert response.data == b''
+    assert response.headers['ETag'] == etag
+    assert cache.stats()['not_modified'] == 1
+    assert cache.stats()['memory_hits'] == 0
+
+
+def test_etag_changes_with_the_filter_and_the_upload(client, cache):
+    data = image_bytes()
+    etag = post_image(client, data).headers['ETag']
+
+    assert post_image(client, data, 'sepia', **{'If-None-Match': etag}).status_code == 200
+    other = post_image(client, image_bytes(color=(10, 20, 30)), **{'If-None-Match': etag})
+    assert other.status_code == 200
+    assert other.headers['ETag'] != etag
+
+
+def test_repeat_upload_is_a_cache_hit(client, cache):
+    data = image_bytes()
+    post_image(client, data)
+
+    response = post_image(client, data)
+
+    assert response.json['cache'] == 'hit'
+    assert response.headers['X-Cache'] == 'HIT'
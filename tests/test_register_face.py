@@ -0,0 +1,66 @@
+import io
+
+import numpy as np
+import pytest
+
+from conftest import image_bytes, unit_vectors
+
+BOXES = np.array([[10, 20, 30, 30], [60, 22, 30, 30], [110, 18, 30, 30]])
+
+
+@pytest.fixture
+def three_faces(backend, monkeypatch):
+    """Detection finds three faces, left to right, whatever the photo holds"""
+    embeddings = unit_vectors(len(BOXES), backend.embedder_dim)
+
+    def embed_faces(image_data, preset, group=False):
+        if not group:
+            return object(), BOXES, [], []
+        return object(), BOXES, embeddings, [None] * len(BOXES)
+
+    monkeypatch.setattr(backend, '_embed_faces', embed_faces)
+    return embeddings
+
+
+def register(client, **form):
+    return client.post('/register-face', data=dict(form, image=(io.BytesIO(image_bytes()), 'group.png')))
+
+
+def test_group_photo_registers_every_named_face(client, face_store, three_faces):
+    response = register(client, group='1', names='ann, bob, cy')
+
+    assert response.status_code == 200
+    assert [face['name'] for face in response.json['faces']] == ['ann', 'bob', 'cy']
+    assert [face['location']['left'] for face in response.json['faces']] == [10, 60, 110]
+    assert response.json['total_registered'] == 3
+    assert face_store.names() == ['ann', 'bob', 'cy']
+
+
+def test_empty_name_skips_a_face(client, face_store, three_faces):
+    response = register(client, group='true', names='ann,,cy')
+
+    assert response.status_code == 200
+    faces = response.json['faces']
+    assert faces[1] == {'name': None, 'face_id': None, 'location': faces[1]['location']}
+    assert face_store.names() == ['ann', 'cy']
+
+
+def test_name_count_must_match_face_count(client, face_store, three_faces):
+    response = register(client, group='1', names='ann,bob')
+
+    assert response.status_code == 400
+    assert 'Found 3 faces but 2 names' in response.json['error']
+    assert len(response.json['faces']) == 3
+    assert face_store.count() == 0
+
+
+def test_group_mode_needs_names(client, face_store, three_faces):
+    assert register(client, group='1').status_code == 400
+
+
+def test_single_mode_refuses_a_photo_with_several_faces(client, face_store, three_faces):
+    response = register(client, name='ann')
+
+    assert response.status_code == 400
+    assert 'Multiple faces' in response.json['error']
+    assert face_store.count() == 0
@@ -0,0 +1,82 @@
+import io
+import struct
+import zlib
+
+import pytest
+
+import result_cache
+import upload_guard
+from conftest import image_bytes
+
+OVER_LIMIT = upload_guard.MAX_UPLOAD_BYTES + 1024
+
+
+@pytest.fixture(autouse=True)
+def cache(backend, monkeypatch):
+    monkeypatch.setattr(backend, 'processed_cache', result_cache.ResultCache(max_bytes=16 << 20))
+
+
+def png_header(width, height):
+    """A PNG that declares a size but holds no pixels, as a decompression bomb's header would"""
+    def chunk(kind, data):
+        return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data))
+    return (b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0))
+            + chunk(b'IDAT', zlib.compress(b'')) + chunk(b'IEND', b''))
+
+
+def multipart_body(data, boundary='testboundary'):
+    return (f'--{boundary}\r\nContent-Disposition: form-data; name="image"; filename="photo.png"\r\n'
+            f'Content-Type: image/png\r\n\r\n').encode() + data + f'\r\n--{boundary}--\r\n'.encode()
+
+
+@pytest.mark.parametrize('path', ['/process-image', '/detect-faces', '/register-face'])
+def test_declared_oversized_body_is_refused(client, path):
+    response = client.post(path, data={'image': (io.BytesIO(bytes(OVER_LIMIT)), 'photo.png'), 'name': 'ann'})
+
+    assert response.status_code == 413
+    assert response.json['reason'] == 'request_too_large'
+
+
+def test_chunked_body_is_cut_off_at_the_route_limit(client):
+    stream = io.BytesIO(multipart_body(bytes(OVER_LIMIT)))
+
+    response = client.post('/detect-faces', input_stream=stream,
+                           headers={'Content-Type': 'multipart/form-data; boundary=testboundary',
+                                    'Transfer-Encoding': 'chunked'},
+                           environ_overrides={'wsgi.input_terminated': True})
+
+    assert response.status_code == 413
+    assert response.json['reason'] == 'request_too_large'
+    assert str(upload_guard.MAX_UPLOAD_BYTES) in response.json['error']
+    assert stream.tell() <= upload_guard.MAX_UPLOAD_BYTES
+
+
+def test_non_image_upload_is_a_bad_request(client):
+    response = client.post('/process-image', data={'image': (io.BytesIO(b'%PDF-1.4 not an image'), 'photo.png')})
+
+    assert response.status_code == 400
+    assert response.json['reason'] == 'not_an_image'
+
+
+def test_image_with_too_many_pixels_is_refused_from_its_header(client):
+    response = client.post('/process-image', data={'image': (io.BytesIO(png_header(10000, 8000)), 'bomb.png')})
+
+    assert response.status_code == 413
+    assert response.json['reason'] == 'too_many_pixels'
+
+
+def test_image_within_limits_is_processed(client):
+    response = client.post('/process-image', data={'image': (io.BytesIO(image_bytes()), 'photo.png'),
+                                                   'type': 'grayscale'})
+
+    assert response.status_code == 200
+
+
+def test_file_is_read_no_further_than_its_limit():
+    upload = io.BytesIO(bytes(100))
+
+    with pytest.raises(upload_guard.UploadRejected) as raised:
+        upload_guard.read_upload(upload, limit=10)
+
+    assert raised.value.reason == 'file_too_large'
+    assert upload.tell() == 11
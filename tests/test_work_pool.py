@@ -0,0 +1,54 @@
+import io
+import threading
+
+import pytest
+
+import result_cache
+import work_pool
+from conftest import image_bytes
+
+
+@pytest.fixture
+def busy_pool():
+    """A one-thread pool with no queue, kept busy until the test ends"""
+    pool = work_pool.WorkPool(workers=1, queue_depth=0)
+    release = threading.Event()
+    pool.submit(release.wait)
+    yield pool
+    release.set()
+
+
+def test_saturated_pool_refuses_work(busy_pool):
+    with pytest.raises(work_pool.PoolFull) as raised:
+        busy_pool.submit(sum, [1, 2])
+
+    assert raised.value.retry_after >= 1
+    assert not busy_pool.has_capacity()
+    assert busy_pool.stats()['rejected'] == 1
+
+
+def test_blocking_submit_waits_for_a_slot():
+    pool = work_pool.WorkPool(workers=1, queue_depth=0)
+    release = threading.Event()
+    pool.submit(release.wait)
+    threading.Timer(0.05, release.set).start()
+
+    assert pool.submit(sum, [1, 2], block=True).result(timeout=5) == 3
+    assert pool.stats()['completed'] == 2
+
+
+@pytest.mark.parametrize('path, fields', [
+    ('/process-image', {'type': 'grayscale'}),
+    ('/process-batch', {'type': 'grayscale'}),
+    ('/detect-faces', {}),
+])
+def test_busy_server_answers_503_with_retry_after(backend, client, busy_pool, monkeypatch, path, fields):
+    monkeypatch.setattr(backend, 'cpu_pool', busy_pool)
+    monkeypatch.setattr(backend, 'processed_cache', result_cache.ResultCache(max_bytes=16 << 20))
+    files = {'images' if path == '/process-batch' else 'image': (io.BytesIO(image_bytes()), 'photo.png')}
+
+    response = client.post(path, data=dict(fields, **files))
+
+    assert response.status_code == 503
+    assert int(response.headers['Retry-After']) >= 1
+    assert response.json['retry_after'] == int(response.headers['Retry-After'])